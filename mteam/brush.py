@@ -62,6 +62,13 @@ class Config:
         self.MAX_UNFINISHED_DOWNLOADS: int = int(os.environ.get("MAX_UNFINISHED_DOWNLOADS", 50))
         self.API_REQUEST_DELAY_MIN: float = float(os.environ.get("API_REQUEST_DELAY_MIN", 1.5))
         self.API_REQUEST_DELAY_MAX: float = float(os.environ.get("API_REQUEST_DELAY_MAX", 3.5))
+        # 分享限制下推：与 tasks_cleanup.py 的荣退规则使用相同的环境变量，添加任务时直接写入 qBittorrent 分享限制
+        self.SHARE_LIMITS_ENABLED: bool = os.environ.get("SHARE_LIMITS_ENABLED", "True").lower() != 'false'
+        self.SHARE_LIMIT_ACTION: str = os.environ.get("SHARE_LIMIT_ACTION", "Stop")
+        self.RETIREMENT_MIN_RATIO: float = float(os.environ.get("RETIREMENT_MIN_RATIO", 5.0))
+        self.RETIREMENT_MIN_SEEDING_DAYS: int = int(os.environ.get("RETIREMENT_MIN_SEEDING_DAYS", 14))
+        self.FREELEECH_TAGS: List[str] = [tag.strip() for tag in os.environ.get(
+            "FREELEECH_TAGS", "freeleech,FL,FreeLeech").split(',') if tag.strip()]
         self.SEED_FREE_TIME_SECONDS: int = self.SEED_FREE_TIME_HOURS * 3600
         self.SEED_PUBLISH_BEFORE_SECONDS: int = self.SEED_PUBLISH_BEFORE_HOURS * 3600
         self.TZ_INFOS: Dict[str, pytz.BaseTzInfo] = {"CST": pytz.timezone("Asia/Shanghai")}
@@ -118,10 +125,43 @@ class Utils:
 
 
 class QBittorrentManager:
+    # share_limits_mode=MatchAll (分享率与做种时间都达到才生效) 自此 Web API 版本起可用
+    SHARE_LIMITS_MATCH_ALL_API_VERSION = (2, 16, 0)
+
     def __init__(self, config: Config):
         self.config = config
         self.client: Optional[Client] = None
+        self.share_limit_params: Dict[str, Any] = {}
         self._connect()
+        self._init_share_limit_params()
+
+    def _init_share_limit_params(self) -> None:
+        """
+        把荣退规则中的分享率和做种时间条件转换为添加任务时的分享限制参数，由 qBittorrent 自己在两者都达到时停止任务。
+        Freeleech 任务不参与荣退，qBittorrent 不支持 MatchAll 模式时也不设置 (无法表达“且”条件)。
+        """
+        if not self.config.SHARE_LIMITS_ENABLED or not self.client:
+            return
+        if any(tag in self.config.FREELEECH_TAGS for tag in self.config.QBIT_TAGS):
+            logger.info("ℹ️ 刷流任务带有 Freeleech 标签，不参与荣退，添加时不设置分享限制。")
+            return
+        try:
+            api_version = tuple(int(part) for part in str(self.client.app.web_api_version).lstrip('v').split('.'))
+        except (ValueError, APIError) as e:
+            logger.warning(f"⚠️ 无法解析 qBittorrent Web API 版本，添加时不设置分享限制: {e}")
+            return
+        if api_version < self.SHARE_LIMITS_MATCH_ALL_API_VERSION:
+            logger.info("ℹ️ 当前 qBittorrent 不支持 MatchAll 分享限制模式，添加时不设置分享限制。")
+            return
+        self.share_limit_params = {
+            'ratio_limit': self.config.RETIREMENT_MIN_RATIO,
+            'seeding_time_limit': int(self.config.RETIREMENT_MIN_SEEDING_DAYS * 24 * 60),
+            'inactive_seeding_time_limit': -1,
+            'share_limit_action': self.config.SHARE_LIMIT_ACTION,
+            'share_limits_mode': 'MatchAll',
+        }
+        logger.info(f"📐 添加任务时将设置分享限制: 分享率 {self.config.RETIREMENT_MIN_RATIO} 且做种 "
+                    f"{self.config.RETIREMENT_MIN_SEEDING_DAYS} 天 ({self.config.SHARE_LIMIT_ACTION})。")
 
     def _connect(self) -> None:
         logger.info(f"🔗 尝试连接到 qBittorrent: {self.config.QBIT_HOST}:{self.config.QBIT_PORT}")
@@ -205,6 +245,7 @@ class QBittorrentManager:
             'paused': False,
             'sequentialDownload': True,
             'firstLastPiecePrio': True,
+            **self.share_limit_params,
         }
         if rename_value: params['rename'] = rename_value
 
@@ -833,6 +874,8 @@ class TorrentProcessor:
                     "renamed_name_in_qb": rename_value,
                     "added_time": now_localized.isoformat(),
                     "size_bytes": api_torrent_size,
+                    "discount_end_time": details["discount_end_time"].isoformat()
+                    if details.get("discount_end_time") else None,
                     "status": "added_to_qb"
                 })
                 current_disk_space -= api_torrent_size
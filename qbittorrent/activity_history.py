@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+qBittorrent 任务活动历史
+
+为每个任务保存一个固定长度的环形缓冲区，记录每次采样时的 uploaded / downloaded 字节计数和做种者、下载者数量。
+数据以 NumPy 二维数组 (任务 × 采样) 存放并保存为 .npz 文件，而不是逐条 JSON 字典，
+使 `tasks_cleanup.py` 可以按列计算滚动窗口平均速率和 EWMA 速率，
+例如“近 45 分钟平均上传低于 10 KiB/s”，而不是只看某一次采样的瞬时速度。
+"""
+
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger("qb_smart_cleanup")
+
+SAMPLE_FIELDS = ("uploaded", "downloaded", "num_seeds", "num_leechs")
+RATE_FIELDS = ("uploaded", "downloaded")
+
+
+class ActivityHistory:
+    """
+    每个任务占一行，每行是容量为 capacity 的环形缓冲区；head 为下一次写入的位置，count 为已写入的采样数。
+    rate_ewma 保存 uploaded/downloaded 的 EWMA 速率 (字节/秒)，时间常数为 ewma_tau_seconds，采样间隔不均匀时也成立。
+    """
+
+    def __init__(self, capacity: int, ewma_tau_seconds: float):
+        self.capacity = capacity
+        self.ewma_tau_seconds = ewma_tau_seconds
+        self.hashes = []
+        self.row_of = {}
+        self.timestamps = np.zeros((0, capacity), dtype=np.float64)
+        self.samples = {field: np.zeros((0, capacity), dtype=np.int64) for field in SAMPLE_FIELDS}
+        self.rate_ewma = {field: np.zeros(0, dtype=np.float64) for field in RATE_FIELDS}
+        self.head = np.zeros(0, dtype=np.intp)
+        self.count = np.zeros(0, dtype=np.intp)
+
+    @classmethod
+    def load(cls, filepath: Path, capacity: int, ewma_tau_seconds: float) -> "ActivityHistory":
+        history = cls(capacity, ewma_tau_seconds)
+        if not filepath.exists():
+            return history
+        try:
+            with np.load(filepath, allow_pickle=False) as data:
+                if data["timestamps"].shape[1] != capacity:
+                    logger.warning(f"⚠️ 活动历史文件 {filepath} 的采样容量与配置不一致，将以空历史开始。")
+                    return history
+                history.hashes = [str(h) for h in data["hashes"]]
+                history.row_of = {h: i for i, h in enumerate(history.hashes)}
+                history.timestamps = data["timestamps"]
+                history.samples = {field: data[f"sample_{field}"] for field in SAMPLE_FIELDS}
+                history.rate_ewma = {field: data[f"ewma_{field}"] for field in RATE_FIELDS}
+                history.head = data["head"].astype(np.intp)
+                history.count = data["count"].astype(np.intp)
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"⚠️ 无法加载或解析活动历史文件 {filepath}: {e}。将以空历史开始。")
+            return cls(capacity, ewma_tau_seconds)
+        return history
+
+    def save(self, filepath: Path):
+        try:
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = filepath.with_name(filepath.name + ".tmp.npz")
+            np.savez_compressed(
+                tmp_path,
+                hashes=np.array(self.hashes, dtype=str),
+                timestamps=self.timestamps,
+                head=self.head,
+                count=self.count,
+                **{f"sample_{field}": values for field, values in self.samples.items()},
+                **{f"ewma_{field}": values for field, values in self.rate_ewma.items()},
+            )
+            os.replace(tmp_path, filepath)
+            logger.debug(f"💾 活动历史已保存至 {filepath} ({len(self.hashes)} 个任务)")
+        except OSError as e:
+            logger.error(f"💥 保存活动历史至 {filepath} 失败: {e}")
+
+    def _rows_for(self, hashes: list) -> np.ndarray:
+        new_hashes = [h for h in dict.fromkeys(hashes) if h not in self.row_of]
+        if new_hashes:
+            added = len(new_hashes)
+            for h in new_hashes:
+                self.row_of[h] = len(self.hashes)
+                self.hashes.append(h)
+            self.timestamps = np.vstack([self.timestamps, np.zeros((added, self.capacity))])
+            for field in SAMPLE_FIELDS:
+                self.samples[field] = np.vstack([self.samples[field],
+                                                 np.zeros((added, self.capacity), dtype=np.int64)])
+            for field in RATE_FIELDS:
+                self.rate_ewma[field] = np.concatenate([self.rate_ewma[field], np.zeros(added)])
+            self.head = np.concatenate([self.head, np.zeros(added, dtype=np.intp)])
+            self.count = np.concatenate([self.count, np.zeros(added, dtype=np.intp)])
+        return np.fromiter((self.row_of[h] for h in hashes), dtype=np.intp, count=len(hashes))
+
+    def lookup_rows(self, hashes: list) -> tuple[np.ndarray, np.ndarray]:
+        """只读地查找 hashes 对应的行号，返回 (行号, 是否有历史)；没有历史的任务行号为 0，需配合掩码使用。"""
+        rows = np.fromiter((self.row_of.get(h, -1) for h in hashes), dtype=np.intp, count=len(hashes))
+        known = rows >= 0
+        return np.where(known, rows, 0), known
+
+    def _latest_index(self, rows: np.ndarray) -> np.ndarray:
+        return (self.head[rows] - 1) % self.capacity
+
+    def record(self, hashes: list, values: dict, current_time_seconds: float, min_interval_seconds: float) -> np.ndarray:
+        """
+        为 hashes 中距上次采样已超过 min_interval_seconds 的任务写入一次采样，返回这些任务对应的行号 (全部任务)。
+        values 为 {字段: 与 hashes 对齐的数组}。
+        """
+        rows = self._rows_for(hashes)
+        if not len(rows):
+            return rows
+        has_sample = self.count[rows] > 0
+        latest_index = self._latest_index(rows)
+        last_timestamp = self.timestamps[rows, latest_index]
+        due = ~has_sample | (current_time_seconds - last_timestamp >= min_interval_seconds)
+        due_rows = rows[due]
+        if not len(due_rows):
+            return rows
+
+        # 更新 EWMA 速率：以距上次采样的时间差计算衰减系数，计数器回退 (如任务被重新添加) 时按无传输处理
+        previous = has_sample[due]
+        elapsed = np.where(previous, current_time_seconds - last_timestamp[due], 0.0)
+        alpha = np.where(elapsed > 0, 1 - np.exp(-elapsed / self.ewma_tau_seconds), 0.0)
+        for field in RATE_FIELDS:
+            new_values = np.asarray(values[field], dtype=np.int64)[due]
+            old_values = self.samples[field][due_rows, latest_index[due]]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                sample_rate = np.where(elapsed > 0, np.maximum(new_values - old_values, 0) / elapsed, 0.0)
+            self.rate_ewma[field][due_rows] = alpha * sample_rate + (1 - alpha) * self.rate_ewma[field][due_rows]
+
+        write_index = self.head[due_rows]
+        self.timestamps[due_rows, write_index] = current_time_seconds
+        for field in SAMPLE_FIELDS:
+            self.samples[field][due_rows, write_index] = np.asarray(values[field], dtype=np.int64)[due]
+        self.head[due_rows] = (write_index + 1) % self.capacity
+        self.count[due_rows] = np.minimum(self.count[due_rows] + 1, self.capacity)
+        return rows
+
+    def _window_base_index(self, rows: np.ndarray, window_seconds: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        返回每行用作窗口起点的采样下标，以及该行是否有可用的起点。
+        起点取窗口内最早的采样；窗口内只有最新一次采样时，退回到它的前一次采样。
+        """
+        row_range = np.arange(len(rows))
+        timestamps = self.timestamps[rows]
+        latest_index = self._latest_index(rows)
+        latest_timestamp = timestamps[row_range, latest_index]
+        written = np.arange(self.capacity)[None, :] < self.count[rows][:, None]
+        in_window = written & (timestamps >= (latest_timestamp - window_seconds)[:, None]) & \
+            (timestamps < latest_timestamp[:, None])
+        oldest_in_window = np.argmin(np.where(in_window, timestamps, np.inf), axis=1)
+        has_window_sample = in_window.any(axis=1)
+        previous_index = (self.head[rows] - 2) % self.capacity
+        base_index = np.where(has_window_sample, oldest_in_window, previous_index)
+        return base_index, has_window_sample | (self.count[rows] >= 2)
+
+    def rolling_rate(self, rows: np.ndarray, field: str, window_seconds: float) -> np.ndarray:
+        """最近 window_seconds 内 field 计数器的平均增长速率 (字节/秒)，历史不足两次采样时为 NaN。"""
+        latest_index = self._latest_index(rows)
+        base_index, available = self._window_base_index(rows, window_seconds)
+        span = self.timestamps[rows, latest_index] - self.timestamps[rows, base_index]
+        delta = np.maximum(self.samples[field][rows, latest_index] - self.samples[field][rows, base_index], 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(available & (span > 0), delta / span, np.nan)
+
+    def rolling_mean(self, rows: np.ndarray, field: str, window_seconds: float,
+                     end_times: np.ndarray | None = None) -> np.ndarray:
+        """
+        最近 window_seconds 内 field (如下载者数量) 各次采样的平均值，没有采样时为 NaN。
+        给出 end_times 时，窗口截止到每行各自的时间点 (不晚于最新采样)，之后的采样不计入。
+        """
+        timestamps = self.timestamps[rows]
+        end_timestamp = timestamps[np.arange(len(rows)), self._latest_index(rows)]
+        if end_times is not None:
+            end_timestamp = np.minimum(end_timestamp, end_times)
+        written = np.arange(self.capacity)[None, :] < self.count[rows][:, None]
+        in_window = written & (timestamps >= (end_timestamp - window_seconds)[:, None]) & \
+            (timestamps <= end_timestamp[:, None])
+        sample_count = in_window.sum(axis=1)
+        total = np.where(in_window, self.samples[field][rows], 0).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(sample_count > 0, total / sample_count, np.nan)
+
+    def history_seconds(self, rows: np.ndarray) -> np.ndarray:
+        """每行已有历史覆盖的时长 (秒)。"""
+        timestamps = self.timestamps[rows]
+        latest_timestamp = timestamps[np.arange(len(rows)), self._latest_index(rows)]
+        written = np.arange(self.capacity)[None, :] < self.count[rows][:, None]
+        oldest_timestamp = np.where(written, timestamps, np.inf).min(axis=1)
+        return np.where(self.count[rows] > 0, latest_timestamp - oldest_timestamp, 0.0)
+
+    def retain(self, keep_hashes: set):
+        """只保留 keep_hashes 中的任务，压缩掉已从 qBittorrent 消失的任务所占的行。"""
+        keep_rows = np.array([i for i, h in enumerate(self.hashes) if h in keep_hashes], dtype=np.intp)
+        if len(keep_rows) == len(self.hashes):
+            return
+        self.hashes = [self.hashes[i] for i in keep_rows]
+        self.row_of = {h: i for i, h in enumerate(self.hashes)}
+        self.timestamps = self.timestamps[keep_rows]
+        self.samples = {field: values[keep_rows] for field, values in self.samples.items()}
+        self.rate_ewma = {field: values[keep_rows] for field, values in self.rate_ewma.items()}
+        self.head = self.head[keep_rows]
+        self.count = self.count[keep_rows]
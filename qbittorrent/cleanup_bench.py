@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+清理逻辑基准测试与回放工具
+
+不在生产机器上冒险，也能衡量 `tasks_cleanup.py` 随任务数量增长的表现、以及改动是否改变了删除、分享限制设置与恢复做种的决定。
+
+子命令:
+    rules   [--count N]                              (不带子命令时的默认行为)
+        在 N 个合成任务上 (默认 50000) 测量规则编译、快照构建和规则匹配的耗时，并输出各规则命中数。
+    synth   --count N --output 快照文件 [--seed S]
+        生成一份包含 N 个任务 (建议 10k~100k)、状态分布接近真实刷流盒子的合成快照 (.json.gz)。
+    record  --output 快照文件
+        连接 qBittorrent (使用 tasks_cleanup 的 CONFIG / 环境变量)，把一次 torrents_info 的结果保存为快照。只读操作。
+    replay  快照文件 [--runs R] [--interval-minutes M] [--memory] [--save-decisions 文件] [--compare 文件]
+        用假客户端把快照按 M 分钟间隔回放 R 轮，完整执行分享限制下推、规则评估、恢复做种、Tracker 检查、
+        磁盘驱逐与删除队列，输出每轮耗时 (以及 --memory 时的 tracemalloc 峰值内存)。--save-decisions 保存每轮
+        实际执行的删除、分享限制设置与恢复做种，--compare 与之前保存的结果比对，有差异时以退出码 1 结束，
+        便于确认性能改动没有改变“谁被删除、谁被设置限制或恢复”。
+
+回放期间的所有状态文件都写在临时目录中，不会影响真实的监控数据。
+
+用法示例:
+    python qbittorrent/cleanup_bench.py synth --count 100000 --output /tmp/qb_100k.json.gz
+    python qbittorrent/cleanup_bench.py replay /tmp/qb_100k.json.gz --runs 8 --save-decisions /tmp/before.json
+    python qbittorrent/cleanup_bench.py replay /tmp/qb_100k.json.gz --runs 8 --compare /tmp/before.json
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+from qbittorrentapi import TorrentDictionary, TorrentInfoList, NotFound404Error
+
+import tasks_cleanup
+from activity_history import ActivityHistory
+from cleanup_rules import TorrentSnapshot, compile_rules, match_rules
+from tasks_cleanup import CLEANUP_RULES, CONFIG, get_torrent_type_and_freeleech
+
+# 合成快照的状态分布，大致参照一台以做种为主的刷流盒子
+SYNTHETIC_STATE_WEIGHTS = {
+    "stalledUP": 42, "uploading": 12, "pausedUP": 6, "queuedUP": 4, "forcedUP": 1,
+    "downloading": 9, "stalledDL": 9, "pausedDL": 4, "queuedDL": 3, "metaDL": 1,
+    "checkingUP": 1, "error": 1, "missingFiles": 1,
+}
+SYNTHETIC_CATEGORIES = {"刷流": 70, "电影": 8, "电视剧": 6, "音乐": 2, "": 10, "misc": 4}
+SYNTHETIC_TAGS = {"刷流": 50, "": 25, "刷流,FL": 12, "FL": 5, "personal": 4, "刷流,archive_manual": 4}
+SYNTHETIC_CAPTURED_AT = 1_750_000_000
+
+
+def make_synthetic_torrents(count: int, current_time_seconds: float, seed: int = 42) -> list:
+    rnd = random.Random(seed)
+    # 分享限制使用独立的随机数序列，不改变同一种子下其余字段的取值
+    limits_rnd = random.Random(seed + 1)
+    policy = tasks_cleanup.get_share_limit_policy(CONFIG)
+    states = rnd.choices(list(SYNTHETIC_STATE_WEIGHTS), weights=list(SYNTHETIC_STATE_WEIGHTS.values()), k=count)
+    categories = rnd.choices(list(SYNTHETIC_CATEGORIES), weights=list(SYNTHETIC_CATEGORIES.values()), k=count)
+    tags = rnd.choices(list(SYNTHETIC_TAGS), weights=list(SYNTHETIC_TAGS.values()), k=count)
+    torrents = []
+    for i in range(count):
+        state = states[i]
+        size = int(rnd.lognormvariate(23, 1.2))
+        progress = 1.0 if state.endswith("UP") else round(rnd.random() * 0.99, 4)
+        added_on = int(current_time_seconds - rnd.expovariate(1 / (20 * 86400)))
+        seeding_time = int(max(current_time_seconds - added_on - rnd.randint(600, 7200), 0)) if progress >= 1 else 0
+        uploading = state in ("uploading", "forcedUP")
+        downloading = state in ("downloading", "metaDL")
+        torrent = {
+            "hash": f"{rnd.getrandbits(160):040x}",
+            "name": f"[{100000 + i}] Synthetic.Torrent.{i}.1080p",
+            "state": state,
+            "category": categories[i],
+            "tags": tags[i],
+            "size": size,
+            "progress": progress,
+            "added_on": added_on,
+            "last_activity": int(current_time_seconds - rnd.expovariate(1 / (3 * 86400))),
+            "seeding_time": seeding_time,
+            "ratio": round(rnd.expovariate(1 / 1.5), 3),
+            "num_leechs": rnd.choice([0, 0, 0, 1, 1, 2, 3, 5, 8]),
+            "num_seeds": rnd.randint(0, 60),
+            "upspeed": rnd.choice([0, 0, 4096, 65536, 2 * 1024 ** 2]) if uploading else 0,
+            "dlspeed": rnd.choice([0, 8192, 5 * 1024 ** 2]) if downloading else 0,
+            "uploaded": int(size * rnd.expovariate(1 / 1.5)),
+            "downloaded": int(size * progress),
+            "save_path": "/downloads/brush",
+            "content_path": f"/downloads/brush/Synthetic.Torrent.{i}.1080p",
+        }
+        # 已完成的任务中约四成已下推荐退分享限制，少量为手动设置的限制，其余使用全局设置 (-2)。
+        # 已下推限制的暂停任务约一半模拟 qBittorrent 因达到限制而停止，供回放中的荣退与恢复做种使用
+        limits_roll = limits_rnd.random()
+        if progress >= 1 and limits_roll < 0.4:
+            torrent["ratio_limit"] = policy["ratio_limit"]
+            torrent["seeding_time_limit"] = policy["seeding_time_limit"]
+            if state == "pausedUP" and limits_rnd.random() < 0.5:
+                torrent["ratio"] = max(torrent["ratio"], round(policy["ratio_limit"] + limits_rnd.random(), 3))
+                torrent["seeding_time"] = max(seeding_time, policy["seeding_time_limit"] * 60 +
+                                              limits_rnd.randint(0, 86400))
+        elif progress >= 1 and limits_roll < 0.45:
+            torrent["ratio_limit"] = 2.0
+            torrent["seeding_time_limit"] = 1440
+        else:
+            torrent["ratio_limit"] = tasks_cleanup.SHARE_LIMIT_USE_GLOBAL
+            torrent["seeding_time_limit"] = tasks_cleanup.SHARE_LIMIT_USE_GLOBAL
+        # 少量任务模拟 Tracker 报告未注册或全部超时，供回放中的 Tracker 检查使用
+        tracker_roll = rnd.random()
+        if tracker_roll < 0.01:
+            torrent["_tracker"] = {"status": 4, "msg": "Unregistered torrent"}
+        elif tracker_roll < 0.03:
+            torrent["_tracker"] = {"status": 4, "msg": "Timed out"}
+        torrents.append(torrent)
+    return torrents
+
+
+def save_snapshot(filepath: Path, torrents: list, captured_at: float, free_space: int | None):
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(filepath, "wt", encoding="utf-8") as f:
+        json.dump({"captured_at": captured_at, "free_space_on_disk": free_space, "torrents": torrents}, f,
+                  ensure_ascii=False)
+    print(f"已保存快照 {filepath}: {len(torrents)} 个任务")
+
+
+def load_snapshot(filepath: Path) -> dict:
+    with gzip.open(filepath, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FakeQbClient:
+    """
+    回放用的假 qBittorrent 客户端，只实现 tasks_cleanup 用到的接口。
+    删除请求会真正从内存中的任务表移除任务，并在删除文件时增加剩余空间；设置分享限制和恢复做种会修改任务字段，
+    并记录在 share_limit_events 中供回放比对。任务的做种时间不会随回放推进，因此不会模拟 qBittorrent 自行停止任务。
+    """
+
+    WEB_API_VERSION = "2.16.0"
+
+    def __init__(self, torrents: list, free_space: int):
+        self.torrents = {t["hash"]: t for t in torrents}
+        self.free_space = free_space
+        self.api_calls = {}
+        self.share_limit_events = []
+        self.app = SimpleNamespace(web_api_version=self.WEB_API_VERSION)
+
+    def _count(self, name: str):
+        self.api_calls[name] = self.api_calls.get(name, 0) + 1
+
+    def torrents_info(self, **kwargs):
+        self._count("torrents_info")
+        return TorrentInfoList([{k: v for k, v in t.items() if not k.startswith("_")}
+                                for t in self.torrents.values()], client=self)
+
+    def torrents_delete(self, delete_files: bool = False, torrent_hashes=None, **kwargs):
+        self._count("torrents_delete")
+        hashes = [torrent_hashes] if isinstance(torrent_hashes, str) else list(torrent_hashes or [])
+        if not any(h in self.torrents for h in hashes):
+            raise NotFound404Error("torrents not found")
+        for torrent_hash in hashes:
+            torrent = self.torrents.pop(torrent_hash, None)
+            if torrent and delete_files:
+                self.free_space += int(torrent["size"] * torrent["progress"])
+
+    def torrents_trackers(self, torrent_hash=None, **kwargs):
+        self._count("torrents_trackers")
+        tracker = self.torrents.get(torrent_hash, {}).get("_tracker", {"status": 2, "msg": ""})
+        return [{"url": "** [DHT] **", "status": 2, "msg": ""},
+                {"url": "https://tracker.example/announce", **tracker}]
+
+    def torrents_set_share_limits(self, ratio_limit=None, seeding_time_limit=None, inactive_seeding_time_limit=None,
+                                  share_limit_action=None, share_limits_mode=None, torrent_hashes=None, **kwargs):
+        self._count("torrents_set_share_limits")
+        for torrent_hash in [torrent_hashes] if isinstance(torrent_hashes, str) else torrent_hashes or []:
+            torrent = self.torrents.get(torrent_hash)
+            if not torrent:
+                continue
+            torrent["ratio_limit"] = ratio_limit
+            torrent["seeding_time_limit"] = seeding_time_limit
+            self.share_limit_events.append({"hash": torrent_hash, "name": torrent["name"], "action_type": "设置分享限制",
+                                            "detail": f"分享率 {ratio_limit}，做种 {seeding_time_limit} 分钟，"
+                                                      f"{share_limit_action}"})
+
+    def torrents_start(self, torrent_hashes=None, **kwargs):
+        self._count("torrents_start")
+        for torrent_hash in [torrent_hashes] if isinstance(torrent_hashes, str) else torrent_hashes or []:
+            torrent = self.torrents.get(torrent_hash)
+            if not torrent:
+                continue
+            if torrent["state"] in ("pausedUP", "stoppedUP"):
+                torrent["state"] = "stalledUP"
+            elif torrent["state"] in ("pausedDL", "stoppedDL"):
+                torrent["state"] = "stalledDL"
+            self.share_limit_events.append({"hash": torrent_hash, "name": torrent["name"], "action_type": "恢复做种",
+                                            "detail": ""})
+
+    def torrents_reannounce(self, torrent_hashes=None, **kwargs):
+        self._count("torrents_reannounce")
+        for torrent_hash in torrent_hashes or []:
+            torrent = self.torrents.get(torrent_hash)
+            if torrent and torrent.get("_tracker", {}).get("msg") == "Timed out":
+                torrent["_tracker"] = {"status": 2, "msg": ""}
+
+
+def replay_snapshot(snapshot: dict, runs: int, interval_minutes: float, measure_memory: bool) -> tuple[list, list]:
+    """
+    把快照按固定间隔回放 runs 轮，返回 (每轮统计, 决定列表)。决定包括删除、分享限制设置与恢复做种。
+    时间从快照的 captured_at 开始推进，结果可复现。
+    """
+    free_space = snapshot.get("free_space_on_disk")
+    client = FakeQbClient([dict(t) for t in snapshot["torrents"]],
+                          free_space if free_space is not None else 10 * 1024 ** 4)
+    monitoring_data = {}
+    deletion_queue = tasks_cleanup.new_deletion_queue()
+    activity_history = ActivityHistory(CONFIG["ACTIVITY_HISTORY_SAMPLES"], CONFIG["ACTIVITY_EWMA_TAU_MINUTES"] * 60)
+    run_stats = []
+    decisions = []
+
+    for run_index in range(runs):
+        current_time_seconds = snapshot["captured_at"] + run_index * interval_minutes * 60
+        actions_this_run = tasks_cleanup.new_run_actions()
+        report_items = []
+        if measure_memory:
+            tracemalloc.start()
+        run_start_time = time.perf_counter()
+
+        torrents = client.torrents_info()
+        torrent_snapshot = tasks_cleanup.build_cleanup_snapshot(torrents, activity_history, current_time_seconds)
+        if CONFIG["SHARE_LIMITS_ENABLED"]:
+            tasks_cleanup.push_share_limits(client, torrent_snapshot, actions_this_run)
+        torrents_to_resume = tasks_cleanup.evaluate_torrents(torrent_snapshot, monitoring_data, deletion_queue,
+                                                             current_time_seconds, actions_this_run)
+        tasks_cleanup.resume_share_limited_torrents(client, torrents_to_resume, actions_this_run)
+        if CONFIG["TRACKER_CHECK_ENABLED"]:
+            tasks_cleanup.run_tracker_health_checks(client, torrents, monitoring_data, deletion_queue,
+                                                    current_time_seconds, actions_this_run)
+        tasks_cleanup.finish_cleanup_pass(client, torrent_snapshot, {t.hash for t in torrents}, monitoring_data,
+                                          deletion_queue, current_time_seconds, actions_this_run,
+                                          report_items, free_space=client.free_space)
+
+        elapsed = time.perf_counter() - run_start_time
+        peak_memory = None
+        if measure_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        run_stats.append({"run": run_index, "torrents": len(torrents), "seconds": elapsed,
+                          "peak_memory": peak_memory, "deleted": actions_this_run["deleted"],
+                          "deferred": actions_this_run["deferred"], "monitored": len(monitoring_data),
+                          "share_limits_set": actions_this_run["share_limits_set"],
+                          "share_limits_extended": actions_this_run["share_limits_extended"]})
+        decisions.extend({"run": run_index, "hash": item["hash"], "name": item["name"],
+                          "action_type": item["action_type"], "detail": item["detail"]}
+                         for item in report_items + client.share_limit_events)
+        client.share_limit_events.clear()
+    return run_stats, decisions
+
+
+def compare_decisions(previous: list, current: list) -> bool:
+    """比对两次回放的决定 (删除、分享限制设置与恢复做种)，只比较两边都回放过的轮次。"""
+    def key(decision):
+        return decision["run"], decision["hash"], decision["action_type"], decision["detail"]
+
+    common_runs = min(max((d["run"] for d in previous), default=-1), max((d["run"] for d in current), default=-1))
+    previous = [d for d in previous if d["run"] <= common_runs]
+    current = [d for d in current if d["run"] <= common_runs]
+
+    previous_keys = {key(d): d for d in previous}
+    current_keys = {key(d): d for d in current}
+    only_previous = sorted(set(previous_keys) - set(current_keys))
+    only_current = sorted(set(current_keys) - set(previous_keys))
+    if not only_previous and not only_current:
+        print(f"✅ 决定一致 ({len(current)} 条)。")
+        return True
+    print(f"❌ 决定不一致: 仅在旧结果中 {len(only_previous)} 条，仅在新结果中 {len(only_current)} 条。")
+    for label, keys, source in (("-", only_previous, previous_keys), ("+", only_current, current_keys)):
+        for k in keys[:20]:
+            d = source[k]
+            print(f"  {label} 第 {d['run']} 轮 {d['action_type']} ({d['detail']}): {d['name']} ({d['hash']})")
+        if len(keys) > 20:
+            print(f"  {label} ...还有 {len(keys) - 20} 条")
+    return False
+
+
+def command_rules(args):
+    current_time_seconds = time.time()
+    torrents = [TorrentDictionary(data=t, client=None)
+                for t in make_synthetic_torrents(args.count, current_time_seconds)]
+    print(f"合成任务数: {args.count}")
+
+    start = time.perf_counter()
+    compiled_rules = compile_rules(CLEANUP_RULES, CONFIG)
+    compile_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    snapshot = TorrentSnapshot(torrents, current_time_seconds, CONFIG)
+    snapshot_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    activity_history = ActivityHistory(CONFIG["ACTIVITY_HISTORY_SAMPLES"], CONFIG["ACTIVITY_EWMA_TAU_MINUTES"] * 60)
+    tasks_cleanup.add_activity_columns(snapshot, activity_history, current_time_seconds)
+    activity_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matched_rules = match_rules(compiled_rules, snapshot)
+    match_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for torrent in torrents:
+        get_torrent_type_and_freeleech(torrent, CONFIG)
+    legacy_elapsed = time.perf_counter() - start
+
+    print(f"规则编译:       {compile_elapsed * 1000:8.2f} ms")
+    print(f"构建快照:       {snapshot_elapsed * 1000:8.2f} ms")
+    print(f"活动历史列:     {activity_elapsed * 1000:8.2f} ms")
+    print(f"规则匹配:       {match_elapsed * 1000:8.2f} ms")
+    print(f"逐个分类 (对照): {legacy_elapsed * 1000:8.2f} ms")
+    print("\n各规则命中数:")
+    for rule_index, rule in enumerate(CLEANUP_RULES):
+        print(f"  {rule['name']:<20} {rule['action']:<18} {int((matched_rules == rule_index).sum()):>8}")
+    print(f"  {'(未命中)':<20} {'':<18} {int((matched_rules < 0).sum()):>8}")
+
+
+def command_synth(args):
+    torrents = make_synthetic_torrents(args.count, SYNTHETIC_CAPTURED_AT, seed=args.seed)
+    save_snapshot(Path(args.output), torrents, SYNTHETIC_CAPTURED_AT, args.free_gb * 1024 ** 3)
+
+
+def command_record(args):
+    tasks_cleanup.setup_logging()
+    qb = tasks_cleanup.connect_qbittorrent(CONFIG)
+    if not qb:
+        sys.exit(1)
+    captured_at = time.time()
+    torrents = [dict(t) for t in qb.torrents_info()]
+    save_snapshot(Path(args.output), torrents, captured_at, tasks_cleanup.get_free_disk_space(qb))
+
+
+def command_replay(args):
+    snapshot = load_snapshot(Path(args.snapshot))
+    with tempfile.TemporaryDirectory(prefix="cleanup_bench_") as state_dir:
+        # 回放只在内存中的假客户端上操作，状态文件全部写入临时目录
+        for key, filename in (("MONITOR_FILE_PATH", "monitor.json"), ("DELETE_QUEUE_FILE_PATH", "delete_queue.json"),
+                              ("ACTIVITY_HISTORY_FILE_PATH", "activity_history.npz")):
+            CONFIG[key] = Path(state_dir) / filename
+        CONFIG["DRY_RUN"] = False
+        logging.basicConfig(level=logging.WARNING)
+        tasks_cleanup.logger.setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+
+        run_stats, decisions = replay_snapshot(snapshot, args.runs, args.interval_minutes, args.memory)
+
+    print(f"快照任务数: {len(snapshot['torrents'])}，回放 {args.runs} 轮，间隔 {args.interval_minutes} 分钟")
+    for stats in run_stats:
+        memory_text = f"  峰值内存 {stats['peak_memory'] / 1024 ** 2:8.1f} MiB" if stats["peak_memory"] else ""
+        print(f"  第 {stats['run']:>2} 轮: {stats['torrents']:>7} 个任务  {stats['seconds'] * 1000:9.1f} ms{memory_text}"
+              f"  删除 {stats['deleted']:>4}  推迟 {stats['deferred']:>5}  监控中 {stats['monitored']:>6}"
+              f"  设置限制 {stats['share_limits_set']:>5}  恢复 {stats['share_limits_extended']:>4}")
+    total_seconds = sum(stats["seconds"] for stats in run_stats)
+    action_counts = {}
+    for decision in decisions:
+        action_counts[decision["action_type"]] = action_counts.get(decision["action_type"], 0) + 1
+    print(f"合计 {total_seconds:.2f} 秒，平均每轮 {total_seconds / max(len(run_stats), 1) * 1000:.1f} ms，共执行 "
+          + ("、".join(f"{action_type} {count} 个" for action_type, count in action_counts.items()) or "0 个动作"))
+
+    if args.save_decisions:
+        Path(args.save_decisions).write_text(json.dumps(decisions, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"决定已保存至 {args.save_decisions}")
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if not compare_decisions(previous, decisions):
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tasks_cleanup 基准测试与回放工具")
+    subparsers = parser.add_subparsers(dest="command")
+
+    rules_parser = subparsers.add_parser("rules", help="测量规则引擎在合成任务上的耗时")
+    rules_parser.add_argument("--count", type=int, default=50000)
+
+    synth_parser = subparsers.add_parser("synth", help="生成合成快照")
+    synth_parser.add_argument("--count", type=int, default=50000)
+    synth_parser.add_argument("--seed", type=int, default=42)
+    synth_parser.add_argument("--free-gb", type=float, default=500, help="快照中记录的剩余磁盘空间 (GB)")
+    synth_parser.add_argument("--output", required=True)
+
+    record_parser = subparsers.add_parser("record", help="从 qBittorrent 录制快照 (只读)")
+    record_parser.add_argument("--output", required=True)
+
+    replay_parser = subparsers.add_parser("replay", help="用假客户端回放快照")
+    replay_parser.add_argument("snapshot")
+    replay_parser.add_argument("--runs", type=int, default=6)
+    replay_parser.add_argument("--interval-minutes", type=float, default=15)
+    replay_parser.add_argument("--memory", action="store_true", help="用 tracemalloc 统计峰值内存 (会拖慢运行)")
+    replay_parser.add_argument("--save-decisions")
+    replay_parser.add_argument("--compare")
+    replay_parser.add_argument("--verbose", action="store_true")
+
+    args = parser.parse_args()
+    if args.command is None:
+        args = parser.parse_args(["rules"])
+    {"rules": command_rules, "synth": command_synth, "record": command_record,
+     "replay": command_replay}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+qBittorrent 清理规则引擎
+
+把声明式的清理规则编译为 NumPy 列运算，在一次快照上对全部任务同时求值，供 `tasks_cleanup.py` 使用。
+
+规则格式 (按顺序匹配，每个任务命中第一条满足全部条件的规则):
+    {"name": "规则名", "action": "动作", "when": [(列名, 运算符, 值), ...], ...其他字段原样保留}
+
+- 列名见 `TorrentSnapshot`：数值列 (ratio、num_leechs、seeding_days 等)、字符串列 (state、category、type)、
+  布尔列 (is_freeleech) 以及标签列 tags。
+- 运算符: 数值列支持 < <= > >= == !=；字符串列支持 == != in not_in；布尔列支持 == !=；
+  tags 支持 has_any / has_none。
+- 值以 "$" 开头时在编译时从配置字典中读取，例如 "$RETIREMENT_MIN_RATIO"，阈值因此仍集中在 CONFIG 中维护。
+"""
+
+import numpy as np
+
+NUMERIC_COLUMNS = ("ratio", "num_leechs", "num_seeds", "num_incomplete", "upspeed", "dlspeed", "up_limit", "progress",
+                   "size", "uploaded", "downloaded", "added_on", "last_activity", "seeding_time", "ratio_limit",
+                   "seeding_time_limit")
+# 缺少该字段时的默认值 (其他数值列为 0)；分享限制 -2 表示“使用全局设置”
+NUMERIC_DEFAULTS = {"ratio_limit": -2, "seeding_time_limit": -2}
+STRING_COLUMNS = ("state", "category", "type")
+BOOL_COLUMNS = ("is_freeleech",)
+
+TYPE_UNCLASSIFIED = "unclassified"
+TYPE_BRUSHING = "brushing"
+TYPE_NON_BRUSHING = "non_brushing"
+
+_NUMERIC_OPS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+
+def parse_tags(tags: str | None) -> frozenset:
+    return frozenset(tag.strip() for tag in tags.split(',') if tag.strip()) if tags else frozenset()
+
+
+class StringColumn:
+    """以 (词表, 编码) 形式保存的字符串列，比较运算只在词表上做一次，再按编码展开到所有任务。"""
+
+    def __init__(self, values: list):
+        vocabulary, codes = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True) \
+            if values else (np.array([], dtype=str), np.array([], dtype=np.intp))
+        self.vocabulary = vocabulary
+        self.codes = codes
+
+    def isin(self, wanted) -> np.ndarray:
+        vocab_mask = np.isin(self.vocabulary, list(wanted))
+        return vocab_mask[self.codes] if len(self.codes) else np.zeros(0, dtype=bool)
+
+    def __getitem__(self, index):
+        return self.vocabulary[self.codes[index]]
+
+
+class TagColumn:
+    """标签列：每种不同的标签字符串只解析一次为集合，查询时先在这些集合上求值，再按编码展开。"""
+
+    def __init__(self, values: list):
+        self.strings = StringColumn([value or "" for value in values])
+        self.tag_sets = [parse_tags(tags) for tags in self.strings.vocabulary]
+
+    def has_any(self, wanted) -> np.ndarray:
+        wanted = set(wanted)
+        vocab_mask = np.fromiter((bool(tag_set & wanted) for tag_set in self.tag_sets), dtype=bool,
+                                 count=len(self.tag_sets))
+        return vocab_mask[self.strings.codes] if len(self.strings.codes) else np.zeros(0, dtype=bool)
+
+
+class TorrentSnapshot:
+    """
+    某一时刻全部任务的列式快照。torrents 中的元素只需支持 dict 的 get (TorrentDictionary 或普通 dict)。
+    除 qBittorrent 原始字段外，还提供派生列:
+    added_age_hours, seeding_days, last_activity_days (从未活动为 inf), type (刷流分类), is_freeleech。
+    """
+
+    def __init__(self, torrents, current_time_seconds: float, config_dict: dict):
+        self.torrents = list(torrents)
+        self.size = len(self.torrents)
+        self.hashes = [t.get("hash") for t in self.torrents]
+        count = self.size
+
+        self.numeric = {
+            column: np.fromiter((t.get(column, NUMERIC_DEFAULTS.get(column, 0)) or 0 for t in self.torrents),
+                                dtype=np.float64, count=count)
+            for column in NUMERIC_COLUMNS
+        }
+        self.numeric["added_age_hours"] = (current_time_seconds - self.numeric["added_on"]) / 3600
+        self.numeric["seeding_days"] = self.numeric["seeding_time"] / 86400
+        last_activity = self.numeric["last_activity"]
+        with np.errstate(invalid="ignore"):
+            self.numeric["last_activity_days"] = np.where(
+                last_activity > 0, (current_time_seconds - last_activity) / 86400, np.inf)
+
+        self.strings = {
+            "state": StringColumn([t.get("state") or "" for t in self.torrents]),
+            "category": StringColumn([t.get("category") or "" for t in self.torrents]),
+        }
+        self.tags = TagColumn([t.get("tags") for t in self.torrents])
+
+        category = self.strings["category"]
+        is_freeleech = self.tags.has_any(config_dict["FREELEECH_TAGS"])
+        # 分类优先级与 get_torrent_type_and_freeleech 一致: 非刷流分类/标签 > 刷流分类/标签 > 未分类的 Freeleech
+        non_brushing = category.isin(config_dict["NON_BRUSHING_CATEGORIES"]) | \
+            self.tags.has_any(config_dict["NON_BRUSHING_TAGS"])
+        brushing = ~non_brushing & (category.isin(config_dict["BRUSHING_CATEGORIES"]) |
+                                    self.tags.has_any(config_dict["BRUSHING_TAGS"]) | is_freeleech)
+        type_values = np.full(count, TYPE_UNCLASSIFIED, dtype=object)
+        type_values[brushing] = TYPE_BRUSHING
+        type_values[non_brushing] = TYPE_NON_BRUSHING
+        self.strings["type"] = StringColumn(list(type_values))
+        self.bools = {"is_freeleech": is_freeleech}
+
+    def add_column(self, name: str, values: np.ndarray):
+        """添加派生数值列 (如活动历史中的滚动速率)，之后规则即可引用该列。"""
+        self.numeric[name] = np.asarray(values, dtype=np.float64)
+
+    def column(self, name: str):
+        if name in self.numeric:
+            return self.numeric[name]
+        if name in self.strings:
+            return self.strings[name]
+        if name in self.bools:
+            return self.bools[name]
+        if name == "tags":
+            return self.tags
+        raise KeyError(f"未知的规则列: {name}")
+
+
+def _resolve_value(value, config_dict: dict):
+    if isinstance(value, str) and value.startswith("$"):
+        return config_dict[value[1:]]
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [_resolve_value(v, config_dict) for v in value]
+    return value
+
+
+def _compile_condition(condition: tuple, config_dict: dict):
+    column_name, op, raw_value = condition
+    value = _resolve_value(raw_value, config_dict)
+
+    if column_name == "tags":
+        if op == "has_any":
+            return lambda snapshot: snapshot.tags.has_any(value)
+        if op == "has_none":
+            return lambda snapshot: ~snapshot.tags.has_any(value)
+    elif column_name in STRING_COLUMNS:
+        if op in ("==", "in"):
+            wanted = value if op == "in" else [value]
+            return lambda snapshot: snapshot.strings[column_name].isin(wanted)
+        if op in ("!=", "not_in"):
+            unwanted = value if op == "not_in" else [value]
+            return lambda snapshot: ~snapshot.strings[column_name].isin(unwanted)
+    elif column_name in BOOL_COLUMNS:
+        if op in ("==", "!="):
+            expected = bool(value) if op == "==" else not bool(value)
+            return lambda snapshot: snapshot.bools[column_name] == expected
+    elif op in _NUMERIC_OPS:
+        ufunc = _NUMERIC_OPS[op]
+        threshold = float(value)
+        return lambda snapshot: ufunc(snapshot.column(column_name), threshold)
+
+    raise ValueError(f"规则条件无效: {condition}")
+
+
+def compile_rules(rules: list, config_dict: dict) -> list:
+    """把声明式规则编译为 (规则, [条件函数...]) 列表。配置错误会在编译时立即报出，而不是在运行中途。"""
+    return [(rule, [_compile_condition(condition, config_dict) for condition in rule.get("when", [])])
+            for rule in rules]
+
+
+def match_rules(compiled_rules: list, snapshot: TorrentSnapshot) -> np.ndarray:
+    """返回每个任务命中的第一条规则的下标，未命中任何规则为 -1。"""
+    matched = np.full(snapshot.size, -1, dtype=np.intp)
+    unmatched = np.ones(snapshot.size, dtype=bool)
+    for rule_index, (_, conditions) in enumerate(compiled_rules):
+        if not unmatched.any():
+            break
+        mask = unmatched.copy()
+        for condition in conditions:
+            mask &= condition(snapshot)
+            if not mask.any():
+                break
+        matched[mask] = rule_index
+        unmatched &= ~mask
+    return matched
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+qBittorrent 孤立文件扫描与空间回收
+
+手动删除的任务、删除到一半失败的任务等，会在刷流保存目录 (`QBIT_SAVE_PATH`) 中留下不再被任何任务引用的文件，
+`brush.py` 和 `tasks_cleanup.py` 都看不到它们。本脚本:
+
+1.  从一次 qBittorrent 快照中收集所有任务的 content_path (单文件任务为文件本身，多文件任务为其目录)。
+2.  用线程池并发 `os.scandir` 遍历保存目录：被任务引用的路径整体跳过、不再深入；
+    只有是某个 content_path 上级的目录才继续逐项检查；其余文件即为孤立文件。
+3.  把孤立文件逐行写入报告 (JSON Lines)，同时统计总大小、可回收大小 (硬链接数为 1 的文件) 和最大的若干文件。
+    遍历结果不会全部留在内存中，几十万个文件也只占用与目录宽度相关的内存。
+4.  删除分两步：`scan` 只生成报告 (演习)；`delete --confirm` 读取报告，重新获取一次快照，
+    只删除仍然孤立、且大小和修改时间与报告一致的文件，然后清理变空的目录。
+
+子命令:
+    scan    [--output 报告文件] [--all-save-paths]
+    delete  [--report 报告文件] [--confirm]
+
+未完成下载的 `.!qB` 后缀文件和 qBittorrent 的 `.<hash>.parts` 文件按其所属任务判断。
+修改时间在 ORPHAN_MIN_AGE_HOURS 小时以内的文件不会被视为孤立文件，避免误删刚添加、尚未出现在快照中的任务。
+脚本与 qBittorrent 不在同一文件系统视图下 (如 Docker) 时，用 ORPHAN_PATH_MAP 把 qBittorrent 中的路径映射为本地路径。
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+from tasks_cleanup import connect_qbittorrent, format_size
+
+CONFIG = {
+    "QBIT_HOST": os.environ.get('QBIT_HOST', 'http://localhost:8080'),
+    "QBIT_PORT": int(os.environ.get('QBIT_PORT', '8080')),
+    "QBIT_USERNAME": os.environ.get('QBIT_USERNAME', None),
+    "QBIT_PASSWORD": os.environ.get('QBIT_PASSWORD', None),
+    "QBIT_VERIFY_CERT": os.environ.get('QBIT_VERIFY_CERT', 'True').lower() != 'false',
+    "QBIT_REQUESTS_ARGS": {'timeout': (10, 60)},
+
+    "ORPHAN_SCAN_PATHS": [path.strip() for path in os.environ.get(
+        'ORPHAN_SCAN_PATHS', os.environ.get('QBIT_SAVE_PATH', "/vol1/1000/Media/MTBrush")).split(',') if path.strip()],
+    "ORPHAN_PATH_MAP": [tuple(item.split('=', 1)) for item in os.environ.get('ORPHAN_PATH_MAP', "").split(',')
+                        if '=' in item],
+    "ORPHAN_REPORT_FILE_PATH": Path(os.environ.get('ORPHAN_REPORT_FILE_PATH', "mteam/orphan_report.jsonl")),
+    "ORPHAN_MIN_AGE_HOURS": float(os.environ.get('ORPHAN_MIN_AGE_HOURS', '24')),
+    "ORPHAN_SCAN_WORKERS": int(os.environ.get('ORPHAN_SCAN_WORKERS', '8')),
+    "ORPHAN_IGNORE_NAMES": [name.strip() for name in os.environ.get(
+        'ORPHAN_IGNORE_NAMES', ".DS_Store,Thumbs.db,desktop.ini,@eaDir,#recycle,.Trash-1000,lost+found").split(',')
+                            if name.strip()],
+    "ORPHAN_REPORT_TOP_N": int(os.environ.get('ORPHAN_REPORT_TOP_N', '20')),
+
+    "DRY_RUN": os.environ.get('DRY_RUN', 'False').lower() == 'true',
+    "LOG_LEVEL": os.environ.get('LOG_LEVEL', 'INFO').upper(),
+}
+
+INCOMPLETE_SUFFIX = ".!qB"
+PARTS_FILE_PATTERN = re.compile(r"^\.([0-9a-fA-F]{40}|[0-9a-fA-F]{64})\.parts$")
+
+# 需要深入扫描的目录状态 (被任务引用的目录直接跳过)
+DIR_MIXED = "mixed"  # 是某个 content_path 的上级，需要逐项检查
+DIR_ORPHANED = "orphaned"  # 不被任何任务引用，其下所有文件都是孤立文件
+
+logger = logging.getLogger("qb_orphan_scanner")
+
+
+def setup_logging():
+    log_level_val = getattr(logging, CONFIG["LOG_LEVEL"], logging.INFO)
+    logging.basicConfig(
+        level=log_level_val,
+        format='%(asctime)s - %(levelname)s - %(name)s - [%(funcName)s] - %(message)s',
+        handlers=[logging.StreamHandler()]
+    )
+    logging.getLogger('qbittorrentapi').setLevel(logging.INFO if log_level_val <= logging.INFO else log_level_val)
+
+
+def map_path(path: str, path_map: list) -> str:
+    """按 ORPHAN_PATH_MAP 把 qBittorrent 中的路径前缀替换为本地路径，并规范化。"""
+    path = os.path.normpath(path)
+    for qbit_prefix, local_prefix in path_map:
+        qbit_prefix = os.path.normpath(qbit_prefix)
+        if path == qbit_prefix or path.startswith(qbit_prefix + os.sep):
+            return os.path.normpath(local_prefix + path[len(qbit_prefix):])
+    return path
+
+
+class ReferenceIndex:
+    """
+    一次 qBittorrent 快照中被任务引用的路径。
+    referenced 为所有 content_path；ancestors 为它们的所有上级目录 (到文件系统根为止)，
+    遍历时据此判断一个目录是整体跳过、逐项检查，还是整体孤立。
+    """
+
+    def __init__(self, torrents, path_map: list):
+        self.referenced = set()
+        self.ancestors = set()
+        self.hashes = set()
+        self.save_paths = set()
+        for torrent in torrents:
+            self.hashes.add(str(torrent.get("hash", "")).lower())
+            save_path = torrent.get("save_path")
+            if save_path:
+                self.save_paths.add(map_path(save_path, path_map))
+            content_path = torrent.get("content_path")
+            if not content_path:
+                continue
+            path = map_path(content_path, path_map)
+            self.referenced.add(path)
+            parent = os.path.dirname(path)
+            while parent not in self.ancestors:
+                self.ancestors.add(parent)
+                next_parent = os.path.dirname(parent)
+                if next_parent == parent:
+                    break
+                parent = next_parent
+
+    def is_referenced_file(self, path: str, name: str) -> bool:
+        if path in self.referenced:
+            return True
+        if name.endswith(INCOMPLETE_SUFFIX) and path[:-len(INCOMPLETE_SUFFIX)] in self.referenced:
+            return True
+        match = PARTS_FILE_PATTERN.match(name)
+        return bool(match) and match.group(1).lower() in self.hashes
+
+    def is_referenced_under(self, path: str, root: str) -> bool:
+        """path 本身或它在 root 以内的某个上级目录是否被任务引用 (用于删除前的复核)。"""
+        current = path
+        while True:
+            if current in self.referenced:
+                return True
+            if current == root:
+                return False
+            parent = os.path.dirname(current)
+            if parent == current:
+                return False
+            current = parent
+
+
+def fetch_reference_index(qb_client, path_map: list) -> ReferenceIndex:
+    torrents = qb_client.torrents_info()
+    index = ReferenceIndex(torrents, path_map)
+    logger.info(f"📋 快照中共有 {len(torrents)} 个任务，引用 {len(index.referenced)} 个内容路径。")
+    return index
+
+
+def _scan_directory(path: str, state: str, index: ReferenceIndex, ignore_names: frozenset,
+                    min_mtime: float) -> tuple[list, list, int]:
+    """
+    扫描单个目录 (在线程池中执行)。返回 (孤立文件 [(路径, 大小, 修改时间, 硬链接数)], 待深入的子目录 [(路径, 状态)],
+    因修改时间过新而跳过的文件数)。
+    """
+    orphans, subdirs, too_new = [], [], 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name in ignore_names:
+                    continue
+                entry_path = entry.path
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if state == DIR_ORPHANED:
+                            subdirs.append((entry_path, DIR_ORPHANED))
+                        elif entry_path in index.referenced:
+                            continue
+                        else:
+                            subdirs.append((entry_path, DIR_MIXED if entry_path in index.ancestors else DIR_ORPHANED))
+                        continue
+                    if state == DIR_MIXED and index.is_referenced_file(entry_path, entry.name):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError as e:
+                    logger.warning(f"⚠️ 无法读取 {entry_path}: {e}")
+                    continue
+                if stat.st_mtime > min_mtime:
+                    too_new += 1
+                    continue
+                orphans.append((entry_path, stat.st_size, stat.st_mtime, stat.st_nlink))
+    except OSError as e:
+        logger.warning(f"⚠️ 无法遍历目录 {path}: {e}")
+    return orphans, subdirs, too_new
+
+
+def iter_orphaned_files(roots: list, index: ReferenceIndex, config_dict: dict, stats: dict):
+    """
+    并发遍历 roots，逐个产出孤立文件 (路径, 大小, 修改时间, 硬链接数)。
+    目录扫描作为独立任务提交到线程池，某个目录完成后立即产出其结果并提交其子目录，内存中只保留尚未完成的目录。
+    """
+    ignore_names = frozenset(config_dict["ORPHAN_IGNORE_NAMES"])
+    min_mtime = time.time() - config_dict["ORPHAN_MIN_AGE_HOURS"] * 3600
+    with ThreadPoolExecutor(max_workers=max(1, config_dict["ORPHAN_SCAN_WORKERS"])) as executor:
+        pending = set()
+        for root in roots:
+            if root in index.referenced:
+                logger.warning(f"⚠️ 扫描目录 {root} 本身是某个任务的内容路径，已跳过。")
+                continue
+            pending.add(executor.submit(_scan_directory, root, DIR_MIXED, index, ignore_names, min_mtime))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                orphans, subdirs, too_new = future.result()
+                stats["directories"] += 1
+                stats["too_new"] += too_new
+                for subdir, state in subdirs:
+                    pending.add(executor.submit(_scan_directory, subdir, state, index, ignore_names, min_mtime))
+                yield from orphans
+
+
+def resolve_scan_roots(index: ReferenceIndex, config_dict: dict, all_save_paths: bool) -> list:
+    roots = [map_path(path, config_dict["ORPHAN_PATH_MAP"]) for path in config_dict["ORPHAN_SCAN_PATHS"]]
+    if all_save_paths:
+        roots.extend(index.save_paths)
+    # 去重，并去掉已被其他扫描目录包含的目录，避免重复扫描
+    unique_roots = []
+    for root in sorted(set(roots), key=len):
+        if not any(root == parent or root.startswith(parent + os.sep) for parent in unique_roots):
+            unique_roots.append(root)
+    existing_roots = []
+    for root in unique_roots:
+        if os.path.isdir(root):
+            existing_roots.append(root)
+        else:
+            logger.warning(f"⚠️ 扫描目录不存在或不可访问: {root}")
+    return existing_roots
+
+
+def run_scan(qb_client, config_dict: dict, report_path: Path, all_save_paths: bool) -> int:
+    start_time = time.monotonic()
+    index = fetch_reference_index(qb_client, config_dict["ORPHAN_PATH_MAP"])
+    roots = resolve_scan_roots(index, config_dict, all_save_paths)
+    if not roots:
+        logger.error("💥 没有可扫描的目录，请检查 ORPHAN_SCAN_PATHS / QBIT_SAVE_PATH / ORPHAN_PATH_MAP。")
+        return 1
+    logger.info(f"🔍 开始扫描 {len(roots)} 个目录: {', '.join(roots)}")
+
+    stats = {"directories": 0, "too_new": 0, "files": 0, "bytes": 0, "reclaimable_bytes": 0}
+    largest = []
+    top_n = config_dict["ORPHAN_REPORT_TOP_N"]
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = report_path.with_name(report_path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as report:
+        report.write(json.dumps({"scanned_at": time.time(), "roots": roots}, ensure_ascii=False) + "\n")
+        for path, size, mtime, nlink in iter_orphaned_files(roots, index, config_dict, stats):
+            report.write(json.dumps({"path": path, "size": size, "mtime": mtime, "nlink": nlink},
+                                    ensure_ascii=False) + "\n")
+            stats["files"] += 1
+            stats["bytes"] += size
+            if nlink <= 1:
+                stats["reclaimable_bytes"] += size
+            if top_n > 0:
+                if len(largest) < top_n:
+                    heapq.heappush(largest, (size, path))
+                elif size > largest[0][0]:
+                    heapq.heapreplace(largest, (size, path))
+    os.replace(tmp_path, report_path)
+
+    for size, path in sorted(largest, reverse=True):
+        logger.info(f"  🗂️ {format_size(size):>12}  {path}")
+    logger.info(
+        f"📊 扫描完成 (耗时 {time.monotonic() - start_time:.1f} 秒): 遍历 {stats['directories']} 个目录，"
+        f"发现 {stats['files']} 个孤立文件，共 {format_size(stats['bytes'])}，"
+        f"其中可回收 (无其他硬链接) {format_size(stats['reclaimable_bytes'])}；"
+        f"{stats['too_new']} 个文件修改时间过新，已跳过。")
+    logger.info(f"📝 报告已写入 {report_path}。确认无误后运行 `delete --confirm` 删除。")
+    return 0
+
+
+def _remove_empty_directories(directories: set, roots: list) -> int:
+    """自下而上删除因清理而变空的目录，直到扫描根目录为止 (根目录本身保留)。"""
+    removed = 0
+    for directory in sorted(directories, key=lambda d: d.count(os.sep), reverse=True):
+        current = directory
+        while current not in roots and any(current.startswith(root + os.sep) for root in roots):
+            try:
+                os.rmdir(current)
+                removed += 1
+            except OSError:
+                break
+            current = os.path.dirname(current)
+    return removed
+
+
+def run_delete(qb_client, config_dict: dict, report_path: Path, confirm: bool) -> int:
+    if not report_path.exists():
+        logger.error(f"💥 报告文件 {report_path} 不存在，请先运行 scan。")
+        return 1
+    dry_run = config_dict["DRY_RUN"] or not confirm
+    if dry_run:
+        logger.info("🧪 演习模式: 只列出将被删除的文件。确认删除请加 --confirm (且 DRY_RUN 不为 True)。")
+
+    # 删除前重新获取快照，报告生成之后才添加的任务引用的文件不会被删除
+    index = fetch_reference_index(qb_client, config_dict["ORPHAN_PATH_MAP"])
+    stats = {"deleted": 0, "bytes": 0, "reclaimed_bytes": 0, "skipped": 0, "failed": 0}
+    touched_directories = set()
+    with open(report_path, 'r', encoding='utf-8') as report:
+        header = json.loads(report.readline() or "{}")
+        roots = header.get("roots", [])
+        scanned_at = header.get("scanned_at")
+        if scanned_at:
+            logger.info(f"📄 报告生成于 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(scanned_at))}")
+        for line in report:
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            path = item["path"]
+            root = next((r for r in roots if path.startswith(r + os.sep)), None)
+            try:
+                stat = os.lstat(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"⚠️ 无法读取 {path}: {e}")
+                stats["failed"] += 1
+                continue
+            if root is None or stat.st_size != item["size"] or stat.st_mtime != item["mtime"] or \
+                    index.is_referenced_under(path, root) or \
+                    index.is_referenced_file(path, os.path.basename(path)):
+                logger.debug(f"⏭️ 文件已变化或已被任务引用，跳过: {path}")
+                stats["skipped"] += 1
+                continue
+            if dry_run:
+                logger.info(f"🧪 [演习] 将删除 {format_size(stat.st_size):>12}  {path}")
+            else:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.error(f"💥 删除 {path} 失败: {e}")
+                    stats["failed"] += 1
+                    continue
+                logger.debug(f"🗑️ 已删除 {path}")
+            stats["deleted"] += 1
+            stats["bytes"] += stat.st_size
+            if stat.st_nlink <= 1:
+                stats["reclaimed_bytes"] += stat.st_size
+            touched_directories.add(os.path.dirname(path))
+
+    removed_directories = _remove_empty_directories(touched_directories, roots) if not dry_run else 0
+    prefix = "🧪 [演习] 将" if dry_run else "✅ 已"
+    logger.info(
+        f"{prefix}删除 {stats['deleted']} 个孤立文件，共 {format_size(stats['bytes'])}，"
+        f"回收空间 {format_size(stats['reclaimed_bytes'])}；清理空目录 {removed_directories} 个；"
+        f"跳过 {stats['skipped']} 个已变化或重新被引用的文件，失败 {stats['failed']} 个。")
+    return 1 if stats["failed"] else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="扫描并回收 qBittorrent 保存目录中未被任何任务引用的孤立文件。")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    scan_parser = subparsers.add_parser("scan", help="扫描保存目录并生成孤立文件报告 (不删除任何文件)")
+    scan_parser.add_argument("--output", type=Path, default=CONFIG["ORPHAN_REPORT_FILE_PATH"])
+    scan_parser.add_argument("--all-save-paths", action="store_true",
+                             help="除 ORPHAN_SCAN_PATHS 外，同时扫描快照中所有任务的保存目录")
+    delete_parser = subparsers.add_parser("delete", help="按报告删除孤立文件 (默认演习)")
+    delete_parser.add_argument("--report", type=Path, default=CONFIG["ORPHAN_REPORT_FILE_PATH"])
+    delete_parser.add_argument("--confirm", action="store_true", help="真正删除文件")
+    args = parser.parse_args()
+
+    setup_logging()
+    qb = connect_qbittorrent(CONFIG)
+    if not qb:
+        return 1
+    if args.command == "scan":
+        return run_scan(qb, CONFIG, args.output, args.all_save_paths)
+    return run_delete(qb, CONFIG, args.report, args.confirm)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
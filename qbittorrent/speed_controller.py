@@ -0,0 +1,869 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+qBittorrent 闭环限速控制器
+
+取代原来的 speeds_set_download.py (按时段切换下载限速)、speeds_set_upload.py (随机上传限速)
+和 speeds_set_manual.py (手动固定限速) 三个 cron 脚本：常驻运行，只连接、登录一次。
+
+1.  目标速度来自声明式的时段表 (SPEED_SCHEDULE)：每个时段指定起止时间、可选的星期，以及上传/下载目标 (KiB/s，0 为不限速)，
+    按顺序匹配第一个包含当前时间的时段。可用环境变量 SPEED_SCHEDULE (JSON) 覆盖默认时段表。
+2.  每秒采样一次 `transfer_info`，对实际速率做 EWMA 平滑；每 SPEED_CONTROL_INTERVAL_SECONDS 秒用 AIMD 调整一次全局限速:
+    实际速率超过目标时按比例快速下调 (乘性减)；限速已成为瓶颈但实际速率仍低于目标时 (限速器开销、统计口径差异)
+    小步上调 (加性增，最高为目标的 SPEED_MAX_BOOST_RATIO 倍)；需求低于限速时逐步回落到目标值，避免突发流量冲过目标。
+3.  写入 `app_set_preferences` 有频率限制 (SPEED_WRITE_MIN_INTERVAL_SECONDS)，且值未变化或变化小于
+    SPEED_WRITE_MIN_CHANGE_RATIO 时跳过；时段切换时尽快写入。
+4.  按需分配上传 (UploadAllocator)：每 UPLOAD_ALLOC_INTERVAL_SECONDS 秒基于一次任务快照，把全局上传限速按
+    下载者需求 (已连接的下载者，加上按 UPLOAD_ALLOC_SWARM_LEECHER_WEIGHT 折算的整个种群的下载者) 和 Freeleech 状态
+    分配给活跃的刷流任务，作为各任务的上传限速；用不完份额的任务 (未触及自身限速) 只保留实际速率的 UPLOAD_ALLOC_HEADROOM 倍，
+    多出的份额继续分给其他任务 (注水算法)。限速值按 UPLOAD_ALLOC_BUCKET_RATIO 的等比档位向下取整，总和不超过预算，
+    按限速值分组、批量调用 torrents_set_upload_limit，且只修改限速发生变化的任务。退出时恢复这些任务为不限速。
+5.  Freeleech 截止时间加速 (DeadlineBooster)：从 brush.py 的数据文件 (DATA_FILE_PATH) 读取每个种子的优惠结束时间，
+    每 DEADLINE_INTERVAL_SECONDS 秒计算未完成的 Freeleech 任务在截止前 (留 DEADLINE_MARGIN_MINUTES 分钟余量) 下载完成所需的速率，
+    乘以 DEADLINE_SAFETY_FACTOR 后设为该任务的下载限速；有待完成的任务时，所需速率之和 (限制在 DEADLINE_MIN_DOWNLOAD_KIB 与
+    DEADLINE_MAX_DOWNLOAD_KIB 之间) 高于时段表的下载目标则提高下载目标，没有时沿用时段表。手动限速仍然优先。
+6.  月度流量预算 (traffic_budget.py，设置 TRAFFIC_MONTHLY_CAP_GB 后启用)：累计本计费周期的流量，
+    把剩余预算按剩余时间 (偏好时段加权) 分摊为允许速率，限制上传/下载目标，并预测按当前速率何时用尽；
+    `--traffic-report` 显示账本。手动限速不受预算限制。
+7.  内置调度器模式：`--program-scheduler` 把时段表编译为 qBittorrent 内置调度器的设置 (scheduler_enabled、
+    schedule_from_* / schedule_to_*、scheduler_days、alt_up_limit / alt_dl_limit 及常规限速)，一次 app_set_preferences 写入并回读校验；
+    已经一致时不写入，定期运行只用于检查偏差。该模式下限速由 qBittorrent 自己切换，无需常驻进程，
+    但没有闭环调节、上传分配等功能；时段表超出内置调度器的表达能力 (只有一个备用时段) 时报错。
+    常驻闭环控制启动时会关闭内置调度器，两种模式不会互相干扰。
+8.  手动限速：`--set-manual 上传KiB 下载KiB [--minutes M]` 写入覆盖文件，运行中的控制器在到期前以此为目标；
+    `--clear-manual` 清除。`--once` 按当前时段写入一次目标值后退出，兼容原来的 cron 用法。
+
+用法示例:
+    python qbittorrent/speed_controller.py                       # 常驻运行
+    python qbittorrent/speed_controller.py --once                # 按时段表设置一次后退出
+    python qbittorrent/speed_controller.py --set-manual 512 5120 --minutes 120
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pytz
+from qbittorrentapi import TorrentStates
+
+from cleanup_rules import TorrentSnapshot, TYPE_BRUSHING
+from tasks_cleanup import CONFIG as CLEANUP_CONFIG, connect_qbittorrent, format_size
+from traffic_budget import TrafficBudget
+
+CONFIG = {
+    **CLEANUP_CONFIG,
+
+    "QBIT_HOST": os.environ.get('QBIT_HOST', 'http://localhost:8080'),
+    "QBIT_PORT": int(os.environ.get('QBIT_PORT', '8080')),
+    "QBIT_USERNAME": os.environ.get('QBIT_USERNAME', None),
+    "QBIT_PASSWORD": os.environ.get('QBIT_PASSWORD', None),
+    "QBIT_VERIFY_CERT": os.environ.get('QBIT_VERIFY_CERT', 'True').lower() != 'false',
+    "QBIT_REQUESTS_ARGS": {'timeout': (5, 10)},
+
+    "SPEED_TIMEZONE": pytz.timezone(os.environ.get('SPEED_TIMEZONE', 'Asia/Shanghai')),
+    "SPEED_SAMPLE_INTERVAL_SECONDS": float(os.environ.get('SPEED_SAMPLE_INTERVAL_SECONDS', '1')),
+    "SPEED_CONTROL_INTERVAL_SECONDS": float(os.environ.get('SPEED_CONTROL_INTERVAL_SECONDS', '5')),
+    "SPEED_SMOOTHING_SECONDS": float(os.environ.get('SPEED_SMOOTHING_SECONDS', '10')),
+    "SPEED_AIMD_INCREASE_KIB": float(os.environ.get('SPEED_AIMD_INCREASE_KIB', '64')),
+    "SPEED_AIMD_INCREASE_RATIO": float(os.environ.get('SPEED_AIMD_INCREASE_RATIO', '0.02')),
+    "SPEED_AIMD_DECREASE_FACTOR": float(os.environ.get('SPEED_AIMD_DECREASE_FACTOR', '0.85')),
+    "SPEED_TOLERANCE": float(os.environ.get('SPEED_TOLERANCE', '0.05')),
+    "SPEED_SATURATION_RATIO": float(os.environ.get('SPEED_SATURATION_RATIO', '0.85')),
+    "SPEED_MAX_BOOST_RATIO": float(os.environ.get('SPEED_MAX_BOOST_RATIO', '1.5')),
+    "SPEED_MIN_LIMIT_KIB": float(os.environ.get('SPEED_MIN_LIMIT_KIB', '64')),
+    "SPEED_WRITE_MIN_INTERVAL_SECONDS": float(os.environ.get('SPEED_WRITE_MIN_INTERVAL_SECONDS', '10')),
+    "SPEED_WRITE_MIN_CHANGE_RATIO": float(os.environ.get('SPEED_WRITE_MIN_CHANGE_RATIO', '0.03')),
+    "SPEED_PREFS_RESYNC_MINUTES": float(os.environ.get('SPEED_PREFS_RESYNC_MINUTES', '10')),
+    "SPEED_OVERRIDE_FILE_PATH": Path(os.environ.get('SPEED_OVERRIDE_FILE_PATH', "mteam/speed_override.json")),
+    "SPEED_STATUS_LOG_MINUTES": float(os.environ.get('SPEED_STATUS_LOG_MINUTES', '10')),
+
+    "UPLOAD_ALLOC_ENABLED": os.environ.get('UPLOAD_ALLOC_ENABLED', 'True').lower() != 'false',
+    "UPLOAD_ALLOC_INTERVAL_SECONDS": float(os.environ.get('UPLOAD_ALLOC_INTERVAL_SECONDS', '60')),
+    "UPLOAD_ALLOC_BUDGET_RATIO": float(os.environ.get('UPLOAD_ALLOC_BUDGET_RATIO', '1.0')),
+    "UPLOAD_ALLOC_MIN_LIMIT_KIB": float(os.environ.get('UPLOAD_ALLOC_MIN_LIMIT_KIB', '16')),
+    "UPLOAD_ALLOC_SWARM_LEECHER_WEIGHT": float(os.environ.get('UPLOAD_ALLOC_SWARM_LEECHER_WEIGHT', '0.1')),
+    "UPLOAD_ALLOC_FREELEECH_BOOST": float(os.environ.get('UPLOAD_ALLOC_FREELEECH_BOOST', '1.5')),
+    "UPLOAD_ALLOC_HEADROOM": float(os.environ.get('UPLOAD_ALLOC_HEADROOM', '2.0')),
+    "UPLOAD_ALLOC_BUCKET_RATIO": float(os.environ.get('UPLOAD_ALLOC_BUCKET_RATIO', '1.25')),
+    "UPLOAD_ALLOC_BATCH_SIZE": int(os.environ.get('UPLOAD_ALLOC_BATCH_SIZE', '200')),
+
+    "DEADLINE_BOOST_ENABLED": os.environ.get('DEADLINE_BOOST_ENABLED', 'True').lower() != 'false',
+    "BRUSH_DATA_FILE_PATH": Path(os.environ.get('DATA_FILE_PATH', "mteam/brush_data.json")),
+    "DEADLINE_INTERVAL_SECONDS": float(os.environ.get('DEADLINE_INTERVAL_SECONDS', '60')),
+    "DEADLINE_MIN_DOWNLOAD_KIB": float(os.environ.get('DEADLINE_MIN_DOWNLOAD_KIB', '2048')),
+    "DEADLINE_MAX_DOWNLOAD_KIB": float(os.environ.get('DEADLINE_MAX_DOWNLOAD_KIB', str(40 * 1024))),
+    "DEADLINE_MIN_TORRENT_KIB": float(os.environ.get('DEADLINE_MIN_TORRENT_KIB', '256')),
+    "DEADLINE_SAFETY_FACTOR": float(os.environ.get('DEADLINE_SAFETY_FACTOR', '1.25')),
+    "DEADLINE_MARGIN_MINUTES": float(os.environ.get('DEADLINE_MARGIN_MINUTES', '30')),
+    "DEADLINE_BUCKET_RATIO": float(os.environ.get('DEADLINE_BUCKET_RATIO', '1.25')),
+    "DEADLINE_BATCH_SIZE": int(os.environ.get('DEADLINE_BATCH_SIZE', '200')),
+
+    "TRAFFIC_MONTHLY_CAP_GB": float(os.environ.get('TRAFFIC_MONTHLY_CAP_GB', '0')),
+    "TRAFFIC_COUNT_DIRECTIONS": os.environ.get('TRAFFIC_COUNT_DIRECTIONS', 'both').lower(),
+    "TRAFFIC_BILLING_DAY": int(os.environ.get('TRAFFIC_BILLING_DAY', '1')),
+    "TRAFFIC_RESERVE_RATIO": float(os.environ.get('TRAFFIC_RESERVE_RATIO', '0.05')),
+    "TRAFFIC_PREFERRED_HOURS": os.environ.get('TRAFFIC_PREFERRED_HOURS', '0-9'),
+    "TRAFFIC_PREFERRED_WEIGHT": float(os.environ.get('TRAFFIC_PREFERRED_WEIGHT', '3')),
+    "TRAFFIC_LEDGER_FILE_PATH": Path(os.environ.get('TRAFFIC_LEDGER_FILE_PATH', "mteam/traffic_ledger.json")),
+    "TRAFFIC_LEDGER_SAVE_SECONDS": float(os.environ.get('TRAFFIC_LEDGER_SAVE_SECONDS', '60')),
+
+    "DRY_RUN": os.environ.get('DRY_RUN', 'False').lower() == 'true',
+    "LOG_LEVEL": os.environ.get('LOG_LEVEL', 'INFO').upper(),
+}
+
+# 限速时段表，按顺序匹配第一个包含当前时间的时段。start/end 为 "HH:MM" (end 可为 "24:00"，start > end 表示跨午夜)，
+# days 可选，为星期几的列表 (0 = 周一)；upload_kib / download_kib 为目标速度 (KiB/s)，0 为不限速。
+DEFAULT_SPEED_SCHEDULE = [
+    {"name": "夜间高速", "start": "00:00", "end": "09:00", "upload_kib": 2048, "download_kib": 40 * 1024},
+    {"name": "白天", "start": "09:00", "end": "24:00", "upload_kib": 1536, "download_kib": 18 * 1024},
+]
+SPEED_SCHEDULE = json.loads(os.environ['SPEED_SCHEDULE']) if os.environ.get('SPEED_SCHEDULE') else \
+    DEFAULT_SPEED_SCHEDULE
+
+# 控制的方向: (名称, transfer_info 中的实际速率字段, 偏好设置中的限速字段, 时段表中的目标字段)
+DIRECTIONS = (
+    ("上传", "up_info_speed", "up_limit", "upload_kib"),
+    ("下载", "dl_info_speed", "dl_limit", "download_kib"),
+)
+
+# qBittorrent 内置调度器的 scheduler_days 取值: 0 每天, 1 工作日, 2 周末, 3..9 周一..周日
+NATIVE_SCHEDULER_DAYS = {None: 0, frozenset(range(5)): 1, frozenset({5, 6}): 2,
+                         **{frozenset({day}): 3 + day for day in range(7)}}
+# 内置调度器相关的偏好设置字段，用于校验和检查偏差
+NATIVE_SCHEDULER_KEYS = ("scheduler_enabled", "schedule_from_hour", "schedule_from_min", "schedule_to_hour",
+                         "schedule_to_min", "scheduler_days", "alt_up_limit", "alt_dl_limit", "up_limit", "dl_limit")
+
+# 参与上传分配的任务状态 (正在上传或可以上传的任务)
+UPLOAD_ALLOC_STATES = [TorrentStates.UPLOADING.value, TorrentStates.STALLED_UPLOAD.value,
+                       TorrentStates.FORCED_UPLOAD.value, TorrentStates.DOWNLOADING.value,
+                       TorrentStates.STALLED_DOWNLOAD.value, TorrentStates.FORCED_DOWNLOAD.value]
+# 任务的限速达到该比例即视为“触及限速”，说明它还能用掉更多份额
+UPLOAD_ALLOC_BINDING_RATIO = 0.8
+# 参与截止时间计算的任务状态 (正在或等待下载，不含已暂停/停止的任务)
+DEADLINE_STATES = {TorrentStates.DOWNLOADING.value, TorrentStates.STALLED_DOWNLOAD.value,
+                   TorrentStates.FORCED_DOWNLOAD.value, TorrentStates.METADATA_DOWNLOAD.value,
+                   TorrentStates.FORCED_METADATA_DOWNLOAD.value, TorrentStates.QUEUED_DOWNLOAD.value}
+# brush.py 重命名后的任务名以 "[M-Team 种子 ID]" 开头
+MTEAM_ID_PATTERN = re.compile(r'^\[(\d+)]')
+
+logger = logging.getLogger("qb_speed_controller")
+
+
+def setup_logging():
+    log_level_val = getattr(logging, CONFIG["LOG_LEVEL"], logging.INFO)
+    logging.basicConfig(
+        level=log_level_val,
+        format='%(asctime)s - %(levelname)s - %(name)s - [%(funcName)s] - %(message)s',
+        handlers=[logging.StreamHandler()]
+    )
+    logging.getLogger('qbittorrentapi').setLevel(logging.INFO if log_level_val <= logging.INFO else log_level_val)
+
+
+def _minute_of_day(hhmm: str) -> int:
+    hours, minutes = hhmm.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def compile_schedule(schedule: list) -> list:
+    """校验时段表并把时间转换为一天中的分钟数，配置错误在启动时即报出。"""
+    compiled = []
+    for window in schedule:
+        start, end = _minute_of_day(window["start"]), _minute_of_day(window["end"])
+        if not (0 <= start <= 1440 and 0 <= end <= 1440):
+            raise ValueError(f"限速时段时间无效: {window}")
+        compiled.append({**window, "start_minute": start, "end_minute": end,
+                         "days": set(window["days"]) if window.get("days") is not None else None})
+    return compiled
+
+
+def find_schedule_window(compiled_schedule: list, now: datetime) -> dict | None:
+    minute = now.hour * 60 + now.minute
+    for window in compiled_schedule:
+        start, end = window["start_minute"], window["end_minute"]
+        if start <= end:
+            in_window = start <= minute < end
+            weekday = now.weekday()
+        else:
+            in_window = minute >= start or minute < end
+            # 跨午夜时段的凌晨部分属于前一天开始的时段
+            weekday = now.weekday() if minute >= start else (now.weekday() - 1) % 7
+        if in_window and (window["days"] is None or weekday in window["days"]):
+            return window
+    return None
+
+
+def load_manual_override(filepath: Path, current_time_seconds: float) -> dict | None:
+    """读取手动限速覆盖，过期或不存在时返回 None。"""
+    if not filepath.exists():
+        return None
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            override = json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        logger.warning(f"⚠️ 无法读取手动限速文件 {filepath}: {e}")
+        return None
+    until = override.get("until")
+    if until is not None and until <= current_time_seconds:
+        return None
+    return override
+
+
+def save_manual_override(filepath: Path, upload_kib: float, download_kib: float, minutes: float | None):
+    override = {"name": "手动限速", "upload_kib": upload_kib, "download_kib": download_kib,
+                "until": time.time() + minutes * 60 if minutes else None}
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(override, f, indent=2, ensure_ascii=False)
+
+
+class AimdLimiter:
+    """
+    单个方向的 AIMD 限速调节器。target / limit 单位为字节/秒，target 为 0 表示不限速。
+    measured 为平滑后的实际速率。
+    """
+
+    def __init__(self, name: str, config_dict: dict):
+        self.name = name
+        self.increase = config_dict["SPEED_AIMD_INCREASE_KIB"] * 1024
+        self.increase_ratio = config_dict["SPEED_AIMD_INCREASE_RATIO"]
+        self.decrease_holdoff = config_dict["SPEED_SMOOTHING_SECONDS"]
+        self.last_decrease_time = float("-inf")
+        self.decrease_factor = config_dict["SPEED_AIMD_DECREASE_FACTOR"]
+        self.tolerance = config_dict["SPEED_TOLERANCE"]
+        self.saturation_ratio = config_dict["SPEED_SATURATION_RATIO"]
+        self.max_boost_ratio = config_dict["SPEED_MAX_BOOST_RATIO"]
+        self.min_limit = config_dict["SPEED_MIN_LIMIT_KIB"] * 1024
+        self.target = 0
+        self.limit = 0
+
+    def set_target(self, target: int):
+        if target != self.target:
+            self.target = target
+            self.limit = target
+
+    def update(self, measured: float, now: float) -> int:
+        if self.target <= 0:
+            self.limit = 0
+            return self.limit
+        if measured > self.target * (1 + self.tolerance):
+            # 平滑后的速率有滞后，一次下调后等待 decrease_holdoff 秒再判断，避免连续下调过头；
+            # 下调幅度按超出比例计算，但不小于 decrease_factor
+            if now - self.last_decrease_time >= self.decrease_holdoff:
+                self.limit = max(self.limit * max(self.decrease_factor, self.target / measured), self.min_limit)
+                self.last_decrease_time = now
+        elif measured >= self.limit * self.saturation_ratio and measured < self.target * (1 - self.tolerance):
+            self.limit = min(self.limit + max(self.increase, self.target * self.increase_ratio),
+                             self.target * self.max_boost_ratio)
+        elif measured < self.limit * self.saturation_ratio and self.limit != self.target:
+            # 需求低于限速：回到目标值，避免之前的上调在突发时冲过目标
+            self.limit = max(self.target, self.limit * self.decrease_factor) if self.limit > self.target \
+                else min(self.target, self.limit + max(self.increase, self.target * self.increase_ratio))
+        self.limit = int(self.limit)
+        return self.limit
+
+
+class PreferenceWriter:
+    """
+    合并、限频地写入 app_set_preferences：值未变化或变化很小时跳过。
+    force 时 (如时段切换) 忽略写入间隔和最小变化比例，只要值不同就立即写入。
+    """
+
+    def __init__(self, qb_client, config_dict: dict, current_prefs: dict):
+        self.qb_client = qb_client
+        self.min_interval = config_dict["SPEED_WRITE_MIN_INTERVAL_SECONDS"]
+        self.min_change_ratio = config_dict["SPEED_WRITE_MIN_CHANGE_RATIO"]
+        self.dry_run = config_dict["DRY_RUN"]
+        self.current = dict(current_prefs)
+        self.last_write_time = 0.0
+        self.writes = 0
+        self.skipped = 0
+
+    def _changed(self, key: str, value: int, force: bool) -> bool:
+        old = self.current.get(key)
+        if old == value:
+            return False
+        if force or not old or not value:
+            return True
+        return abs(value - old) / old >= self.min_change_ratio
+
+    def ready(self) -> bool:
+        return time.monotonic() - self.last_write_time >= self.min_interval
+
+    def write(self, prefs: dict, force: bool = False) -> bool:
+        if not force and not self.ready():
+            self.skipped += 1
+            return False
+        changed = {key: value for key, value in prefs.items() if self._changed(key, value, force)}
+        if not changed:
+            self.skipped += 1
+            return False
+        now = time.monotonic()
+        description = ", ".join(f"{key}={format_size(value)}/s" if value else f"{key}=不限速"
+                                for key, value in changed.items())
+        if self.dry_run:
+            logger.info(f"🧪 [演习] 将设置 {description}")
+        else:
+            try:
+                self.qb_client.app_set_preferences(prefs=changed)
+            except Exception as e:
+                logger.error(f"💥 设置限速失败 ({description}): {e}")
+                return False
+            logger.debug(f"⚙️ 已设置 {description}")
+        self.current.update(changed)
+        self.last_write_time = now
+        self.writes += 1
+        return True
+
+
+def allocate_upload_budget(weights: np.ndarray, caps: np.ndarray, budget: float, floor: float) -> np.ndarray:
+    """
+    注水算法：每个任务先得到 floor，剩余预算按 weights 比例分配；分到的份额超过 caps 的任务固定在 caps，
+    多出的部分在其余任务间重新按比例分配。所有任务都到达上限后仍有剩余时，按权重 (权重全为 0 时平均) 分给所有任务，
+    让它们有增长的余地。返回与 weights 对齐的限速 (字节/秒)。
+    """
+    count = len(weights)
+    if count == 0:
+        return np.zeros(0)
+    if budget <= floor * count:
+        return np.full(count, budget / count)
+    remaining = budget - floor * count
+    room = np.maximum(caps - floor, 0.0)
+    extra = np.zeros(count)
+    capped = weights <= 0
+    while remaining > 1 and not capped.all():
+        open_indexes = np.flatnonzero(~capped)
+        share = remaining * weights[open_indexes] / weights[open_indexes].sum()
+        available = room[open_indexes] - extra[open_indexes]
+        over = share >= available
+        if not over.any():
+            extra[open_indexes] += share
+            remaining = 0
+            break
+        extra[open_indexes[over]] += available[over]
+        remaining -= available[over].sum()
+        capped[open_indexes[over]] = True
+    if remaining > 1:
+        spread = weights if weights.sum() > 0 else np.ones(count)
+        extra += remaining * spread / spread.sum()
+    return floor + extra
+
+
+def quantize_limits(limits: np.ndarray, floor: float, ratio: float) -> np.ndarray:
+    """
+    把限速向下取整到 floor * ratio^n 的等比档位，使相同档位的任务可以用一次 API 调用设置。
+    低于 floor 的限速提高到 floor，其余结果不会超过原值。
+    """
+    limits = np.maximum(limits, floor)
+    steps = np.floor(np.log(limits / floor) / np.log(ratio))
+    # 对数的浮点误差可能让结果差一档，用取整后的档位值修正为不超过原值的最高档
+    steps = np.where((floor * ratio ** (steps + 1)).astype(np.int64) <= limits, steps + 1, steps)
+    steps = np.where(((floor * ratio ** steps).astype(np.int64) > limits) & (steps > 0), steps - 1, steps)
+    return (floor * ratio ** steps).astype(np.int64)
+
+
+class TorrentLimitApplier:
+    """
+    按任务设置限速的基类：记录由自己设置过限速的任务 (allocated)，按限速值分组批量调用 setter_name 对应的 API，
+    退出时把这些任务恢复为不限速。子类设置 direction (日志中的方向名称)、setter_name、interval_key 和 batch_size_key。
+    """
+    direction = ""
+    setter_name = ""
+    interval_key = ""
+    batch_size_key = ""
+
+    def __init__(self, qb_client, config_dict: dict):
+        self.qb_client = qb_client
+        self.config = config_dict
+        self.allocated = {}
+        self.last_run_time = float("-inf")
+
+    def due(self, now: float) -> bool:
+        return now - self.last_run_time >= self.config[self.interval_key]
+
+    def _release_stale(self, desired: dict, current_limits: dict):
+        """不再由本对象管理的任务 (已停止、已完成或已删除) 恢复为不限速。"""
+        for torrent_hash in list(self.allocated):
+            if torrent_hash not in desired:
+                if torrent_hash in current_limits:
+                    desired[torrent_hash] = 0
+                else:
+                    del self.allocated[torrent_hash]
+
+    def _apply(self, desired: dict, current_limits: dict) -> int:
+        """按限速值分组批量设置，只修改与当前限速不同的任务，返回调用 API 的次数。"""
+        groups = {}
+        for torrent_hash, limit in desired.items():
+            if max(current_limits.get(torrent_hash, 0), 0) != limit:
+                groups.setdefault(limit, []).append(torrent_hash)
+        calls = 0
+        batch_size = max(1, self.config[self.batch_size_key])
+        for limit, hashes in groups.items():
+            for start in range(0, len(hashes), batch_size):
+                batch = hashes[start:start + batch_size]
+                if self.config["DRY_RUN"]:
+                    logger.debug(f"🧪 [演习] 将为 {len(batch)} 个任务设置{self.direction}限速 "
+                                 f"{format_size(limit) + '/s' if limit else '不限'}")
+                else:
+                    try:
+                        getattr(self.qb_client, self.setter_name)(limit=limit, torrent_hashes=batch)
+                    except Exception as e:
+                        logger.error(f"💥 批量设置 {len(batch)} 个任务的{self.direction}限速失败: {e}")
+                        continue
+                calls += 1
+                for torrent_hash in batch:
+                    if limit:
+                        self.allocated[torrent_hash] = limit
+                    else:
+                        self.allocated.pop(torrent_hash, None)
+        return calls
+
+    def reset(self):
+        """把由本对象设置过限速的任务恢复为不限速。"""
+        if self.allocated:
+            logger.info(f"🧹 恢复 {len(self.allocated)} 个任务的{self.direction}限速为不限速。")
+            self._apply({torrent_hash: 0 for torrent_hash in self.allocated}, dict(self.allocated))
+
+
+class UploadAllocator(TorrentLimitApplier):
+    """把全局上传限速按下载者需求和 Freeleech 状态分配给活跃的刷流任务。"""
+    direction = "上传"
+    setter_name = "torrents_set_upload_limit"
+    interval_key = "UPLOAD_ALLOC_INTERVAL_SECONDS"
+    batch_size_key = "UPLOAD_ALLOC_BATCH_SIZE"
+
+    def __init__(self, qb_client, config_dict: dict):
+        super().__init__(qb_client, config_dict)
+        self.floor = config_dict["UPLOAD_ALLOC_MIN_LIMIT_KIB"] * 1024
+
+    def run(self, global_limit: int, now: float):
+        self.last_run_time = now
+        try:
+            torrents = self.qb_client.torrents_info()
+        except Exception as e:
+            logger.warning(f"⚠️ 获取任务列表失败，跳过本次上传分配: {e}")
+            return
+        snapshot = TorrentSnapshot(torrents, time.time(), self.config)
+        current_limits = dict(zip(snapshot.hashes, snapshot.numeric["up_limit"].astype(np.int64)))
+        desired = {}
+        budget = global_limit * self.config["UPLOAD_ALLOC_BUDGET_RATIO"]
+        active = snapshot.strings["type"].isin([TYPE_BRUSHING]) & snapshot.strings["state"].isin(UPLOAD_ALLOC_STATES)
+        indexes = np.flatnonzero(active) if budget > 0 else np.zeros(0, dtype=np.intp)
+
+        if len(indexes):
+            numeric = snapshot.numeric
+            weights = (numeric["num_leechs"][indexes] +
+                       self.config["UPLOAD_ALLOC_SWARM_LEECHER_WEIGHT"] * numeric["num_incomplete"][indexes])
+            weights = weights * np.where(snapshot.bools["is_freeleech"][indexes],
+                                         self.config["UPLOAD_ALLOC_FREELEECH_BOOST"], 1.0)
+            upspeed = numeric["upspeed"][indexes]
+            current = numeric["up_limit"][indexes]
+            binding = (current > 0) & (upspeed >= current * UPLOAD_ALLOC_BINDING_RATIO)
+            caps = np.where(binding, np.inf, np.maximum(upspeed * self.config["UPLOAD_ALLOC_HEADROOM"], self.floor * 4))
+            limits = allocate_upload_budget(weights, caps, budget, self.floor)
+            if budget >= self.floor * len(indexes):
+                limits = quantize_limits(limits, self.floor, self.config["UPLOAD_ALLOC_BUCKET_RATIO"])
+            else:
+                # 预算不足以给每个任务 floor 时平分预算，不再抬高到 floor，保证限速总和不超过预算
+                limits = np.maximum(np.floor(limits), 1).astype(np.int64)
+            desired = {snapshot.hashes[i]: int(limit) for i, limit in zip(indexes, limits)}
+
+        self._release_stale(desired, current_limits)
+        calls = self._apply(desired, current_limits)
+        logger.debug(f"📤 上传分配: {len(indexes)} 个活跃刷流任务分配 {format_size(budget)}/s，"
+                     f"API 调用 {calls} 次。")
+
+
+def load_freeleech_deadlines(filepath: Path) -> dict | None:
+    """
+    从 brush.py 的数据文件读取已添加种子的优惠结束时间，返回 {键: 结束时间戳}，键为 qBittorrent 中的任务名和 M-Team 种子 ID。
+    文件不存在或无法解析时返回 None。
+    """
+    if not filepath.exists():
+        return None
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        logger.warning(f"⚠️ 无法加载刷流数据文件 {filepath}: {e}")
+        return None
+    deadlines = {}
+    for record in records if isinstance(records, list) else []:
+        if not isinstance(record, dict) or record.get("status") != "added_to_qb" or not record.get("discount_end_time"):
+            continue
+        try:
+            end_time = datetime.fromisoformat(record["discount_end_time"]).timestamp()
+        except (TypeError, ValueError):
+            continue
+        deadlines[str(record["id"])] = end_time
+        if record.get("renamed_name_in_qb"):
+            deadlines[record["renamed_name_in_qb"]] = end_time
+    return deadlines
+
+
+class DeadlineBooster(TorrentLimitApplier):
+    """
+    按 Freeleech 截止时间计算下载限速：每个未完成且优惠未结束的任务需要 剩余字节 / (截止时间 - 余量) 的速率，
+    乘以 DEADLINE_SAFETY_FACTOR 后作为该任务的下载限速；有待完成的任务时，全局下载目标至少为各任务需求之和，
+    限制在 DEADLINE_MIN_DOWNLOAD_KIB 与 DEADLINE_MAX_DOWNLOAD_KIB 之间 (download_kib，没有时为 None)。
+    """
+    direction = "下载"
+    setter_name = "torrents_set_download_limit"
+    interval_key = "DEADLINE_INTERVAL_SECONDS"
+    batch_size_key = "DEADLINE_BATCH_SIZE"
+
+    def __init__(self, qb_client, config_dict: dict):
+        super().__init__(qb_client, config_dict)
+        self.download_kib = None
+        self.deadlines = None
+        self.deadlines_mtime = None
+
+    def _refresh_deadlines(self):
+        filepath = self.config["BRUSH_DATA_FILE_PATH"]
+        try:
+            mtime = filepath.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self.deadlines_mtime:
+            self.deadlines_mtime = mtime
+            self.deadlines = load_freeleech_deadlines(filepath)
+
+    def _deadline_of(self, torrent) -> float | None:
+        name = torrent.get("name") or ""
+        if name in self.deadlines:
+            return self.deadlines[name]
+        match = MTEAM_ID_PATTERN.match(name)
+        return self.deadlines.get(match.group(1)) if match else None
+
+    def run(self, now: float):
+        self.last_run_time = now
+        self._refresh_deadlines()
+        if self.deadlines is None:
+            # 没有刷流数据时不接管下载目标，沿用时段表
+            self.download_kib = None
+            return
+        try:
+            torrents = self.qb_client.torrents_info()
+        except Exception as e:
+            logger.warning(f"⚠️ 获取任务列表失败，跳过本次截止时间计算: {e}")
+            return
+
+        current_time = time.time()
+        margin = self.config["DEADLINE_MARGIN_MINUTES"] * 60
+        min_window = self.config["DEADLINE_INTERVAL_SECONDS"]
+        current_limits = {}
+        pending = []
+        for torrent in torrents:
+            current_limits[torrent.get("hash")] = int(torrent.get("dl_limit") or 0)
+            amount_left = torrent.get("amount_left") or 0
+            if amount_left <= 0 or torrent.get("state") not in DEADLINE_STATES:
+                continue
+            deadline = self._deadline_of(torrent)
+            if deadline is None or deadline <= current_time:
+                continue
+            pending.append((torrent.get("hash"), amount_left, max(deadline - margin - current_time, min_window)))
+
+        desired = {}
+        if pending:
+            amounts = np.array([amount for _, amount, _ in pending], dtype=np.float64)
+            windows = np.array([window for _, _, window in pending], dtype=np.float64)
+            required = amounts / windows * self.config["DEADLINE_SAFETY_FACTOR"]
+            total_kib = float(required.sum()) / 1024
+            floor = self.config["DEADLINE_MIN_TORRENT_KIB"] * 1024
+            ratio = self.config["DEADLINE_BUCKET_RATIO"]
+            # 向上取到下一档，保证任务限速不低于所需速率
+            limits = quantize_limits(np.maximum(required, floor) * ratio, floor, ratio)
+            desired = {torrent_hash: int(limit) for (torrent_hash, _, _), limit in zip(pending, limits)}
+            download_kib = min(max(total_kib, self.config["DEADLINE_MIN_DOWNLOAD_KIB"]),
+                               self.config["DEADLINE_MAX_DOWNLOAD_KIB"])
+            if self.download_kib is None or abs(download_kib - self.download_kib) > 0.1 * max(self.download_kib, 1):
+                logger.info(f"⏳ {len(pending)} 个 Freeleech 任务需在截止前下载完成，所需速率 "
+                            f"{format_size(total_kib * 1024)}/s，下载目标至少为 {format_size(download_kib * 1024)}/s。")
+            self.download_kib = download_kib
+        else:
+            if self.download_kib is not None:
+                logger.info("⏳ 没有需在截止前下载完成的 Freeleech 任务，下载目标恢复为时段表设置。")
+            self.download_kib = None
+        self._release_stale(desired, current_limits)
+        self._apply(desired, current_limits)
+
+
+def get_current_target(compiled_schedule: list, current_time_seconds: float,
+                       deadline_download_kib: float | None = None) -> dict:
+    """手动限速优先；否则按时段表，截止时间计算出的下载目标 (如有) 高于时段表的下载目标时取而代之 (0 为不限速，不会被降低)。"""
+    override = load_manual_override(CONFIG["SPEED_OVERRIDE_FILE_PATH"], current_time_seconds)
+    if override:
+        return override
+    now = datetime.fromtimestamp(current_time_seconds, CONFIG["SPEED_TIMEZONE"])
+    window = find_schedule_window(compiled_schedule, now) or {"name": "默认 (不限速)", "upload_kib": 0,
+                                                              "download_kib": 0}
+    schedule_download_kib = window.get("download_kib", 0)
+    if deadline_download_kib is not None and 0 < schedule_download_kib < deadline_download_kib:
+        window = {**window, "download_kib": deadline_download_kib}
+    return window
+
+
+def apply_once(qb_client, compiled_schedule: list):
+    """按当前时段 (或手动限速) 直接写入目标值一次，不做闭环调节。"""
+    target = get_current_target(compiled_schedule, time.time())
+    prefs = {pref_key: int(target.get(target_key, 0) * 1024) for _, _, pref_key, target_key in DIRECTIONS}
+    writer = PreferenceWriter(qb_client, CONFIG, qb_client.app_preferences())
+    writer.min_interval = 0
+    if writer.write(prefs, force=True):
+        logger.info(f"✅ 已按〔{target['name']}〕设置限速: 上传 {target.get('upload_kib', 0)} KiB/s, "
+                    f"下载 {target.get('download_kib', 0)} KiB/s (0 为不限速)")
+    else:
+        logger.info(f"ℹ️ 限速已符合〔{target['name']}〕，无需更改。")
+
+
+def weekly_schedule_targets(compiled_schedule: list) -> np.ndarray:
+    """按时段表求一周中每分钟的 (上传, 下载) 目标 (字节/秒)，形状为 (7 * 1440, 2)，从周一 00:00 开始。"""
+    monday = datetime(2024, 1, 1)
+    targets = np.zeros((7 * 1440, 2), dtype=np.int64)
+    for minute in range(7 * 1440):
+        window = find_schedule_window(compiled_schedule, monday + timedelta(minutes=minute)) or {}
+        targets[minute] = [int(window.get("upload_kib", 0) * 1024), int(window.get("download_kib", 0) * 1024)]
+    return targets
+
+
+def _native_minute(hour: int, minute: int) -> int:
+    # 内置调度器的时间不能写 24:00，用 23:59 表示到午夜为止
+    return 1440 if (hour, minute) == (23, 59) else hour * 60 + minute
+
+
+def weekly_native_targets(prefs: dict) -> np.ndarray:
+    """
+    按 qBittorrent 内置调度器 (BandwidthScheduler::isTimeForAlternative) 的规则求一周中每分钟生效的限速：
+    开始时间晚于结束时间时先交换两者并取反，即“结束到开始之间且星期匹配时为常规限速，其余时间都是备用限速”。
+    """
+    start = _native_minute(prefs["schedule_from_hour"], prefs["schedule_from_min"])
+    end = _native_minute(prefs["schedule_to_hour"], prefs["schedule_to_min"])
+    days_code = prefs["scheduler_days"]
+    minutes = np.arange(7 * 1440)
+    minute_of_day, weekday = minutes % 1440, minutes // 1440
+    day_match = {0: np.ones(len(minutes), dtype=bool), 1: weekday < 5, 2: weekday >= 5}.get(
+        days_code, weekday == days_code - 3)
+    if start <= end:
+        alternative = (minute_of_day >= start) & (minute_of_day < end) & day_match
+    else:
+        alternative = ~((minute_of_day >= end) & (minute_of_day < start) & day_match)
+    return np.stack([np.where(alternative, prefs["alt_up_limit"], prefs["up_limit"]),
+                     np.where(alternative, prefs["alt_dl_limit"], prefs["dl_limit"])], axis=1)
+
+
+def compile_native_scheduler(compiled_schedule: list) -> dict:
+    """
+    把时段表编译为 qBittorrent 内置调度器的偏好设置：依次尝试把每个时段作为“备用限速”时段，其余时间用常规限速，
+    逐分钟模拟一周，与时段表完全一致才采用。内置调度器只支持一个时段，无法表示时抛出 ValueError。
+    """
+    expected = weekly_schedule_targets(compiled_schedule)
+    for window in compiled_schedule:
+        days_code = NATIVE_SCHEDULER_DAYS.get(frozenset(window["days"]) if window["days"] is not None else None)
+        if days_code is None or window["start_minute"] == window["end_minute"]:
+            continue
+        alt_up, alt_dl = int(window.get("upload_kib", 0) * 1024), int(window.get("download_kib", 0) * 1024)
+        outside = ~np.all(expected == [alt_up, alt_dl], axis=1)
+        normal_up, normal_dl = (int(v) for v in expected[np.argmax(outside)]) if outside.any() else (alt_up, alt_dl)
+        start_minute, end_minute = window["start_minute"] % 1440, min(window["end_minute"], 1439)
+        prefs = {
+            "scheduler_enabled": True,
+            "schedule_from_hour": start_minute // 60, "schedule_from_min": start_minute % 60,
+            "schedule_to_hour": end_minute // 60, "schedule_to_min": end_minute % 60,
+            "scheduler_days": days_code,
+            "alt_up_limit": alt_up, "alt_dl_limit": alt_dl,
+            "up_limit": normal_up, "dl_limit": normal_dl,
+        }
+        if np.array_equal(weekly_native_targets(prefs), expected):
+            prefs["_alt_window_name"] = window["name"]
+            return prefs
+    raise ValueError("时段表无法用 qBittorrent 内置调度器表示 (内置调度器只支持一个备用限速时段，其余时间使用同一组常规限速)。")
+
+
+def program_native_scheduler(qb_client, compiled_schedule: list) -> bool:
+    """
+    把时段表写入 qBittorrent 内置调度器并校验。已经一致时只读取一次偏好设置、不写入，
+    因此定期运行只用于检查偏差。返回设置是否与时段表一致。
+    """
+    desired = compile_native_scheduler(compiled_schedule)
+    alt_window_name = desired.pop("_alt_window_name")
+    current = qb_client.app_preferences()
+    drift = {key: value for key, value in desired.items() if current.get(key) != value}
+    if not drift:
+        logger.info(f"✅ qBittorrent 内置调度器与时段表一致 (备用限速时段〔{alt_window_name}〕)，无需更改。")
+        return True
+    logger.info("🔧 内置调度器设置有偏差: " + ", ".join(f"{key} {current.get(key)} → {value}"
+                                                      for key, value in drift.items()))
+    if CONFIG["DRY_RUN"]:
+        logger.info("🧪 [演习] 将写入上述内置调度器设置。")
+        return False
+    qb_client.app_set_preferences(prefs=desired)
+    verified = qb_client.app_preferences()
+    mismatched = [key for key in NATIVE_SCHEDULER_KEYS if verified.get(key) != desired[key]]
+    if mismatched:
+        logger.error(f"💥 写入后校验失败，以下设置未生效: {', '.join(mismatched)}")
+        return False
+    logger.info(f"✅ 已把时段表写入 qBittorrent 内置调度器: 〔{alt_window_name}〕"
+                f"{desired['schedule_from_hour']:02d}:{desired['schedule_from_min']:02d}-"
+                f"{desired['schedule_to_hour']:02d}:{desired['schedule_to_min']:02d} 使用备用限速。")
+    return True
+
+
+def run_controller(qb_client, compiled_schedule: list, allocator: UploadAllocator | None,
+                   booster: DeadlineBooster | None, budget: TrafficBudget | None):
+    limiters = {pref_key: AimdLimiter(name, CONFIG) for name, _, pref_key, _ in DIRECTIONS}
+    current_prefs = qb_client.app_preferences()
+    if current_prefs.get("scheduler_enabled"):
+        # 内置调度器切换到备用限速后，闭环写入的常规限速不再生效
+        logger.warning("⚠️ qBittorrent 内置调度器已启用，闭环控制期间将其关闭。")
+        if not CONFIG["DRY_RUN"]:
+            qb_client.app_set_preferences(prefs={"scheduler_enabled": False})
+    writer = PreferenceWriter(qb_client, CONFIG, current_prefs)
+    smoothed = {}
+    active_window_name = None
+    last_sample_time = None
+    last_control_time = 0.0
+    last_resync_time = time.monotonic()
+    last_status_time = time.monotonic()
+    consecutive_errors = 0
+    logger.info(f"🎛️ 限速控制器已启动: 采样间隔 {CONFIG['SPEED_SAMPLE_INTERVAL_SECONDS']} 秒，"
+                f"调节间隔 {CONFIG['SPEED_CONTROL_INTERVAL_SECONDS']} 秒。")
+
+    while True:
+        tick_start = time.monotonic()
+        try:
+            transfer = qb_client.transfer_info()
+            consecutive_errors = 0
+        except Exception as e:
+            consecutive_errors += 1
+            logger.warning(f"⚠️ 获取 transfer_info 失败 ({consecutive_errors} 次): {e}")
+            time.sleep(min(CONFIG["SPEED_SAMPLE_INTERVAL_SECONDS"] * 2 ** consecutive_errors, 60))
+            last_sample_time = None
+            continue
+        if budget:
+            budget.record(transfer, time.time())
+
+        # 按实际时间间隔计算 EWMA 系数，采样偶尔延迟时平滑效果不变
+        elapsed = tick_start - last_sample_time if last_sample_time is not None else None
+        last_sample_time = tick_start
+        for _, info_key, pref_key, _ in DIRECTIONS:
+            measured = float(transfer.get(info_key) or 0)
+            if elapsed is None or pref_key not in smoothed:
+                smoothed[pref_key] = measured
+            else:
+                alpha = 1 - math.exp(-elapsed / CONFIG["SPEED_SMOOTHING_SECONDS"])
+                smoothed[pref_key] += alpha * (measured - smoothed[pref_key])
+
+        if tick_start - last_resync_time >= CONFIG["SPEED_PREFS_RESYNC_MINUTES"] * 60:
+            # 定期与 qBittorrent 中的实际设置同步，WebUI 中的手动修改会在下一次调节时被纠正
+            try:
+                prefs = qb_client.app_preferences()
+                writer.current.update({pref_key: prefs.get(pref_key) for _, _, pref_key, _ in DIRECTIONS})
+            except Exception as e:
+                logger.warning(f"⚠️ 同步偏好设置失败: {e}")
+            last_resync_time = tick_start
+
+        if booster and booster.due(tick_start):
+            booster.run(tick_start)
+
+        # 调节与写入同步进行：写入间隔未到时不调节，避免调节器在新限速尚未生效时连续累积调整
+        if tick_start - last_control_time >= CONFIG["SPEED_CONTROL_INTERVAL_SECONDS"]:
+            target = get_current_target(compiled_schedule, time.time(), booster.download_kib if booster else None)
+            if budget and target["name"] != "手动限速":
+                target = budget.limit_target(target, smoothed, time.time())
+            window_changed = target["name"] != active_window_name
+            if window_changed or writer.ready():
+                last_control_time = tick_start
+                if window_changed:
+                    logger.info(f"⏰ 进入限速时段〔{target['name']}〕: 上传目标 {target.get('upload_kib', 0)} KiB/s, "
+                                f"下载目标 {target.get('download_kib', 0)} KiB/s (0 为不限速)")
+                    active_window_name = target["name"]
+                new_prefs = {}
+                for _, _, pref_key, target_key in DIRECTIONS:
+                    limiter = limiters[pref_key]
+                    limiter.set_target(int(target.get(target_key, 0) * 1024))
+                    new_prefs[pref_key] = limiter.update(smoothed[pref_key], tick_start)
+                writer.write(new_prefs, force=window_changed)
+
+        if allocator and allocator.due(tick_start) and active_window_name is not None:
+            allocator.run(limiters["up_limit"].limit, tick_start)
+
+        if tick_start - last_status_time >= CONFIG["SPEED_STATUS_LOG_MINUTES"] * 60:
+            last_status_time = tick_start
+            logger.info("📈 " + "，".join(
+                f"{name}: 实际 {format_size(smoothed[pref_key])}/s, 限速 "
+                f"{format_size(limiters[pref_key].limit) + '/s' if limiters[pref_key].limit else '不限'}"
+                for name, _, pref_key, _ in DIRECTIONS) + f"；写入 {writer.writes} 次，跳过 {writer.skipped} 次。")
+
+        time.sleep(max(CONFIG["SPEED_SAMPLE_INTERVAL_SECONDS"] - (time.monotonic() - tick_start), 0))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="qBittorrent 闭环限速控制器")
+    parser.add_argument("--once", action="store_true", help="按当前时段设置一次限速后退出")
+    parser.add_argument("--set-manual", nargs=2, type=float, metavar=("UPLOAD_KIB", "DOWNLOAD_KIB"),
+                        help="设置手动限速 (KiB/s，0 为不限速)，运行中的控制器会以此为目标")
+    parser.add_argument("--minutes", type=float, default=None, help="手动限速的有效时长 (分钟)，默认一直有效")
+    parser.add_argument("--clear-manual", action="store_true", help="清除手动限速，恢复按时段表控制")
+    parser.add_argument("--program-scheduler", action="store_true",
+                        help="把时段表写入 qBittorrent 内置调度器 (已一致时只检查偏差) 后退出，不常驻运行")
+    parser.add_argument("--traffic-report", action="store_true", help="显示本计费周期的流量账本和预测后退出")
+    args = parser.parse_args()
+
+    setup_logging()
+    compiled_schedule = compile_schedule(SPEED_SCHEDULE)
+
+    if args.traffic_report:
+        if CONFIG["TRAFFIC_MONTHLY_CAP_GB"] <= 0:
+            logger.info("ℹ️ 未设置 TRAFFIC_MONTHLY_CAP_GB，流量预算未启用。")
+            return 0
+        print(TrafficBudget(CONFIG).report(time.time()))
+        return 0
+    if args.clear_manual:
+        CONFIG["SPEED_OVERRIDE_FILE_PATH"].unlink(missing_ok=True)
+        logger.info("🧹 已清除手动限速，恢复按时段表控制。")
+        return 0
+    if args.set_manual:
+        upload_kib, download_kib = args.set_manual
+        save_manual_override(CONFIG["SPEED_OVERRIDE_FILE_PATH"], upload_kib, download_kib, args.minutes)
+        logger.info(f"🛠️ 已设置手动限速: 上传 {upload_kib} KiB/s, 下载 {download_kib} KiB/s"
+                    f"{f'，{args.minutes} 分钟后失效' if args.minutes else ''}。")
+        args.once = True
+
+    qb = connect_qbittorrent(CONFIG)
+    if not qb:
+        return 1
+    if args.program_scheduler:
+        try:
+            return 0 if program_native_scheduler(qb, compiled_schedule) else 1
+        except ValueError as e:
+            logger.error(f"💥 {e}")
+            return 1
+    if args.once:
+        apply_once(qb, compiled_schedule)
+        return 0
+    allocator = UploadAllocator(qb, CONFIG) if CONFIG["UPLOAD_ALLOC_ENABLED"] else None
+    booster = DeadlineBooster(qb, CONFIG) if CONFIG["DEADLINE_BOOST_ENABLED"] else None
+    budget = TrafficBudget(CONFIG) if CONFIG["TRAFFIC_MONTHLY_CAP_GB"] > 0 else None
+    try:
+        run_controller(qb, compiled_schedule, allocator, booster, budget)
+    except KeyboardInterrupt:
+        logger.info("🛑 收到中断信号，限速控制器退出。")
+    finally:
+        for applier in (allocator, booster):
+            if applier:
+                applier.reset()
+        if budget:
+            budget.save()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+qBittorrent 带宽遥测记录器
+
+每秒采样一次全局上传/下载速率、全局限速和按分类汇总的速率，写入内存映射的固定大小环形文件，
+用实测数据 (而不是猜测) 调整 speed_controller.py 的时段表 SPEED_SCHEDULE 和各项限速参数。
+
+1.  采样只调用 `sync_maindata`：用 rid 增量同步，每秒只返回发生变化的任务字段，
+    本地维护 {hash: (分类, 上传速率, 下载速率)}，按分类求和；全局速率和限速取自同一次响应的 server_state。
+2.  秒级记录写入 `seconds.npy` (TELEMETRY_SECOND_RETENTION_HOURS 小时)，记录位置为 时间戳 % 容量，
+    不需要单独的写指针，进程崩溃或重启后直接续写；读取时按记录中的时间戳判断是否过期。
+3.  每分钟把该分钟的采样汇总 (平均值和最大值) 写入 `minutes.npy` (TELEMETRY_MINUTE_RETENTION_DAYS 天)，用于长周期查询。
+4.  两个文件均为带 dtype 头的 .npy 文件，通过 `np.lib.format.open_memmap` 映射，分类列表或容量与配置不一致时重新创建。
+
+用法示例:
+    python qbittorrent/speed_telemetry.py record                              # 常驻采样
+    python qbittorrent/speed_telemetry.py report --metric up --days 14        # 按小时统计上传速率百分位
+    python qbittorrent/speed_telemetry.py report --metric dl --category 刷流 --percentiles 50,90,99
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pytz
+
+from tasks_cleanup import CONFIG as CLEANUP_CONFIG, connect_qbittorrent
+
+CONFIG = {
+    **CLEANUP_CONFIG,
+
+    "QBIT_REQUESTS_ARGS": {'timeout': (5, 10)},
+
+    "TELEMETRY_DIR": Path(os.environ.get('TELEMETRY_DIR', "mteam/telemetry")),
+    "TELEMETRY_CATEGORIES": [cat.strip() for cat in os.environ.get(
+        'TELEMETRY_CATEGORIES', ','.join(CLEANUP_CONFIG["BRUSHING_CATEGORIES"] +
+                                         CLEANUP_CONFIG["NON_BRUSHING_CATEGORIES"])).split(',') if cat.strip()],
+    "TELEMETRY_SAMPLE_INTERVAL_SECONDS": float(os.environ.get('TELEMETRY_SAMPLE_INTERVAL_SECONDS', '1')),
+    "TELEMETRY_SECOND_RETENTION_HOURS": float(os.environ.get('TELEMETRY_SECOND_RETENTION_HOURS', '48')),
+    "TELEMETRY_MINUTE_RETENTION_DAYS": float(os.environ.get('TELEMETRY_MINUTE_RETENTION_DAYS', '56')),
+    "TELEMETRY_FLUSH_SECONDS": float(os.environ.get('TELEMETRY_FLUSH_SECONDS', '60')),
+    "TELEMETRY_TIMEZONE": pytz.timezone(os.environ.get('TELEMETRY_TIMEZONE', 'Asia/Shanghai')),
+}
+
+# 未列入 TELEMETRY_CATEGORIES 的分类 (含未分类任务) 汇总到这一列
+OTHER_CATEGORY = "(其他)"
+# 全局字段: 记录中的列名 -> server_state 中的字段
+GLOBAL_FIELDS = {"up": "up_info_speed", "dl": "dl_info_speed", "up_limit": "up_rate_limit", "dl_limit": "dl_rate_limit"}
+
+logger = logging.getLogger("qb_speed_telemetry")
+
+
+def setup_logging():
+    log_level_val = getattr(logging, CONFIG["LOG_LEVEL"], logging.INFO)
+    logging.basicConfig(
+        level=log_level_val,
+        format='%(asctime)s - %(levelname)s - %(name)s - [%(funcName)s] - %(message)s',
+        handlers=[logging.StreamHandler()]
+    )
+    logging.getLogger('qbittorrentapi').setLevel(logging.INFO if log_level_val <= logging.INFO else log_level_val)
+
+
+def second_dtype(category_count: int) -> np.dtype:
+    return np.dtype([("ts", "<u4"), *((field, "<f4") for field in GLOBAL_FIELDS),
+                     ("cat_up", "<f4", (category_count,)), ("cat_dl", "<f4", (category_count,))])
+
+
+def minute_dtype(category_count: int) -> np.dtype:
+    return np.dtype([("ts", "<u4"), ("samples", "<u2"), *((field, "<f4") for field in GLOBAL_FIELDS),
+                     ("up_max", "<f4"), ("dl_max", "<f4"),
+                     ("cat_up", "<f4", (category_count,)), ("cat_dl", "<f4", (category_count,))])
+
+
+class RingFile:
+    """
+    .npy 环形文件：slot = 时间戳 // resolution % capacity。categories 保存在同名 .json 中，
+    打开时 dtype、容量或分类列表与预期不一致则重新创建 (旧数据丢弃)。
+    """
+
+    def __init__(self, filepath: Path, dtype: np.dtype, capacity: int, resolution: int, categories: list,
+                 writable: bool):
+        self.filepath = filepath
+        self.resolution = resolution
+        self.categories = categories
+        meta_path = filepath.with_suffix(".json")
+        if writable:
+            self.data = self._open_for_write(filepath, meta_path, dtype, capacity)
+        else:
+            self.data = np.load(filepath, mmap_mode="r")
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                self.categories = json.load(f)["categories"]
+        self.capacity = len(self.data)
+
+    def _open_for_write(self, filepath: Path, meta_path: Path, dtype: np.dtype, capacity: int) -> np.memmap:
+        if filepath.exists():
+            try:
+                data = np.lib.format.open_memmap(filepath, mode="r+")
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    categories = json.load(f)["categories"]
+                if data.dtype == dtype and len(data) == capacity and categories == self.categories:
+                    return data
+                logger.warning(f"⚠️ 遥测文件 {filepath} 的格式、容量或分类与配置不一致，将重新创建。")
+                del data
+            except (OSError, ValueError, KeyError, json.JSONDecodeError) as e:
+                logger.warning(f"⚠️ 无法打开遥测文件 {filepath}: {e}。将重新创建。")
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        data = np.lib.format.open_memmap(filepath, mode="w+", dtype=dtype, shape=(capacity,))
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"categories": self.categories, "resolution": self.resolution}, f, ensure_ascii=False)
+        logger.info(f"🆕 已创建遥测文件 {filepath} ({capacity} 条记录, {data.nbytes / 1024 ** 2:.1f} MiB)")
+        return data
+
+    def write(self, record: dict, timestamp: int):
+        slot = self.data[timestamp // self.resolution % self.capacity]
+        for field, value in record.items():
+            slot[field] = value
+        slot["ts"] = timestamp
+
+    def valid_records(self, since: float) -> np.ndarray:
+        """返回时间戳不早于 since 的记录 (已按时间排序)。"""
+        records = self.data[self.data["ts"] >= max(since, 1)]
+        return records[np.argsort(records["ts"], kind="stable")]
+
+    def flush(self):
+        self.data.flush()
+
+
+class CategoryAggregator:
+    """用 sync_maindata 的增量数据维护每个任务的分类和速率，按分类汇总。"""
+
+    def __init__(self, categories: list):
+        self.column_of = {category: i for i, category in enumerate(categories)}
+        self.other_column = len(categories)
+        self.rid = 0
+        self.torrents = {}
+        self.server_state = {}
+
+    def update(self, maindata):
+        self.rid = maindata.get("rid", 0)
+        if maindata.get("full_update"):
+            self.torrents = {}
+        for torrent_hash, changes in (maindata.get("torrents") or {}).items():
+            self.torrents.setdefault(torrent_hash, {}).update(changes)
+        for torrent_hash in maindata.get("torrents_removed") or []:
+            self.torrents.pop(torrent_hash, None)
+        self.server_state.update(maindata.get("server_state") or {})
+
+    def totals(self) -> tuple[np.ndarray, np.ndarray]:
+        upload = np.zeros(self.other_column + 1, dtype=np.float64)
+        download = np.zeros(self.other_column + 1, dtype=np.float64)
+        for torrent in self.torrents.values():
+            column = self.column_of.get(torrent.get("category") or "", self.other_column)
+            upload[column] += torrent.get("upspeed") or 0
+            download[column] += torrent.get("dlspeed") or 0
+        return upload, download
+
+
+def open_ring_files(categories: list, writable: bool) -> tuple[RingFile, RingFile]:
+    category_count = len(categories)
+    seconds = RingFile(CONFIG["TELEMETRY_DIR"] / "seconds.npy", second_dtype(category_count),
+                       int(CONFIG["TELEMETRY_SECOND_RETENTION_HOURS"] * 3600), 1, categories, writable)
+    minutes = RingFile(CONFIG["TELEMETRY_DIR"] / "minutes.npy", minute_dtype(category_count),
+                       int(CONFIG["TELEMETRY_MINUTE_RETENTION_DAYS"] * 1440), 60, categories, writable)
+    return seconds, minutes
+
+
+def rollup_minute(records: np.ndarray) -> dict:
+    """把一分钟内的秒级记录汇总为一条分钟记录。"""
+    rollup = {field: records[field].mean() for field in GLOBAL_FIELDS}
+    rollup.update(samples=len(records), up_max=records["up"].max(), dl_max=records["dl"].max(),
+                  cat_up=records["cat_up"].mean(axis=0), cat_dl=records["cat_dl"].mean(axis=0))
+    return rollup
+
+
+def run_recorder(qb_client):
+    categories = CONFIG["TELEMETRY_CATEGORIES"] + [OTHER_CATEGORY]
+    seconds, minutes = open_ring_files(categories, writable=True)
+    aggregator = CategoryAggregator(CONFIG["TELEMETRY_CATEGORIES"])
+    logger.info(f"📡 遥测记录器已启动: 分类 {', '.join(categories)}，数据目录 {CONFIG['TELEMETRY_DIR']}")
+    try:
+        _record_loop(qb_client, seconds, minutes, aggregator)
+    finally:
+        seconds.flush()
+        minutes.flush()
+
+
+def _record_loop(qb_client, seconds: RingFile, minutes: RingFile, aggregator: CategoryAggregator):
+    minute_buffer = []
+    current_minute = None
+    last_flush = time.monotonic()
+    consecutive_errors = 0
+    while True:
+        tick_start = time.monotonic()
+        try:
+            aggregator.update(qb_client.sync_maindata(rid=aggregator.rid))
+            consecutive_errors = 0
+        except Exception as e:
+            consecutive_errors += 1
+            logger.warning(f"⚠️ 获取 sync_maindata 失败 ({consecutive_errors} 次): {e}")
+            aggregator.rid = 0
+            time.sleep(min(CONFIG["TELEMETRY_SAMPLE_INTERVAL_SECONDS"] * 2 ** consecutive_errors, 60))
+            continue
+
+        timestamp = int(time.time())
+        upload, download = aggregator.totals()
+        record = {field: aggregator.server_state.get(key) or 0 for field, key in GLOBAL_FIELDS.items()}
+        record.update(cat_up=upload, cat_dl=download)
+        seconds.write(record, timestamp)
+
+        minute = timestamp // 60
+        if current_minute is not None and minute != current_minute and minute_buffer:
+            minutes.write(rollup_minute(np.array(minute_buffer, dtype=seconds.data.dtype)), current_minute * 60)
+            minute_buffer = []
+        current_minute = minute
+        minute_buffer.append(seconds.data[timestamp % seconds.capacity].copy())
+
+        if tick_start - last_flush >= CONFIG["TELEMETRY_FLUSH_SECONDS"]:
+            seconds.flush()
+            minutes.flush()
+            last_flush = tick_start
+
+        time.sleep(max(CONFIG["TELEMETRY_SAMPLE_INTERVAL_SECONDS"] - (time.monotonic() - tick_start), 0))
+
+
+def metric_values(records: np.ndarray, categories: list, metric: str, category: str | None) -> np.ndarray:
+    if category is None:
+        return records[metric].astype(np.float64)
+    if category not in categories:
+        raise ValueError(f"遥测文件中没有分类 '{category}'，可用分类: {', '.join(categories)}")
+    return records[f"cat_{metric}"][:, categories.index(category)].astype(np.float64)
+
+
+def hourly_percentiles(timestamps: np.ndarray, values: np.ndarray, percentiles: list, timezone) -> list:
+    """按本地时间的小时分组计算百分位，返回 [(小时, 样本数, [百分位值...]), ...]。"""
+    # 每个 UTC 小时只换算一次本地小时，而不是对每条记录调用时区转换
+    utc_hours, inverse = np.unique(timestamps // 3600, return_inverse=True)
+    local_hours = np.array([datetime.fromtimestamp(int(h) * 3600, timezone).hour for h in utc_hours], dtype=np.intp)
+    hours = local_hours[inverse]
+    result = []
+    for hour in range(24):
+        hour_values = values[hours == hour]
+        if len(hour_values):
+            result.append((hour, len(hour_values), np.percentile(hour_values, percentiles).tolist()))
+    return result
+
+
+def run_report(args) -> int:
+    try:
+        seconds, minutes = open_ring_files([], writable=False)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"💥 无法读取遥测数据 (请先运行 record): {e}")
+        return 1
+    since = time.time() - args.days * 86400
+    use_seconds = args.source == "seconds" or \
+        (args.source == "auto" and args.days * 24 <= CONFIG["TELEMETRY_SECOND_RETENTION_HOURS"])
+    ring = seconds if use_seconds else minutes
+    records = ring.valid_records(since)
+    if not len(records):
+        logger.info("ℹ️ 所选时间范围内没有遥测数据。")
+        return 0
+    try:
+        values = metric_values(records, ring.categories, args.metric, args.category)
+    except ValueError as e:
+        logger.error(f"💥 {e}")
+        return 1
+    percentiles = [float(p) for p in args.percentiles.split(',')]
+    rows = hourly_percentiles(records["ts"].astype(np.float64), values, percentiles, CONFIG["TELEMETRY_TIMEZONE"])
+
+    label = f"{args.metric} ({args.category or '全部'})"
+    print(f"📊 {label}，最近 {args.days:g} 天，数据源: {'秒级' if use_seconds else '分钟平均'}，单位 MiB/s")
+    print(f"{'小时':>4} {'样本数':>8} " + " ".join(f"{'P' + format(p, 'g'):>8}" for p in percentiles))
+    for hour, count, hour_percentiles in rows:
+        print(f"{hour:>4} {count:>8} " + " ".join(f"{value / 1024 ** 2:>8.2f}" for value in hour_percentiles))
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="qBittorrent 带宽遥测记录器")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("record", help="常驻运行，每秒采样并写入环形文件")
+    report_parser = subparsers.add_parser("report", help="按一天中的小时统计速率百分位")
+    report_parser.add_argument("--metric", choices=["up", "dl", "up_limit", "dl_limit"], default="up")
+    report_parser.add_argument("--category", default=None, help="只统计该分类的速率 (仅适用于 up/dl)")
+    report_parser.add_argument("--days", type=float, default=7)
+    report_parser.add_argument("--percentiles", default="50,90,99")
+    report_parser.add_argument("--source", choices=["auto", "seconds", "minutes"], default="auto",
+                               help="auto: 时间范围在秒级保留期内时用秒级数据，否则用分钟平均")
+    args = parser.parse_args()
+
+    setup_logging()
+    if args.command == "report":
+        if args.category is not None and args.metric not in ("up", "dl"):
+            logger.error("💥 --category 只能与 --metric up/dl 一起使用。")
+            return 1
+        return run_report(args)
+
+    qb = connect_qbittorrent(CONFIG)
+    if not qb:
+        return 1
+    try:
+        run_recorder(qb)
+    except KeyboardInterrupt:
+        logger.info("🛑 收到中断信号，遥测记录器退出。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,23 +13,48 @@ qBittorrent 智能管理脚本
 4.  引入状态持续时间监控：避免因短暂的状态变化导致任务被误删。只有当任务持续处于某种“无效”状态达到设定时长后，才触发清理。
 5.  支持 Freeleech 种子的特殊处理，通常给予更长的保留时间。
 6.  包含“荣退”机制：对于已达到高分享率、低需求或做种时间过长的非 Freeleech 刷流任务，可自动清理以释放资源。
-7.  所有操作均有详细日志记录，支持 DRY_RUN (演习模式) 进行测试。
-8.  可选的 Telegram 通知功能，将清理结果报告发送给用户。
+7.  “磁盘驱逐”机制：当剩余空间低于刷流的磁盘下限时，按近期单位体积上传量 (活动历史中的 EWMA) 和荣退资格
+    对做种中的刷流任务排序，依次删除收益最低的任务，直到剩余空间回到目标水位。
+8.  删除 IO 预算：删除决定先进入持久化的删除队列，按 错误 > 磁盘压力 > 停滞 > 荣退 的优先级，
+    在每个预算周期内限量 (字节数与任务数) 释放，避免一次删除大量文件造成磁盘 IO 风暴拖慢其他任务。
+9.  所有操作均有详细日志记录，支持 DRY_RUN (演习模式) 进行测试。
+10. 可选的 Telegram 通知功能，将清理结果报告发送给用户。
+11. 清理策略以声明式规则 (CLEANUP_RULES) 描述，由 cleanup_rules.py 编译为 NumPy 列运算，在全部任务的快照上一次求值。
+12. 活动历史：每次运行为每个任务采样 uploaded/downloaded 计数和做种者/下载者数量，保存在数组形式的环形缓冲区
+    (activity_history.py，.npz 文件) 中。速度为 0 类的监控规则同时要求近一段时间的平均速率也很低，
+    避免两次突发传输之间的单次零速采样就开始删除倒计时。
+13. Tracker 健康检查：并发查询受监控任务的 Tracker 状态，未注册的种子立即删除，Tracker 全部出错的先批量重新汇报
+    并重新开始停滞计时，避免把 Tracker 故障误判为无人下载。
+14. 守护模式 (`--daemon`)：常驻运行，用 sync_maindata 增量维护本地任务表，只重新评估发生变化或计时到期的任务，
+    适合任务数量很多、每次全量拉取和遍历代价较高的场景。不带参数时仍为单次运行，适合 cron 定时调用。
+15. 分享限制下推：把荣退规则中的分享率和做种时间条件写入刷流任务自身的 qBittorrent 分享限制
+    (ratio_limit / seeding_time_limit，两者都达到才生效)，由 qBittorrent 自己停止任务，本脚本随后将停止前需求很低的
+    任务荣退删除，仍有需求的延长做种时间限制后恢复做种。
+    `brush.py` 添加任务时即设置，本脚本为尚未设置的已有刷流任务批量补齐。
 
 使用此脚本前，请务必理解其逻辑，并根据自己的实际情况调整 `CONFIG` 中的参数。
 错误的配置可能导致不期望的数据丢失。建议先在 DRY_RUN 模式下充分测试。
 """
 
+import heapq
 import html
 import json
 import logging
+import math
 import os
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
+import numpy as np
 import requests
-from qbittorrentapi import Client, APIConnectionError, LoginFailed, TorrentStates, NotFound404Error
+from qbittorrentapi import Client, APIConnectionError, LoginFailed, TorrentStates, NotFound404Error, TorrentDictionary, \
+    TrackerStatus
+
+from activity_history import ActivityHistory
+from cleanup_rules import TorrentSnapshot, compile_rules, match_rules, TYPE_BRUSHING, TYPE_NON_BRUSHING
 
 CONFIG = {
     "QBIT_HOST": os.environ.get('QBIT_HOST', 'http://localhost:8080'),
@@ -67,10 +92,48 @@ CONFIG = {
     "RETIREMENT_NO_ACTIVITY_LAST_ACTIVE_DAYS_NON_FL": int(
         os.environ.get('RETIREMENT_NO_ACTIVITY_LAST_ACTIVE_DAYS_NON_FL', '7')),
 
+    "EVICTION_ENABLED": os.environ.get('EVICTION_ENABLED', 'True').lower() != 'false',
+    "EVICTION_TRIGGER_FREE_GB": float(os.environ.get('DISK_SPACE_LIMIT_GB', '80')),
+    "EVICTION_TARGET_FREE_GB": float(os.environ.get('EVICTION_TARGET_FREE_GB', '120')),
+    "EVICTION_MIN_AGE_HOURS": float(os.environ.get('EVICTION_MIN_AGE_HOURS', '2')),
+    "EVICTION_MAX_PER_RUN": int(os.environ.get('EVICTION_MAX_PER_RUN', '20')),
+
     "TG_BOT_TOKEN_MONITOR": os.environ.get('TG_BOT_TOKEN_MONITOR', None),
     "TG_CHAT_ID": os.environ.get('TG_CHAT_ID', None),
     "TG_MAX_DELETED_ITEMS_IN_REPORT": int(os.environ.get('TG_MAX_DELETED_ITEMS_IN_REPORT', '20')),
 
+    "ACTIVITY_HISTORY_FILE_PATH": Path(os.environ.get('ACTIVITY_HISTORY_FILE_PATH', "mteam/activity_history.npz")),
+    "ACTIVITY_HISTORY_SAMPLES": int(os.environ.get('ACTIVITY_HISTORY_SAMPLES', '48')),
+    "ACTIVITY_SAMPLE_INTERVAL_SECONDS": float(os.environ.get('ACTIVITY_SAMPLE_INTERVAL_SECONDS', '240')),
+    "ACTIVITY_RATE_WINDOW_MINUTES": float(os.environ.get('ACTIVITY_RATE_WINDOW_MINUTES', '45')),
+    "ACTIVITY_EWMA_TAU_MINUTES": float(os.environ.get('ACTIVITY_EWMA_TAU_MINUTES', '30')),
+    "ACTIVITY_LOW_UPLOAD_RATE": float(os.environ.get('ACTIVITY_LOW_UPLOAD_RATE_KIB', '10')) * 1024,
+    "ACTIVITY_LOW_DOWNLOAD_RATE": float(os.environ.get('ACTIVITY_LOW_DOWNLOAD_RATE_KIB', '10')) * 1024,
+
+    "TRACKER_CHECK_ENABLED": os.environ.get('TRACKER_CHECK_ENABLED', 'True').lower() != 'false',
+    "TRACKER_CHECK_WORKERS": int(os.environ.get('TRACKER_CHECK_WORKERS', '8')),
+    "TRACKER_CHECK_MAX_PER_RUN": int(os.environ.get('TRACKER_CHECK_MAX_PER_RUN', '200')),
+    "TRACKER_CHECK_INTERVAL_MINUTES": float(os.environ.get('TRACKER_CHECK_INTERVAL_MINUTES', '10')),
+    "TRACKER_UNREGISTERED_KEYWORDS": [keyword.strip().lower() for keyword in os.environ.get(
+        'TRACKER_UNREGISTERED_KEYWORDS',
+        "unregistered,not registered,torrent not found,not exist,torrent has been deleted,种子不存在,未注册,已被删除").split(',')
+                                      if keyword.strip()],
+
+    "DELETE_BATCH_SIZE": int(os.environ.get('DELETE_BATCH_SIZE', '50')),
+    "DELETE_QUEUE_FILE_PATH": Path(os.environ.get('DELETE_QUEUE_FILE_PATH', "mteam/delete_queue.json")),
+    "DELETE_BUDGET_INTERVAL_MINUTES": float(os.environ.get('DELETE_BUDGET_INTERVAL_MINUTES', '10')),
+    "DELETE_BUDGET_GB_PER_INTERVAL": float(os.environ.get('DELETE_BUDGET_GB_PER_INTERVAL', '50')),
+    "DELETE_BUDGET_TORRENTS_PER_INTERVAL": int(os.environ.get('DELETE_BUDGET_TORRENTS_PER_INTERVAL', '20')),
+
+    "SHARE_LIMITS_ENABLED": os.environ.get('SHARE_LIMITS_ENABLED', 'True').lower() != 'false',
+    "SHARE_LIMIT_ACTION": os.environ.get('SHARE_LIMIT_ACTION', 'Stop'),
+    "SHARE_LIMITS_BATCH_SIZE": int(os.environ.get('SHARE_LIMITS_BATCH_SIZE', '200')),
+    "SHARE_LIMIT_EXTEND_HOURS": float(os.environ.get('SHARE_LIMIT_EXTEND_HOURS', '24')),
+
+    "DAEMON_INTERVAL_SECONDS": float(os.environ.get('DAEMON_INTERVAL_SECONDS', '30')),
+    "DAEMON_FULL_EVAL_MINUTES": float(os.environ.get('DAEMON_FULL_EVAL_MINUTES', '15')),
+    "DAEMON_REPORT_INTERVAL_MINUTES": float(os.environ.get('DAEMON_REPORT_INTERVAL_MINUTES', '60')),
+
     "DRY_RUN": os.environ.get('DRY_RUN', 'False').lower() == 'true',
     "LOG_LEVEL": os.environ.get('LOG_LEVEL', 'INFO').upper(),
 }
@@ -78,8 +141,117 @@ CONFIG = {
 STATE_UPLOADING_ZERO_SPEED = "uploading_zero_speed"
 STATE_DOWNLOADING_ZERO_SPEED = "downloading_zero_speed"
 
+# 守护模式下，增量数据中出现这些字段时重新评估该任务
+DAEMON_REEVALUATE_FIELDS = ("state", "upspeed", "dlspeed", "num_leechs", "num_seeds", "tags", "category", "progress")
+
+# 删除队列优先级，数值越小越先删除
+DELETE_PRIORITY_ERROR = 0
+DELETE_PRIORITY_DISK_PRESSURE = 1
+DELETE_PRIORITY_STALLED = 2
+DELETE_PRIORITY_RETIREMENT = 3
+
+TRACKER_ERROR_STATUSES = (TrackerStatus.NOT_WORKING.value, TrackerStatus.TRACKER_ERROR.value,
+                          TrackerStatus.UNREACHABLE.value)
+
+SEEDING_COMPLETE_STATES = (
+    TorrentStates.UPLOADING,
+    TorrentStates.FORCED_UPLOAD,
+    TorrentStates.STALLED_UPLOAD,
+    TorrentStates.PAUSED_UPLOAD,
+    TorrentStates.QUEUED_UPLOAD,
+)
+
+ERROR_STATES = [TorrentStates.ERROR.value, TorrentStates.MISSING_FILES.value, TorrentStates.UNKNOWN.value]
+
+# 分享限制取值：-2 为使用全局设置 (qBittorrent 默认值)，-1 为不限制
+SHARE_LIMIT_USE_GLOBAL = -2
+SHARE_LIMIT_UNLIMITED = -1
+# share_limits_mode=MatchAll (全部限制都达到才生效) 自此 Web API 版本起可用，更早的版本无法表达荣退规则的“且”条件
+SHARE_LIMITS_MATCH_ALL_API_VERSION = (2, 16, 0)
+SHARE_LIMIT_ACTION_NAMES = {"Stop": "停止", "Remove": "删除任务", "RemoveWithContent": "删除任务和文件",
+                            "EnableSuperSeeding": "超级做种", "Default": "执行全局动作"}
+
+# 清理规则，按顺序匹配，每个任务只命中第一条满足全部条件的规则 (条件格式见 cleanup_rules.py，"$键名" 取 CONFIG 中的阈值)。
+# 除 qBittorrent 字段外，还可使用 add_activity_columns 添加的活动历史列:
+#   upload_rate_window / download_rate_window - 近 ACTIVITY_RATE_WINDOW_MINUTES 分钟的平均速率 (字节/秒)
+#   upload_rate_ewma / download_rate_ewma     - EWMA 速率 (字节/秒)
+#   leechers_window_avg                       - 近 ACTIVITY_RATE_WINDOW_MINUTES 分钟的平均下载者数量
+#   leechers_active_window_avg                - 截至最后活动时刻的 ACTIVITY_RATE_WINDOW_MINUTES 分钟内的平均下载者数量
+#                                               (被停止的任务不计入停止后恒为 0 的采样)
+#   activity_history_minutes                  - 已积累的历史时长 (分钟)
+# 历史不足时，速率列退回为当前瞬时速度，下载者列退回为当前下载者数量。
+# 以及 build_cleanup_snapshot 添加的 share_limit_reached (1 = 任务自身的荣退分享限制已达到，即被 qBittorrent 停止的原因)。
+# action 含义:
+#   protect           - 受保护，跳过并移出监控
+#   ignore / keep     - 不处理 (非刷流/未分类 或 状态良好的刷流任务)，移出监控
+#   delete_keep_files - 删除任务、保留文件；delete_with_files - 删除任务和文件
+#   monitor           - 进入或继续监控 monitor_state，持续超过阈值后删除
+#   retire            - 荣退 (删除任务和文件)
+#   resume            - 把任务自身的做种时间限制延长 SHARE_LIMIT_EXTEND_HOURS 小时并恢复做种
+CLEANUP_RULES = [
+    {"name": "新添加 (24 小时内)", "action": "protect", "when": [("added_age_hours", "<", 24)]},
+    {"name": "做种中", "action": "protect",
+     "when": [("state", "in", [TorrentStates.UPLOADING.value, TorrentStates.FORCED_UPLOAD.value,
+                               TorrentStates.STALLED_UPLOAD.value])]},
+    {"name": "非刷流任务错误", "action": "delete_keep_files", "priority": DELETE_PRIORITY_ERROR,
+     "reason": "非刷流任务处于错误状态 '{state}'",
+     "when": [("type", "==", TYPE_NON_BRUSHING), ("state", "in", ERROR_STATES)]},
+    {"name": "非刷流任务", "action": "ignore", "when": [("type", "==", TYPE_NON_BRUSHING)]},
+    {"name": "刷流任务严重错误", "action": "delete_with_files", "priority": DELETE_PRIORITY_ERROR,
+     "reason": "刷流任务处于严重错误状态 '{state}'",
+     "when": [("type", "==", TYPE_BRUSHING), ("state", "in", ERROR_STATES)]},
+    {"name": "做种停滞", "action": "monitor", "monitor_state": TorrentStates.STALLED_UPLOAD.value,
+     "when": [("type", "==", TYPE_BRUSHING), ("state", "==", TorrentStates.STALLED_UPLOAD.value),
+              ("upload_rate_window", "<", "$ACTIVITY_LOW_UPLOAD_RATE")]},
+    # 被停止的任务没有已连接的下载者，需求按停止前 (截至最后活动) 一段时间的平均下载者数判断。
+    # 需求低的荣退；因自身荣退分享限制被停止、但仍有需求的延长做种时间限制后恢复做种，再次被停止时重新判断。
+    # 手动暂停的任务 (分享限制未达到) 不会被恢复。
+    {"name": "已达分享限制被停止", "action": "retire",
+     "when": [("type", "==", TYPE_BRUSHING),
+              ("state", "in", [TorrentStates.PAUSED_UPLOAD.value, TorrentStates.STOPPED_UPLOAD.value]),
+              ("is_freeleech", "==", False),
+              ("ratio", ">=", "$RETIREMENT_MIN_RATIO"),
+              ("seeding_days", ">=", "$RETIREMENT_MIN_SEEDING_DAYS"),
+              ("leechers_active_window_avg", "<=", "$RETIREMENT_LOW_DEMAND_LEECHERS")]},
+    {"name": "已达分享限制但仍有需求", "action": "resume",
+     "when": [("type", "==", TYPE_BRUSHING),
+              ("state", "in", [TorrentStates.PAUSED_UPLOAD.value, TorrentStates.STOPPED_UPLOAD.value]),
+              ("is_freeleech", "==", False),
+              ("share_limit_reached", "==", 1)]},
+    {"name": "做种暂停", "action": "monitor", "monitor_state": TorrentStates.PAUSED_UPLOAD.value,
+     "when": [("type", "==", TYPE_BRUSHING), ("state", "==", TorrentStates.PAUSED_UPLOAD.value)]},
+    {"name": "上传速度为 0", "action": "monitor", "monitor_state": STATE_UPLOADING_ZERO_SPEED,
+     "when": [("type", "==", TYPE_BRUSHING), ("state", "==", TorrentStates.UPLOADING.value), ("upspeed", "==", 0),
+              ("upload_rate_window", "<", "$ACTIVITY_LOW_UPLOAD_RATE")]},
+    {"name": "下载停滞", "action": "monitor", "monitor_state": TorrentStates.STALLED_DOWNLOAD.value,
+     "when": [("type", "==", TYPE_BRUSHING), ("state", "==", TorrentStates.STALLED_DOWNLOAD.value),
+              ("progress", "<", 1), ("download_rate_window", "<", "$ACTIVITY_LOW_DOWNLOAD_RATE")]},
+    {"name": "下载速度为 0", "action": "monitor", "monitor_state": STATE_DOWNLOADING_ZERO_SPEED,
+     "when": [("type", "==", TYPE_BRUSHING), ("state", "==", TorrentStates.DOWNLOADING.value), ("dlspeed", "==", 0),
+              ("progress", "<", 1), ("download_rate_window", "<", "$ACTIVITY_LOW_DOWNLOAD_RATE")]},
+    {"name": "荣退 (高分享率)", "action": "retire",
+     "when": [("type", "==", TYPE_BRUSHING),
+              ("state", "in", [TorrentStates.UPLOADING.value, TorrentStates.FORCED_UPLOAD.value]),
+              ("is_freeleech", "==", False),
+              ("ratio", ">=", "$RETIREMENT_MIN_RATIO"),
+              ("num_leechs", "<=", "$RETIREMENT_LOW_DEMAND_LEECHERS"),
+              ("seeding_days", ">=", "$RETIREMENT_MIN_SEEDING_DAYS")]},
+    {"name": "荣退 (长期无活动)", "action": "retire",
+     "when": [("type", "==", TYPE_BRUSHING),
+              ("state", "in", [TorrentStates.UPLOADING.value, TorrentStates.FORCED_UPLOAD.value]),
+              ("is_freeleech", "==", False),
+              ("seeding_days", ">=", "$RETIREMENT_MAX_SEEDING_DAYS_NO_ACTIVITY_NON_FL"),
+              ("num_leechs", "<=", "$RETIREMENT_NO_ACTIVITY_LEECHER_THRESHOLD_NON_FL"),
+              ("last_activity_days", ">=", "$RETIREMENT_NO_ACTIVITY_LAST_ACTIVE_DAYS_NON_FL")]},
+    {"name": "刷流任务状态良好", "action": "keep", "when": [("type", "==", TYPE_BRUSHING)]},
+    {"name": "未分类任务", "action": "ignore", "when": []},
+]
+PASSIVE_RULE_ACTIONS = ("protect", "ignore", "keep")
+
 logger = logging.getLogger("qb_smart_cleanup")
 
+COMPILED_CLEANUP_RULES = compile_rules(CLEANUP_RULES, CONFIG)
+
 
 def setup_logging():
     log_level_val = getattr(logging, CONFIG["LOG_LEVEL"], logging.INFO)
@@ -91,6 +263,19 @@ def setup_logging():
     logging.getLogger('qbittorrentapi').setLevel(logging.INFO if log_level_val <= logging.INFO else log_level_val)
 
 
+def format_size(size_bytes: int | float) -> str:
+    if size_bytes < 0:
+        return "-" + format_size(-size_bytes)
+    if size_bytes < 1024:
+        return f"{size_bytes:.0f} B"
+    size = float(size_bytes)
+    for unit in ["KiB", "MiB", "GiB", "TiB"]:
+        size /= 1024
+        if size < 1024:
+            return f"{size:.2f} {unit}"
+    return f"{size:.2f} PiB"
+
+
 def load_monitoring_data(filepath: Path) -> dict:
     if filepath.exists():
         try:
@@ -160,36 +345,397 @@ def get_torrent_type_and_freeleech(torrent, config_dict: dict) -> tuple[str, boo
     return category_type, is_freeleech
 
 
-def delete_torrent_action(qb_client: Client, torrent_hash: str, torrent_name: str, delete_files: bool, dry_run: bool,
-                          reason: str, tg_report_list: list) -> bool:
-    action_prefix = "[演习模式] " if dry_run else ""
-    file_action_msg = "任务和文件" if delete_files else "仅任务 (保留文件)"
-    log_message = f"{action_prefix}请求删除 '{torrent_name}' ({torrent_hash}) - {file_action_msg}。原因: {reason}"
-    logger.info(log_message)
-
-    tg_report_list.append({
-        "name": torrent_name,
-        "hash": torrent_hash,
-        "action_type": "删除" if not reason.startswith("荣退") else "荣退",
-        "detail": file_action_msg,
-        "reason": reason,
-        "dry_run": dry_run
-    })
+def get_retirement_reason(torrent, is_freeleech: bool, current_time_seconds: float, config_dict: dict) -> str | None:
+    """判断任务是否满足“荣退”条件，满足时返回荣退原因，否则返回 None。"""
+    if is_freeleech:
+        return None
+
+    seeding_time_days = torrent.seeding_time / (60 * 60 * 24) if torrent.seeding_time else 0
+    last_activity_days_ago = (current_time_seconds - torrent.last_activity) / (
+            60 * 60 * 24) if torrent.last_activity > 0 else float('inf')
+
+    if (torrent.ratio >= config_dict["RETIREMENT_MIN_RATIO"] and
+            torrent.num_leechs <= config_dict["RETIREMENT_LOW_DEMAND_LEECHERS"] and
+            seeding_time_days >= config_dict["RETIREMENT_MIN_SEEDING_DAYS"]):
+        return (f"荣退: 分享率 {torrent.ratio:.2f} (>{config_dict['RETIREMENT_MIN_RATIO']}), "
+                f"下载者 {torrent.num_leechs} (<{config_dict['RETIREMENT_LOW_DEMAND_LEECHERS']}), "
+                f"做种 {seeding_time_days:.1f} 天 (>{config_dict['RETIREMENT_MIN_SEEDING_DAYS']})")
+    if (seeding_time_days >= config_dict["RETIREMENT_MAX_SEEDING_DAYS_NO_ACTIVITY_NON_FL"] and
+            torrent.num_leechs <= config_dict["RETIREMENT_NO_ACTIVITY_LEECHER_THRESHOLD_NON_FL"] and
+            last_activity_days_ago >= config_dict["RETIREMENT_NO_ACTIVITY_LAST_ACTIVE_DAYS_NON_FL"]):
+        return (f"荣退 (非FL): 做种 {seeding_time_days:.1f} 天 (>{config_dict['RETIREMENT_MAX_SEEDING_DAYS_NO_ACTIVITY_NON_FL']}), "
+                f"下载者 {torrent.num_leechs} (<{config_dict['RETIREMENT_NO_ACTIVITY_LEECHER_THRESHOLD_NON_FL']}), "
+                f"最后活动于 {last_activity_days_ago:.1f} 天前 (>{config_dict['RETIREMENT_NO_ACTIVITY_LAST_ACTIVE_DAYS_NON_FL']})")
+    return None
+
+
+def parse_api_version(version: str) -> tuple:
+    try:
+        return tuple(int(part) for part in str(version).lstrip('v').split('.'))
+    except ValueError:
+        return ()
+
+
+def get_share_limit_policy(config_dict: dict) -> dict:
+    """
+    把荣退规则中可由 qBittorrent 原生执行的部分 (分享率与做种时间) 转换为分享限制参数，
+    可直接用于 torrents_add 和 torrents_set_share_limits。下载者数量无法下推：qBittorrent 只要分享率与做种时间
+    都达到就会停止任务，清理规则只荣退停止前下载者很少的任务；仍有需求的任务由 resume_share_limited_torrents
+    把做种时间限制延长 SHARE_LIMIT_EXTEND_HOURS 小时后恢复做种，到期再次被停止时按当时的需求重新判断。
+    """
+    return {
+        "ratio_limit": config_dict["RETIREMENT_MIN_RATIO"],
+        "seeding_time_limit": int(config_dict["RETIREMENT_MIN_SEEDING_DAYS"] * 24 * 60),
+        "inactive_seeding_time_limit": SHARE_LIMIT_UNLIMITED,
+        "share_limit_action": config_dict["SHARE_LIMIT_ACTION"],
+        "share_limits_mode": "MatchAll",
+    }
 
-    if not dry_run:
+
+def push_share_limits(qb_client: Client, snapshot: TorrentSnapshot, actions_this_run: dict) -> int:
+    """
+    为尚未设置分享限制 (分享率与做种时间均为“使用全局设置”) 的非 Freeleech 刷流任务批量设置荣退分享限制，
+    返回设置的任务数。手动设置过限制的任务不会被覆盖。qBittorrent 不支持 MatchAll 模式时跳过。
+    """
+    try:
+        api_version = parse_api_version(qb_client.app.web_api_version)
+    except Exception as e:
+        logger.warning(f"⚠️ 获取 qBittorrent Web API 版本失败，跳过分享限制下推: {e}")
+        return 0
+    if api_version < SHARE_LIMITS_MATCH_ALL_API_VERSION:
+        logger.debug(f"qBittorrent Web API {'.'.join(map(str, api_version))} 不支持 MatchAll 分享限制模式，跳过分享限制下推。")
+        return 0
+
+    pending = (snapshot.strings["type"].isin([TYPE_BRUSHING]) & ~snapshot.bools["is_freeleech"] &
+               (snapshot.numeric["ratio_limit"] == SHARE_LIMIT_USE_GLOBAL) &
+               (snapshot.numeric["seeding_time_limit"] == SHARE_LIMIT_USE_GLOBAL))
+    pending_hashes = [snapshot.hashes[index] for index in np.flatnonzero(pending)]
+    if not pending_hashes:
+        return 0
+
+    policy = get_share_limit_policy(CONFIG)
+    if CONFIG["DRY_RUN"]:
+        logger.info(f"🧪 [演习] 将为 {len(pending_hashes)} 个刷流任务设置分享限制: 分享率 {policy['ratio_limit']} "
+                    f"且做种 {CONFIG['RETIREMENT_MIN_SEEDING_DAYS']} 天后"
+                    f"{SHARE_LIMIT_ACTION_NAMES.get(policy['share_limit_action'], policy['share_limit_action'])}。")
+        return len(pending_hashes)
+
+    applied = 0
+    batch_size = max(1, CONFIG["SHARE_LIMITS_BATCH_SIZE"])
+    for start in range(0, len(pending_hashes), batch_size):
+        batch = pending_hashes[start:start + batch_size]
         try:
-            qb_client.torrents_delete(torrent_hashes=torrent_hash, delete_files=delete_files)
-            logger.info(f"✅ 已成功发起对 '{torrent_name}' 的删除请求。")
-            return True
-        except NotFound404Error:
-            logger.warning(f"⚠️ 删除任务 '{torrent_name}' ({torrent_hash}) 时未找到 (可能已被其他方式删除)。")
-            return True
+            qb_client.torrents_set_share_limits(torrent_hashes=batch, **policy)
+            applied += len(batch)
         except Exception as e:
-            logger.error(f"💥 删除任务 '{torrent_name}' ({torrent_hash}) 失败: {e}", exc_info=True)
-            return False
+            logger.error(f"💥 批量设置 {len(batch)} 个任务的分享限制失败: {e}")
+    if applied:
+        logger.info(f"📐 已为 {applied} 个刷流任务设置分享限制: 分享率 {policy['ratio_limit']} "
+                    f"且做种 {CONFIG['RETIREMENT_MIN_SEEDING_DAYS']} 天后"
+                    f"{SHARE_LIMIT_ACTION_NAMES.get(policy['share_limit_action'], policy['share_limit_action'])}。")
+    actions_this_run["share_limits_set"] += applied
+    return applied
+
+
+def get_share_limit_reached(snapshot: TorrentSnapshot, config_dict: dict) -> np.ndarray:
+    """
+    每个任务自身的荣退分享限制 (由 get_share_limit_policy 下推、或由 resume_share_limited_torrents 延长) 是否已达到。
+    分享率限制与荣退分享率不同、做种时间限制短于荣退天数的任务视为手动设置，不计入。
+    """
+    policy = get_share_limit_policy(config_dict)
+    numeric = snapshot.numeric
+    own_limits = np.isclose(numeric["ratio_limit"], policy["ratio_limit"], atol=0.005) & \
+        (numeric["seeding_time_limit"] >= policy["seeding_time_limit"])
+    return own_limits & (numeric["ratio"] >= numeric["ratio_limit"] - 0.005) & \
+        (numeric["seeding_time"] / 60 >= numeric["seeding_time_limit"])
+
+
+def resume_share_limited_torrents(qb_client: Client, torrents: list, actions_this_run: dict) -> int:
+    """
+    为因达到自身荣退分享限制被停止、但仍有下载者需求的任务延长做种时间限制 (当前做种时间取整到小时后再加
+    SHARE_LIMIT_EXTEND_HOURS 小时，分享率限制和动作不变) 并恢复做种，返回恢复的任务数。
+    延长到期后 qBittorrent 会再次停止任务，届时按需求重新决定荣退或继续延长。按新限制值分组批量设置。
+    """
+    if not torrents:
+        return 0
+    extend_minutes = int(CONFIG["SHARE_LIMIT_EXTEND_HOURS"] * 60)
+    groups = {}
+    for torrent in torrents:
+        seeding_minutes = math.ceil((torrent.get("seeding_time") or 0) / 3600) * 60
+        groups.setdefault(seeding_minutes + extend_minutes, []).append(torrent.hash)
+    total = sum(len(hashes) for hashes in groups.values())
+    if CONFIG["DRY_RUN"]:
+        logger.info(f"🧪 [演习] 将为 {total} 个已达分享限制但仍有需求的任务延长做种时间限制 "
+                    f"{CONFIG['SHARE_LIMIT_EXTEND_HOURS']} 小时并恢复做种。")
+        return total
+
+    policy = get_share_limit_policy(CONFIG)
+    resumed = 0
+    batch_size = max(1, CONFIG["SHARE_LIMITS_BATCH_SIZE"])
+    for seeding_time_limit, hashes in groups.items():
+        for start in range(0, len(hashes), batch_size):
+            batch = hashes[start:start + batch_size]
+            try:
+                qb_client.torrents_set_share_limits(torrent_hashes=batch,
+                                                    **{**policy, "seeding_time_limit": seeding_time_limit})
+                qb_client.torrents_start(torrent_hashes=batch)
+                resumed += len(batch)
+            except Exception as e:
+                logger.error(f"💥 批量恢复 {len(batch)} 个已达分享限制任务的做种失败: {e}")
+    if resumed:
+        logger.info(f"▶️ 已为 {resumed} 个已达分享限制但仍有需求的任务延长做种时间限制 "
+                    f"{CONFIG['SHARE_LIMIT_EXTEND_HOURS']} 小时并恢复做种。")
+    actions_this_run["share_limits_extended"] += resumed
+    return resumed
+
+
+def new_deletion_queue() -> dict:
+    return {"window_start": 0.0, "window_bytes": 0, "window_torrents": 0, "items": {}}
+
+
+def load_deletion_queue(filepath: Path) -> dict:
+    deletion_queue = new_deletion_queue()
+    deletion_queue.update(load_monitoring_data(filepath))
+    return deletion_queue
+
+
+def delete_torrent_action(deletion_queue: dict, torrent, delete_files: bool, dry_run: bool, reason: str,
+                          priority: int, current_time_seconds: float, extra: dict | None = None) -> bool:
+    """
+    将删除决定放入删除队列。实际的删除请求由 release_deletions 按 IO 预算挑出、
+    flush_pending_deletions 按 delete_files 分组批量提交，结果由 apply_deletion_results 统一计入统计。
+    同一任务重复入队时保留最早的入队时间和最紧急的优先级。
+    """
+    action_prefix = "[演习模式] " if dry_run else ""
+    file_action_msg = "任务和文件" if delete_files else "仅任务 (保留文件)"
+    action_type = "荣退" if reason.startswith("荣退") else "驱逐" if reason.startswith("驱逐") else "删除"
+
+    queued = deletion_queue["items"].get(torrent.hash)
+    if queued is not None and queued["priority"] <= priority:
+        logger.debug(f"任务 '{torrent.name}' ({torrent.hash}) 已在删除队列中 (优先级 {queued['priority']})。")
+        return True
+
+    logger.info(f"{action_prefix}请求删除 '{torrent.name}' ({torrent.hash}) - {file_action_msg}。原因: {reason}")
+    deletion_queue["items"][torrent.hash] = {
+        "hash": torrent.hash,
+        "name": torrent.name,
+        "delete_files": delete_files,
+        "action_type": action_type,
+        "reason": reason,
+        "priority": priority,
+        "disk_bytes": int(torrent.size * torrent.progress) if delete_files else 0,
+        "queued_at": queued["queued_at"] if queued else current_time_seconds,
+        **(extra or {}),
+    }
     return True
 
 
+def prune_deletion_queue(deletion_queue: dict, current_qbit_hashes: set, monitoring_data: dict,
+                         free_space: int | None, config_dict: dict):
+    """
+    移除已从 qBittorrent 消失的任务、因停滞入队但状态已恢复 (不再受监控) 的任务，
+    以及磁盘驱逐入队、但剩余空间已回到驱逐触发线以上 (或驱逐已关闭) 的任务。
+    荣退入队的任务在 evaluate_torrents 中重新匹配规则，不再满足时移出。
+    """
+    disk_pressure_gone = not config_dict["EVICTION_ENABLED"] or \
+        (free_space is not None and free_space >= config_dict["EVICTION_TRIGGER_FREE_GB"] * 1024 ** 3)
+    for torrent_hash, decision in list(deletion_queue["items"].items()):
+        if torrent_hash not in current_qbit_hashes:
+            logger.info(f"🧹 删除队列中的 '{decision['name']}' ({torrent_hash}) 已不存在于 qBittorrent，移出队列。")
+            del deletion_queue["items"][torrent_hash]
+        elif decision["priority"] == DELETE_PRIORITY_STALLED and torrent_hash not in monitoring_data:
+            logger.info(f"🟢 删除队列中的 '{decision['name']}' ({torrent_hash}) 状态已恢复，移出队列。")
+            del deletion_queue["items"][torrent_hash]
+        elif decision["priority"] == DELETE_PRIORITY_DISK_PRESSURE and disk_pressure_gone:
+            logger.info(f"🟢 删除队列中的 '{decision['name']}' ({torrent_hash}) 因磁盘压力入队，"
+                        f"剩余空间已恢复，移出队列。")
+            del deletion_queue["items"][torrent_hash]
+
+
+def release_deletions(deletion_queue: dict, current_time_seconds: float, config_dict: dict) -> list:
+    """
+    按 (优先级, 入队时间) 从删除队列中取出本轮可以执行的删除，受每个预算周期内的删除字节数与任务数限制，
+    避免一次性删除大量文件造成磁盘 IO 风暴。每个周期至少放行一个任务，保证超大任务不会永久阻塞队列。
+    队首任务超出预算时停止放行，不让低优先级任务插队。
+    """
+    interval_seconds = config_dict["DELETE_BUDGET_INTERVAL_MINUTES"] * 60
+    if current_time_seconds - deletion_queue["window_start"] >= interval_seconds:
+        deletion_queue["window_start"] = current_time_seconds
+        deletion_queue["window_bytes"] = 0
+        deletion_queue["window_torrents"] = 0
+
+    budget_bytes = config_dict["DELETE_BUDGET_GB_PER_INTERVAL"] * 1024 ** 3
+    budget_torrents = config_dict["DELETE_BUDGET_TORRENTS_PER_INTERVAL"]
+    released = []
+    for decision in sorted(deletion_queue["items"].values(), key=lambda d: (d["priority"], d["queued_at"])):
+        window_empty = deletion_queue["window_torrents"] == 0
+        if budget_torrents > 0 and deletion_queue["window_torrents"] >= budget_torrents:
+            break
+        if budget_bytes > 0 and not window_empty and \
+                deletion_queue["window_bytes"] + decision["disk_bytes"] > budget_bytes:
+            break
+        deletion_queue["window_bytes"] += decision["disk_bytes"]
+        deletion_queue["window_torrents"] += 1
+        released.append(decision)
+
+    deferred = len(deletion_queue["items"]) - len(released)
+    if deferred:
+        # 守护模式下每个周期都会调用，没有新放行的任务时降为 DEBUG，避免刷屏
+        log = logger.info if released else logger.debug
+        log(f"⏳ 本周期删除预算已用 {format_size(deletion_queue['window_bytes'])} / "
+            f"{deletion_queue['window_torrents']} 个任务，{deferred} 个删除推迟到后续周期。")
+    return released
+
+
+def _delete_single_torrent(qb_client: Client, decision: dict) -> bool:
+    try:
+        qb_client.torrents_delete(torrent_hashes=decision["hash"], delete_files=decision["delete_files"])
+        logger.info(f"✅ 已成功发起对 '{decision['name']}' 的删除请求。")
+        return True
+    except NotFound404Error:
+        logger.warning(f"⚠️ 删除任务 '{decision['name']}' ({decision['hash']}) 时未找到 (可能已被其他方式删除)。")
+        return True
+    except Exception as e:
+        logger.error(f"💥 删除任务 '{decision['name']}' ({decision['hash']}) 失败: {e}", exc_info=True)
+        return False
+
+
+def flush_pending_deletions(qb_client: Client, pending_deletions: list, dry_run: bool, batch_size: int) -> dict:
+    """
+    按 delete_files 分组、每批最多 batch_size 个任务提交删除请求，返回 {hash: 是否成功}。
+    某一批失败时退回逐个删除，以获得每个任务各自的结果。
+    """
+    if dry_run:
+        return {d["hash"]: True for d in pending_deletions}
+
+    results = {}
+    for delete_files in (False, True):
+        group = [d for d in pending_deletions if d["delete_files"] == delete_files]
+        for i in range(0, len(group), batch_size):
+            batch = group[i:i + batch_size]
+            try:
+                qb_client.torrents_delete(torrent_hashes=[d["hash"] for d in batch], delete_files=delete_files)
+                logger.info(f"📦 已批量提交 {len(batch)} 个删除请求 (删除文件: {delete_files})。")
+                for d in batch:
+                    logger.info(f"✅ 已成功发起对 '{d['name']}' 的删除请求。")
+                    results[d["hash"]] = True
+            except NotFound404Error:
+                logger.warning("⚠️ 批量删除时部分任务未找到 (可能已被其他方式删除)，视为已删除。")
+                for d in batch:
+                    results[d["hash"]] = True
+            except Exception as e:
+                logger.warning(f"⚠️ 批量删除 {len(batch)} 个任务失败: {e}。改为逐个删除。")
+                for d in batch:
+                    results[d["hash"]] = _delete_single_torrent(qb_client, d)
+    return results
+
+
+def apply_deletion_results(released: list, results: dict, deletion_queue: dict, monitoring_data: dict,
+                           actions_this_run: dict, tg_report_list: list, dry_run: bool):
+    """成功删除的任务移出删除队列并计入统计和报告；失败的任务留在队列中，下一周期重试。"""
+    for d in released:
+        if not results.get(d["hash"]):
+            continue
+        deletion_queue["items"].pop(d["hash"], None)
+        tg_report_list.append({
+            "name": d["name"],
+            "hash": d["hash"],
+            "action_type": d["action_type"],
+            "detail": "任务和文件" if d["delete_files"] else "仅任务 (保留文件)",
+            "reason": d["reason"],
+            "dry_run": dry_run
+        })
+        actions_this_run["deleted"] += 1
+        if d["action_type"] == "荣退":
+            actions_this_run["retired"] += 1
+        elif d["action_type"] == "驱逐":
+            actions_this_run["evicted"] += 1
+            actions_this_run["evicted_bytes"] += d.get("size", 0)
+            actions_this_run["evicted_upload_rate"] += d.get("upload_rate", 0.0)
+        if d["hash"] in monitoring_data:
+            del monitoring_data[d["hash"]]
+            actions_this_run["monitored_removed"] += 1
+
+
+def get_free_disk_space(qb_client: Client) -> int | None:
+    try:
+        server_state = qb_client.sync_maindata().server_state
+        free_space = server_state.get('free_space_on_disk') if server_state else None
+        if free_space is None:
+            logger.warning("⚠️ 无法从 qBittorrent 获取 free_space_on_disk。")
+        return free_space
+    except Exception as e:
+        logger.error(f"💥 获取磁盘剩余空间失败: {e}")
+        return None
+
+
+def run_disk_pressure_eviction(qb_client: Client, snapshot: TorrentSnapshot, deletion_queue: dict,
+                               current_time_seconds: float, config_dict: dict, free_space: int | None = None) -> dict:
+    """
+    磁盘压力驱逐：类似缓存替换策略，剩余空间低于触发线时，按
+    (是否满足荣退条件, 单位 GiB 上传速率 EWMA) 升序逐个删除做种中的刷流任务，直到剩余空间达到目标水位。
+    上传速率 EWMA 取自活动历史 (快照的 upload_rate_ewma 列)。
+    删除队列中 (且删除文件) 的任务所占空间视为即将释放，避免因删除预算推迟释放而重复驱逐。
+    """
+    result = {"evicted": 0, "freed_bytes": 0, "lost_upload_rate": 0.0}
+    if free_space is None:
+        free_space = get_free_disk_space(qb_client)
+    if free_space is None:
+        return result
+
+    pending_hashes = set(deletion_queue["items"].keys())
+    free_space += sum(d["disk_bytes"] for d in deletion_queue["items"].values())
+
+    trigger_bytes = config_dict["EVICTION_TRIGGER_FREE_GB"] * 1024 ** 3
+    target_bytes = max(config_dict["EVICTION_TARGET_FREE_GB"], config_dict["EVICTION_TRIGGER_FREE_GB"]) * 1024 ** 3
+    if free_space >= trigger_bytes:
+        logger.debug(f"💽 剩余空间 {format_size(free_space)} 高于驱逐触发线 {format_size(trigger_bytes)}，无需驱逐。")
+        return result
+
+    logger.warning(f"💽 剩余空间 {format_size(free_space)} 低于驱逐触发线 {format_size(trigger_bytes)}，"
+                   f"开始驱逐低收益刷流任务 (目标水位 {format_size(target_bytes)})。")
+
+    min_age_seconds = config_dict["EVICTION_MIN_AGE_HOURS"] * 3600
+    eligible = (snapshot.strings["type"].isin([TYPE_BRUSHING]) &
+                snapshot.strings["state"].isin([state.value for state in SEEDING_COMPLETE_STATES]) &
+                (snapshot.numeric["size"] > 0) & (snapshot.numeric["added_age_hours"] * 3600 >= min_age_seconds))
+    candidates = []
+    for index in np.flatnonzero(eligible):
+        torrent = snapshot.torrents[index]
+        if torrent.hash in pending_hashes:
+            continue
+        is_freeleech = bool(snapshot.bools["is_freeleech"][index])
+        retirement_reason = get_retirement_reason(torrent, is_freeleech, current_time_seconds, config_dict)
+        upload_rate = float(snapshot.numeric["upload_rate_ewma"][index])
+        upload_rate_per_gb = upload_rate / (torrent.size / 1024 ** 3)
+        candidates.append((retirement_reason is None, upload_rate_per_gb, upload_rate, torrent))
+
+    candidates.sort(key=lambda c: (c[0], c[1]))
+
+    projected_free_space = free_space
+    for _, upload_rate_per_gb, upload_rate, torrent in candidates:
+        if projected_free_space >= target_bytes or result["evicted"] >= config_dict["EVICTION_MAX_PER_RUN"]:
+            break
+        reason = (f"驱逐: 剩余空间 {format_size(projected_free_space)} 低于目标 {format_size(target_bytes)}，"
+                  f"上传 EWMA {format_size(upload_rate)}/s ({format_size(upload_rate_per_gb)}/s/GiB)，"
+                  f"释放 {format_size(torrent.size)}")
+        if delete_torrent_action(deletion_queue, torrent, delete_files=True, dry_run=config_dict["DRY_RUN"],
+                                 reason=reason, priority=DELETE_PRIORITY_DISK_PRESSURE,
+                                 current_time_seconds=current_time_seconds,
+                                 extra={"size": torrent.size, "upload_rate": upload_rate}):
+            result["evicted"] += 1
+            result["freed_bytes"] += torrent.size
+            result["lost_upload_rate"] += upload_rate
+            projected_free_space += torrent.size
+
+    if projected_free_space < target_bytes:
+        logger.warning(f"⚠️ 驱逐后预计剩余空间 {format_size(projected_free_space)} 仍低于目标水位 "
+                       f"{format_size(target_bytes)} (可驱逐任务不足或达到单轮上限)。")
+    logger.info(f"💽 本轮决定驱逐 {result['evicted']} 个任务，预计释放 {format_size(result['freed_bytes'])}，"
+                f"损失上传速率约 {format_size(result['lost_upload_rate'])}/s。")
+    return result
+
+
 def format_telegram_html(text: str) -> str:
     return html.escape(str(text))
 
@@ -211,8 +757,18 @@ def send_telegram_notification(config: dict, report_items: list, summary_stats:
                      f"- 新增监控任务: {summary_stats['monitored_new']} 个",
                      f"- 持续监控检查: {summary_stats['monitored_updated']} 次",
                      f"- 移除监控任务: {summary_stats['monitored_removed']} 个"]
-
-    deleted_items_for_report = [item for item in report_items if item["action_type"] in ["删除", "荣退"]]
+    if summary_stats.get('evicted'):
+        message_parts.append(f"- 磁盘驱逐任务: {summary_stats['evicted']} 个 "
+                             f"(释放 {format_size(summary_stats['evicted_bytes'])}，"
+                             f"损失上传速率约 {format_size(summary_stats['evicted_upload_rate'])}/s)")
+    if summary_stats.get('tracker_unregistered') or summary_stats.get('tracker_reannounced'):
+        message_parts.append(f"- Tracker 检查: 未注册 {summary_stats['tracker_unregistered']} 个，"
+                             f"重新汇报 {summary_stats['tracker_reannounced']} 个")
+    if summary_stats.get('deferred'):
+        message_parts.append(f"- 推迟删除任务: {summary_stats['deferred']} 个 "
+                             f"(待释放 {format_size(summary_stats['deferred_bytes'])}，受删除 IO 预算限制)")
+
+    deleted_items_for_report = [item for item in report_items if item["action_type"] in ["删除", "荣退", "驱逐"]]
     if config["DRY_RUN"]:
         deleted_items_for_report = report_items
 
@@ -227,7 +783,7 @@ def send_telegram_notification(config: dict, report_items: list, summary_stats:
 
             name_escaped = format_telegram_html(item['name'][:80])
             reason_escaped = format_telegram_html(item['reason'])
-            action_type_emoji = "🏆" if item["action_type"] == "荣退" else "🗑️"
+            action_type_emoji = {"荣退": "🏆", "驱逐": "💽"}.get(item["action_type"], "🗑️")
             dry_run_tag = " [演习]" if item["dry_run"] and not config["DRY_RUN"] else ""
 
             message_parts.append(
@@ -271,6 +827,320 @@ def send_telegram_notification(config: dict, report_items: list, summary_stats:
         logger.error(f"💥 发送 Telegram 通知时发生未知错误: {e}", exc_info=True)
 
 
+def get_monitor_threshold_minutes(monitored_entry: dict, torrent, config_dict: dict) -> int:
+    """返回受监控任务在其当前监控状态下的删除阈值 (分钟)。"""
+    # 检查受监控状态是否是表示做种停滞的状态
+    if monitored_entry['monitored_state'] in (TorrentStates.STALLED_UPLOAD.value, STATE_UPLOADING_ZERO_SPEED,
+                                              TorrentStates.PAUSED_UPLOAD.value):
+        if monitored_entry['is_freeleech']:
+            if torrent.num_leechs == 0:  # 仅当没有下载者时，FL任务的停滞才使用更长的监控时间
+                return config_dict["FREELEECH_STALLED_NO_LEECHERS_MONITOR_DURATION_MINUTES"]
+        elif torrent.num_leechs > 0:  # 非FL任务，如果有下载者但仍然停滞
+            return config_dict["STALLED_WITH_LEECHERS_MONITOR_DURATION_MINUTES"]
+    # 如果是非FL任务且无下载者，或者FL任务有下载者，则使用默认的 USELESS_STATE_MONITOR_DURATION_MINUTES
+    return config_dict["USELESS_STATE_MONITOR_DURATION_MINUTES"]
+
+
+def add_activity_columns(snapshot: TorrentSnapshot, activity_history: ActivityHistory, current_time_seconds: float):
+    """为快照中的任务写入一次活动采样 (距上次采样不足 ACTIVITY_SAMPLE_INTERVAL_SECONDS 的跳过)，并添加活动历史列。"""
+    rows = activity_history.record(
+        snapshot.hashes, {field: snapshot.numeric[field] for field in ("uploaded", "downloaded", "num_seeds",
+                                                                      "num_leechs")},
+        current_time_seconds, CONFIG["ACTIVITY_SAMPLE_INTERVAL_SECONDS"])
+    window_seconds = CONFIG["ACTIVITY_RATE_WINDOW_MINUTES"] * 60
+    for prefix, field, instant_column in (("upload", "uploaded", "upspeed"), ("download", "downloaded", "dlspeed")):
+        window_rate = activity_history.rolling_rate(rows, field, window_seconds)
+        snapshot.add_column(f"{prefix}_rate_window",
+                            np.where(np.isnan(window_rate), snapshot.numeric[instant_column], window_rate))
+        ewma_available = activity_history.count[rows] >= 2
+        snapshot.add_column(f"{prefix}_rate_ewma", np.where(ewma_available, activity_history.rate_ewma[field][rows],
+                                                            snapshot.numeric[instant_column]))
+    leechers_avg = activity_history.rolling_mean(rows, "num_leechs", window_seconds)
+    snapshot.add_column("leechers_window_avg",
+                        np.where(np.isnan(leechers_avg), snapshot.numeric["num_leechs"], leechers_avg))
+    active_leechers_avg = activity_history.rolling_mean(rows, "num_leechs", window_seconds,
+                                                        end_times=snapshot.numeric["last_activity"])
+    snapshot.add_column("leechers_active_window_avg",
+                        np.where(np.isnan(active_leechers_avg), snapshot.numeric["num_leechs"], active_leechers_avg))
+    snapshot.add_column("activity_history_minutes", activity_history.history_seconds(rows) / 60)
+
+
+def build_cleanup_snapshot(torrents, activity_history: ActivityHistory, current_time_seconds: float) -> TorrentSnapshot:
+    """为本轮的任务建立一次列式快照并添加活动历史列，规则评估、分享限制下推和磁盘驱逐共用这一快照。"""
+    snapshot = TorrentSnapshot(torrents, current_time_seconds, CONFIG)
+    add_activity_columns(snapshot, activity_history, current_time_seconds)
+    snapshot.add_column("share_limit_reached", get_share_limit_reached(snapshot, CONFIG))
+    return snapshot
+
+
+def evaluate_torrents(snapshot: TorrentSnapshot, monitoring_data: dict, deletion_queue: dict,
+                      current_time_seconds: float, actions_this_run: dict):
+    """
+    按 CLEANUP_RULES 批量评估任务：先在列式快照上用 NumPy 一次算出每个任务命中的规则，
+    再只对需要动作 (删除、监控、荣退) 或仍在监控数据中的任务逐个更新监控状态、放入删除队列。
+    返回需要恢复做种的任务 (由 resume_share_limited_torrents 处理)。
+    """
+    matched_rules = match_rules(COMPILED_CLEANUP_RULES, snapshot)
+
+    passive_rule_indexes = [i for i, rule in enumerate(CLEANUP_RULES) if rule["action"] in PASSIVE_RULE_ACTIONS]
+    passive_mask = np.isin(matched_rules, passive_rule_indexes) | (matched_rules < 0)
+    monitored_mask = np.fromiter((torrent_hash in monitoring_data for torrent_hash in snapshot.hashes), dtype=bool,
+                                 count=snapshot.size)
+    retiring_mask = np.fromiter(
+        (deletion_queue["items"].get(torrent_hash, {}).get("priority") == DELETE_PRIORITY_RETIREMENT
+         for torrent_hash in snapshot.hashes), dtype=bool, count=snapshot.size)
+    protected_count = int(np.count_nonzero(
+        np.isin(matched_rules, [i for i, rule in enumerate(CLEANUP_RULES) if rule["action"] == "protect"])))
+    if protected_count:
+        logger.info(f"⏭️ 跳过 {protected_count} 个受保护的任务 (新添加或做种中)。")
+
+    torrents_to_resume = []
+    for index in np.flatnonzero(~passive_mask | monitored_mask | retiring_mask):
+        torrent = snapshot.torrents[index]
+        rule = CLEANUP_RULES[matched_rules[index]] if matched_rules[index] >= 0 else None
+        action = rule["action"] if rule else "ignore"
+        is_freeleech = bool(snapshot.bools["is_freeleech"][index])
+
+        if retiring_mask[index] and action != "retire":
+            logger.info(f"🟢 删除队列中的 '{torrent.name}' ({torrent.hash}) 已不再满足荣退条件 "
+                        f"(命中规则〔{rule['name'] if rule else '无'}〕)，移出队列。")
+            del deletion_queue["items"][torrent.hash]
+
+        if action in PASSIVE_RULE_ACTIONS or action in ("delete_keep_files", "retire", "resume"):
+            # 受保护、非刷流、未分类及状态良好的任务都不应该在监控中
+            if torrent.hash in monitoring_data:
+                logger.info(f"🟢 任务 '{torrent.name}' ({torrent.hash}) 命中规则〔{rule['name'] if rule else '无'}〕"
+                            f" (状态 '{torrent.state}')，从监控列表中移除。")
+                del monitoring_data[torrent.hash]
+                actions_this_run["monitored_removed"] += 1
+
+        if action in ("delete_keep_files", "delete_with_files"):
+            delete_torrent_action(deletion_queue, torrent, delete_files=action == "delete_with_files",
+                                  dry_run=CONFIG["DRY_RUN"], reason=rule["reason"].format_map(torrent),
+                                  priority=rule["priority"], current_time_seconds=current_time_seconds)
+
+        elif action == "retire":
+            retirement_reason = get_retirement_reason(torrent, is_freeleech, current_time_seconds, CONFIG)
+            delete_torrent_action(deletion_queue, torrent, delete_files=True, dry_run=CONFIG["DRY_RUN"],
+                                  reason=retirement_reason or f"荣退: 命中规则〔{rule['name']}〕",
+                                  priority=DELETE_PRIORITY_RETIREMENT, current_time_seconds=current_time_seconds)
+
+        elif action == "resume":
+            torrents_to_resume.append(torrent)
+
+        elif action == "monitor":
+            effective_state = rule["monitor_state"]
+            if torrent.hash not in monitoring_data or monitoring_data[torrent.hash][
+                'monitored_state'] != effective_state:
+                logger.info(
+                    f"🔎 [新增监控] 任务 '{torrent.name}' ({torrent.hash}) 进入受监控状态: {effective_state} (FL: {is_freeleech}, 下载者: {torrent.num_leechs})")
+                monitoring_data[torrent.hash] = {
+                    "name": torrent.name,
+                    "monitored_state": effective_state,
+                    "first_seen_in_state_timestamp": current_time_seconds,
+                    "is_freeleech": is_freeleech,
+                }
+                actions_this_run["monitored_new"] += 1
+            else:
+                monitored_entry = monitoring_data[torrent.hash]
+                time_in_state_seconds = current_time_seconds - monitored_entry['first_seen_in_state_timestamp']
+                time_in_state_minutes = time_in_state_seconds / 60
+                actions_this_run["monitored_updated"] += 1
+
+                current_monitor_threshold_minutes = get_monitor_threshold_minutes(monitored_entry, torrent, CONFIG)
+                if time_in_state_minutes >= current_monitor_threshold_minutes:
+                    deletion_reason = f"处于状态 '{effective_state}' 已达 {time_in_state_minutes:.1f} 分钟 (阈值 {current_monitor_threshold_minutes} 分钟). FL: {is_freeleech}, 下载者: {torrent.num_leechs}."
+                    deletion_reason += (f" 近 {CONFIG['ACTIVITY_RATE_WINDOW_MINUTES']:.0f} 分钟平均上传 "
+                                        f"{format_size(snapshot.numeric['upload_rate_window'][index])}/s，"
+                                        f"下载 {format_size(snapshot.numeric['download_rate_window'][index])}/s。")
+                    delete_torrent_action(deletion_queue, torrent, delete_files=True, dry_run=CONFIG["DRY_RUN"],
+                                          reason=deletion_reason, priority=DELETE_PRIORITY_STALLED,
+                                          current_time_seconds=current_time_seconds)
+    return torrents_to_resume
+
+
+def get_next_evaluation_time(torrent, monitoring_data: dict, current_time_seconds: float) -> float | None:
+    """
+    返回任务下一次需要仅因时间流逝而重新评估的时间点 (守护模式使用)：
+    受监控任务达到删除阈值时，以及新添加任务满 24 小时离开保护期时。
+    """
+    trigger_times = []
+    protection_end = torrent.added_on + 24 * 60 * 60
+    if protection_end > current_time_seconds:
+        trigger_times.append(protection_end)
+    monitored_entry = monitoring_data.get(torrent.hash)
+    if monitored_entry:
+        threshold_minutes = get_monitor_threshold_minutes(monitored_entry, torrent, CONFIG)
+        trigger_times.append(monitored_entry['first_seen_in_state_timestamp'] + threshold_minutes * 60)
+    return min(trigger_times) if trigger_times else None
+
+
+def classify_tracker_health(trackers) -> tuple[str, str]:
+    """
+    根据任务的 Tracker 列表判断健康状况，返回 (状况, 说明)：
+    unregistered - Tracker 明确表示种子未注册/已被删除；working - 至少一个 Tracker 工作正常；
+    tracker_error - 所有 Tracker 都出错或超时；unknown - 尚未联系或正在更新等其他情况。
+    DHT / PeX / LSD 等伪 Tracker 条目不参与判断。
+    """
+    real_trackers = [tracker for tracker in trackers if not str(tracker.get("url", "")).startswith("** [")]
+    for tracker in real_trackers:
+        message = str(tracker.get("msg") or "")
+        if any(keyword in message.lower() for keyword in CONFIG["TRACKER_UNREGISTERED_KEYWORDS"]):
+            return "unregistered", message
+    if any(tracker.get("status") == TrackerStatus.WORKING.value for tracker in real_trackers):
+        return "working", ""
+    error_trackers = [tracker for tracker in real_trackers if tracker.get("status") in TRACKER_ERROR_STATUSES]
+    if real_trackers and len(error_trackers) == len(real_trackers):
+        return "tracker_error", "; ".join(str(tracker.get("msg") or "无响应") for tracker in error_trackers)
+    return "unknown", ""
+
+
+def fetch_trackers_concurrently(qb_client: Client, torrent_hashes: list, max_workers: int) -> dict:
+    """用有界线程池并发获取多个任务的 Tracker 列表，返回 {hash: Tracker 列表}，获取失败的任务不在结果中。"""
+    def fetch(torrent_hash):
+        return torrent_hash, qb_client.torrents_trackers(torrent_hash=torrent_hash)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tracker-check") as executor:
+        futures = [executor.submit(fetch, torrent_hash) for torrent_hash in torrent_hashes]
+        for future in as_completed(futures):
+            try:
+                torrent_hash, trackers = future.result()
+                results[torrent_hash] = trackers
+            except Exception as e:
+                logger.warning(f"⚠️ 获取 Tracker 列表失败: {e}")
+    return results
+
+
+def run_tracker_health_checks(qb_client: Client, torrents, monitoring_data: dict, deletion_queue: dict,
+                              current_time_seconds: float, actions_this_run: dict):
+    """
+    对受监控 (停滞) 的任务检查 Tracker 状态，区分“种子已无人需要”和“Tracker 出了问题”：
+    - Tracker 报告未注册的任务立即放入删除队列 (错误优先级)；
+    - 所有 Tracker 都出错的任务批量重新汇报 (reannounce)，并重新开始停滞计时，已因停滞入队的删除也撤回。
+      每个监控条目只重新汇报一次，之后若仍停滞则照常计时删除。
+    每轮最多检查 TRACKER_CHECK_MAX_PER_RUN 个任务 (停滞最久的优先)，同一任务在 TRACKER_CHECK_INTERVAL_MINUTES
+    内不重复检查，因此开销不随任务总数增长。
+    """
+    recheck_seconds = CONFIG["TRACKER_CHECK_INTERVAL_MINUTES"] * 60
+    candidates = [torrent for torrent in torrents
+                  if torrent.hash in monitoring_data and
+                  current_time_seconds - monitoring_data[torrent.hash].get("tracker_checked_at", 0) >= recheck_seconds]
+    if not candidates:
+        return
+    candidates.sort(key=lambda t: monitoring_data[t.hash]["first_seen_in_state_timestamp"])
+    candidates = candidates[:CONFIG["TRACKER_CHECK_MAX_PER_RUN"]]
+    torrents_by_hash = {torrent.hash: torrent for torrent in candidates}
+
+    check_start_time = time.perf_counter()
+    trackers_by_hash = fetch_trackers_concurrently(qb_client, list(torrents_by_hash.keys()),
+                                                   CONFIG["TRACKER_CHECK_WORKERS"])
+    logger.info(f"📡 已检查 {len(trackers_by_hash)}/{len(candidates)} 个受监控任务的 Tracker 状态，"
+                f"耗时 {time.perf_counter() - check_start_time:.2f} 秒。")
+
+    to_reannounce = []
+    for torrent_hash, trackers in trackers_by_hash.items():
+        torrent = torrents_by_hash[torrent_hash]
+        monitored_entry = monitoring_data.get(torrent_hash)
+        if monitored_entry is None:
+            continue
+        monitored_entry["tracker_checked_at"] = current_time_seconds
+        health, detail = classify_tracker_health(trackers)
+
+        if health == "unregistered":
+            delete_torrent_action(deletion_queue, torrent, delete_files=True, dry_run=CONFIG["DRY_RUN"],
+                                  reason=f"Tracker 报告种子未注册: {detail}", priority=DELETE_PRIORITY_ERROR,
+                                  current_time_seconds=current_time_seconds)
+            actions_this_run["tracker_unregistered"] += 1
+        elif health == "tracker_error" and "tracker_reannounced_at" not in monitored_entry:
+            logger.info(f"📡 任务 '{torrent.name}' ({torrent_hash}) 的 Tracker 均不可用 ({detail})，"
+                        f"停滞可能并非无人下载，将重新汇报并重新开始计时。")
+            monitored_entry["tracker_reannounced_at"] = current_time_seconds
+            monitored_entry["first_seen_in_state_timestamp"] = current_time_seconds
+            queued = deletion_queue["items"].get(torrent_hash)
+            if queued is not None and queued["priority"] == DELETE_PRIORITY_STALLED:
+                logger.info(f"↩️ 撤回对 '{torrent.name}' ({torrent_hash}) 的停滞删除，等待重新汇报后的结果。")
+                del deletion_queue["items"][torrent_hash]
+            to_reannounce.append(torrent_hash)
+
+    if not to_reannounce:
+        return
+    actions_this_run["tracker_reannounced"] += len(to_reannounce)
+    if CONFIG["DRY_RUN"]:
+        logger.info(f"[演习模式] 将批量重新汇报 {len(to_reannounce)} 个任务。")
+        return
+    try:
+        qb_client.torrents_reannounce(torrent_hashes=to_reannounce)
+        logger.info(f"📡 已批量重新汇报 {len(to_reannounce)} 个任务。")
+    except Exception as e:
+        logger.error(f"💥 批量重新汇报失败: {e}")
+
+
+def finish_cleanup_pass(qb, snapshot: TorrentSnapshot, current_qbit_hashes: set, monitoring_data: dict,
+                        deletion_queue: dict, current_time_seconds: float, actions_this_run: dict,
+                        telegram_report_items: list, run_eviction: bool = True, free_space: int | None = None):
+    """
+    评估结束后的收尾：磁盘驱逐、按预算执行删除队列、清理过时监控条目并保存所有状态文件。
+    run_eviction 时 snapshot 须包含全部任务。
+    """
+    if CONFIG["EVICTION_ENABLED"] and run_eviction and free_space is None:
+        free_space = get_free_disk_space(qb)
+    prune_deletion_queue(deletion_queue, current_qbit_hashes, monitoring_data, free_space, CONFIG)
+
+    if CONFIG["EVICTION_ENABLED"] and run_eviction:
+        run_disk_pressure_eviction(qb, snapshot, deletion_queue, current_time_seconds, CONFIG, free_space=free_space)
+
+    # 主循环只做决定 (入队)，此处按删除预算取出最紧急的一批，按 delete_files 分组批量提交，再按结果更新统计和监控数据
+    released_deletions = release_deletions(deletion_queue, current_time_seconds, CONFIG)
+    if released_deletions:
+        deletion_results = flush_pending_deletions(qb, released_deletions, CONFIG["DRY_RUN"],
+                                                   CONFIG["DELETE_BATCH_SIZE"])
+        apply_deletion_results(released_deletions, deletion_results, deletion_queue, monitoring_data,
+                               actions_this_run, telegram_report_items, CONFIG["DRY_RUN"])
+    actions_this_run["deferred"] = len(deletion_queue["items"])
+    actions_this_run["deferred_bytes"] = sum(d["disk_bytes"] for d in deletion_queue["items"].values())
+    if CONFIG["DRY_RUN"]:
+        logger.info("🏜️ 演习模式下不保存删除队列。")
+    else:
+        save_monitoring_data(CONFIG["DELETE_QUEUE_FILE_PATH"], deletion_queue)
+
+    # 清理监控数据中已不存在于 qBittorrent 的任务条目
+    hashes_to_remove_from_monitor = set(monitoring_data.keys()) - current_qbit_hashes
+    if hashes_to_remove_from_monitor:
+        for h_to_remove in hashes_to_remove_from_monitor:
+            entry_name = monitoring_data.pop(h_to_remove, {}).get('name', '未知任务(已消失)')
+            logger.info(f"🧹 清理过时监控条目: '{entry_name}' ({h_to_remove}) (任务不再存在于 qBittorrent)。")
+            actions_this_run["monitored_removed"] += 1
+
+    save_monitoring_data(CONFIG["MONITOR_FILE_PATH"], monitoring_data)
+
+
+def log_run_summary(actions_this_run: dict):
+    logger.info("📊 --- 本轮运行摘要 ---")
+    logger.info(f"成功删除任务: {actions_this_run['deleted']} 个 (其中自动荣退: {actions_this_run['retired']} 个)")
+    logger.info(
+        f"监控状态 - 新增: {actions_this_run['monitored_new']}, 更新检查: {actions_this_run['monitored_updated']}, 移除: {actions_this_run['monitored_removed']}")
+    if actions_this_run["tracker_unregistered"] or actions_this_run["tracker_reannounced"]:
+        logger.info(f"Tracker 检查 - 未注册: {actions_this_run['tracker_unregistered']}, "
+                    f"重新汇报: {actions_this_run['tracker_reannounced']}")
+    if actions_this_run["share_limits_set"] or actions_this_run["share_limits_extended"]:
+        logger.info(f"分享限制下推: {actions_this_run['share_limits_set']} 个任务, "
+                    f"因仍有需求延长限制并恢复做种: {actions_this_run['share_limits_extended']} 个任务")
+    if actions_this_run["deferred"]:
+        logger.info(f"删除队列中等待预算: {actions_this_run['deferred']} 个, "
+                    f"待释放 {format_size(actions_this_run['deferred_bytes'])}")
+    if actions_this_run["evicted"]:
+        logger.info(f"磁盘驱逐: {actions_this_run['evicted']} 个, 释放 {format_size(actions_this_run['evicted_bytes'])}, "
+                    f"损失上传速率约 {format_size(actions_this_run['evicted_upload_rate'])}/s")
+
+
+def new_run_actions() -> dict:
+    return {"deleted": 0, "retired": 0, "monitored_new": 0, "monitored_updated": 0, "monitored_removed": 0,
+            "evicted": 0, "evicted_bytes": 0, "evicted_upload_rate": 0.0, "deferred": 0, "deferred_bytes": 0,
+            "tracker_unregistered": 0, "tracker_reannounced": 0, "share_limits_set": 0,
+            "share_limits_extended": 0}
+
+
 def main():
     script_start_time = time.perf_counter()
     setup_logging()
@@ -279,10 +1149,13 @@ def main():
         logger.warning("🏜️ 演习模式 (DRY_RUN) 已激活。脚本将不会对 qBittorrent 进行任何实际更改。")
 
     monitoring_data = load_monitoring_data(CONFIG["MONITOR_FILE_PATH"])
+    deletion_queue = new_deletion_queue() if CONFIG["DRY_RUN"] else load_deletion_queue(CONFIG["DELETE_QUEUE_FILE_PATH"])
+    activity_history = ActivityHistory.load(CONFIG["ACTIVITY_HISTORY_FILE_PATH"], CONFIG["ACTIVITY_HISTORY_SAMPLES"],
+                                            CONFIG["ACTIVITY_EWMA_TAU_MINUTES"] * 60)
     qb = connect_qbittorrent(CONFIG)
     telegram_report_items = []
 
-    actions_this_run = {"deleted": 0, "retired": 0, "monitored_new": 0, "monitored_updated": 0, "monitored_removed": 0}
+    actions_this_run = new_run_actions()
 
     if not qb:
         logger.critical("🚫 无法连接到 qBittorrent。脚本终止。")
@@ -311,200 +1184,21 @@ def main():
 
     current_time_seconds = time.time()
 
-    for torrent in torrents:
-        # --- BEGIN MODIFICATION ---
-        # 新增的最高优先级跳过条件
-
-        # 条件1: 任务添加时间少于24小时
-        # torrent.added_on 是任务添加时的 Unix 时间戳 (单位: 秒)
-        time_since_added_seconds = current_time_seconds - torrent.added_on
-        is_recently_added = time_since_added_seconds < (24 * 60 * 60)  # 24小时的秒数
-
-        # 条件2: 任务状态为“做种中”
-        # "做种中" (Seeding) 通常包括以下状态:
-        # - TorrentStates.UPLOADING: 正在上传
-        # - TorrentStates.FORCED_UPLOAD: 强制上传
-        # - TorrentStates.STALLED_UPLOAD: 停止上传/做种 (已完成)
-        seeding_states = [
-            TorrentStates.UPLOADING,
-            TorrentStates.FORCED_UPLOAD,
-            TorrentStates.STALLED_UPLOAD  # 通常表示已完成下载，等待上传机会
-        ]
-        is_in_seeding_state = torrent.state_enum in seeding_states
-
-        if is_recently_added or is_in_seeding_state:
-            reasons_to_skip = []
-            if is_recently_added:
-                hours_since_added = time_since_added_seconds / 3600
-                reasons_to_skip.append(f"添加时间少于24小时 (已添加 {hours_since_added:.1f} 小时)")
-            if is_in_seeding_state:
-                reasons_to_skip.append(f"状态为〔做种中〕: {torrent.state}")
-            
-            logger.info(f"⏭️ 跳过任务 '{torrent.name}' ({torrent.hash}): {'; '.join(reasons_to_skip)}.")
-            
-            # 如果此任务之前在监控数据中，将其移除，因为它现在被优先跳过处理
-            if torrent.hash in monitoring_data:
-                logger.debug(f"➖ 由于优先跳过，从监控列表移除任务 '{torrent.name}' ({torrent.hash}).")
-                del monitoring_data[torrent.hash]
-                actions_this_run["monitored_removed"] += 1 # 确保 actions_this_run 已定义
-            
-            continue  # 跳到 torrents 循环中的下一个任务
-        # --- END MODIFICATION ---
-
-        category_type, is_freeleech = get_torrent_type_and_freeleech(torrent, CONFIG)
-        torrent_handled_this_cycle = False
-
-        if category_type == "non_brushing":
-            if torrent.state_enum in (TorrentStates.ERROR, TorrentStates.MISSING_FILES, TorrentStates.UNKNOWN):
-                reason = f"非刷流任务处于错误状态 '{torrent.state}'"
-                if delete_torrent_action(qb, torrent.hash, torrent.name, delete_files=False, dry_run=CONFIG["DRY_RUN"],
-                                         reason=reason, tg_report_list=telegram_report_items):
-                    actions_this_run["deleted"] += 1
-                    torrent_handled_this_cycle = True
-            if torrent.hash in monitoring_data: # 即使没有错误，非刷流任务也不应该在监控中
-                logger.info(f"ℹ️ 非刷流任务 '{torrent.name}' ({torrent.hash}) 存在于监控数据中，将被移除。")
-                del monitoring_data[torrent.hash]
-                actions_this_run["monitored_removed"] += 1
-
-        elif category_type == "brushing":
-            if torrent.state_enum in (TorrentStates.ERROR, TorrentStates.MISSING_FILES, TorrentStates.UNKNOWN):
-                reason = f"刷流任务处于严重错误状态 '{torrent.state}'"
-                if delete_torrent_action(qb, torrent.hash, torrent.name, delete_files=True, dry_run=CONFIG["DRY_RUN"],
-                                         reason=reason, tg_report_list=telegram_report_items):
-                    actions_this_run["deleted"] += 1
-                    if torrent.hash in monitoring_data:
-                        del monitoring_data[torrent.hash]
-                        actions_this_run["monitored_removed"] += 1
-                continue # 严重错误的任务处理完后直接跳到下一个任务
-
-            effective_state = None
-            # 注意: 此处的 STALLED_UPLOAD 是指任务完成下载后的做种停滞，与上面跳过条件中的 is_in_seeding_state 不同
-            # is_in_seeding_state 用于初始跳过，这里的 effective_state 用于监控那些 *不活跃* 的做种任务
-            if torrent.state_enum == TorrentStates.STALLED_UPLOAD: # 明确指做种停滞
-                 effective_state = TorrentStates.STALLED_UPLOAD.value # 使用 .value 获取字符串表示
-            elif torrent.state_enum == TorrentStates.PAUSED_UPLOAD: # 明确指做种暂停
-                 effective_state = TorrentStates.PAUSED_UPLOAD.value
-            elif torrent.state_enum == TorrentStates.UPLOADING and torrent.upspeed == 0:
-                effective_state = STATE_UPLOADING_ZERO_SPEED
-            elif torrent.state_enum == TorrentStates.STALLED_DOWNLOAD and torrent.progress < 1:
-                effective_state = TorrentStates.STALLED_DOWNLOAD.value
-            elif torrent.state_enum == TorrentStates.DOWNLOADING and torrent.downspeed == 0 and torrent.progress < 1:
-                effective_state = STATE_DOWNLOADING_ZERO_SPEED
-            # 注意：TorrentStates.STOPPED_UPLOAD 在原脚本中是 STALLED_UPLOAD, PAUSED_UPLOAD, STOPPED_UPLOAD
-            # qbittorrentapi TorrentStates 没有 STOPPED_UPLOAD，可能是笔误或旧版API。
-            # 假设原意是包含已暂停上传的状态，PAUSED_UPLOAD 已经覆盖。
-
-            if effective_state:
-                if torrent.hash not in monitoring_data or monitoring_data[torrent.hash][
-                    'monitored_state'] != effective_state:
-                    logger.info(
-                        f"🔎 [新增监控] 任务 '{torrent.name}' ({torrent.hash}) 进入受监控状态: {effective_state} (FL: {is_freeleech}, 下载者: {torrent.num_leechs})")
-                    monitoring_data[torrent.hash] = {
-                        "name": torrent.name,
-                        "monitored_state": effective_state,
-                        "first_seen_in_state_timestamp": current_time_seconds,
-                        "is_freeleech": is_freeleech,
-                    }
-                    actions_this_run["monitored_new"] += 1
-                else:
-                    monitored_entry = monitoring_data[torrent.hash]
-                    time_in_state_seconds = current_time_seconds - monitored_entry['first_seen_in_state_timestamp']
-                    time_in_state_minutes = time_in_state_seconds / 60
-                    actions_this_run["monitored_updated"] += 1
-
-                    should_delete_based_on_monitoring = False
-                    deletion_reason = ""
-                    current_monitor_threshold_minutes = CONFIG["USELESS_STATE_MONITOR_DURATION_MINUTES"]
-
-                    # 检查 effective_state 是否是表示做种停滞的状态
-                    if effective_state in (TorrentStates.STALLED_UPLOAD.value, STATE_UPLOADING_ZERO_SPEED, TorrentStates.PAUSED_UPLOAD.value):
-                        if monitored_entry['is_freeleech']:
-                            if torrent.num_leechs == 0: # 仅当没有下载者时，FL任务的停滞才使用更长的监控时间
-                                current_monitor_threshold_minutes = CONFIG[
-                                    "FREELEECH_STALLED_NO_LEECHERS_MONITOR_DURATION_MINUTES"]
-                        elif torrent.num_leechs > 0: # 非FL任务，如果有下载者但仍然停滞
-                            current_monitor_threshold_minutes = CONFIG["STALLED_WITH_LEECHERS_MONITOR_DURATION_MINUTES"]
-                        # 如果是非FL任务且无下载者，或者FL任务有下载者，则使用默认的 USELESS_STATE_MONITOR_DURATION_MINUTES
-
-                    if time_in_state_minutes >= current_monitor_threshold_minutes:
-                        should_delete_based_on_monitoring = True
-                        deletion_reason = f"处于状态 '{effective_state}' 已达 {time_in_state_minutes:.1f} 分钟 (阈值 {current_monitor_threshold_minutes} 分钟). FL: {is_freeleech}, 下载者: {torrent.num_leechs}."
-
-                    if should_delete_based_on_monitoring:
-                        if delete_torrent_action(qb, torrent.hash, torrent.name, delete_files=True,
-                                                 dry_run=CONFIG["DRY_RUN"], reason=deletion_reason,
-                                                 tg_report_list=telegram_report_items):
-                            actions_this_run["deleted"] += 1
-                            torrent_handled_this_cycle = True
-                            del monitoring_data[torrent.hash]
-                            actions_this_run["monitored_removed"] += 1
-            else: # 任务状态良好 (不是上述定义的 effective_state)
-                if torrent.hash in monitoring_data:
-                    logger.info(f"🟢 任务 '{torrent.name}' ({torrent.hash}) 当前状态 '{torrent.state}' 良好或不符合监控条件。从监控列表中移除。")
-                    del monitoring_data[torrent.hash]
-                    actions_this_run["monitored_removed"] += 1
-
-                # 只有在任务未因监控被删除，且状态良好时，才考虑荣退逻辑
-                # 并且，荣退逻辑只针对正在上传或强制上传的任务 (即活跃的做种任务)
-                if not torrent_handled_this_cycle and torrent.state_enum in (TorrentStates.UPLOADING,
-                                                                             TorrentStates.FORCED_UPLOAD):
-                    seeding_time_days = torrent.seeding_time / (60 * 60 * 24) if torrent.seeding_time else 0
-                    last_activity_days_ago = (current_time_seconds - torrent.last_activity) / (
-                            60 * 60 * 24) if torrent.last_activity > 0 else float('inf')
-
-                    attempt_retirement = False
-                    retirement_reason = ""
-
-                    if not is_freeleech:
-                        if (torrent.ratio >= CONFIG["RETIREMENT_MIN_RATIO"] and
-                                torrent.num_leechs <= CONFIG["RETIREMENT_LOW_DEMAND_LEECHERS"] and
-                                seeding_time_days >= CONFIG["RETIREMENT_MIN_SEEDING_DAYS"]):
-                            attempt_retirement = True
-                            retirement_reason = (
-                                f"荣退: 分享率 {torrent.ratio:.2f} (>{CONFIG['RETIREMENT_MIN_RATIO']}), "
-                                f"下载者 {torrent.num_leechs} (<{CONFIG['RETIREMENT_LOW_DEMAND_LEECHERS']}), "
-                                f"做种 {seeding_time_days:.1f} 天 (>{CONFIG['RETIREMENT_MIN_SEEDING_DAYS']})")
-                        elif (seeding_time_days >= CONFIG["RETIREMENT_MAX_SEEDING_DAYS_NO_ACTIVITY_NON_FL"] and
-                              torrent.num_leechs <= CONFIG["RETIREMENT_NO_ACTIVITY_LEECHER_THRESHOLD_NON_FL"] and
-                              last_activity_days_ago >= CONFIG["RETIREMENT_NO_ACTIVITY_LAST_ACTIVE_DAYS_NON_FL"]):
-                            attempt_retirement = True
-                            retirement_reason = (
-                                f"荣退 (非FL): 做种 {seeding_time_days:.1f} 天 (>{CONFIG['RETIREMENT_MAX_SEEDING_DAYS_NO_ACTIVITY_NON_FL']}), "
-                                f"下载者 {torrent.num_leechs} (<{CONFIG['RETIREMENT_NO_ACTIVITY_LEECHER_THRESHOLD_NON_FL']}), "
-                                f"最后活动于 {last_activity_days_ago:.1f} 天前 (>{CONFIG['RETIREMENT_NO_ACTIVITY_LAST_ACTIVE_DAYS_NON_FL']})")
-                    if attempt_retirement:
-                        if delete_torrent_action(qb, torrent.hash, torrent.name, delete_files=True,
-                                                 dry_run=CONFIG["DRY_RUN"], reason=retirement_reason,
-                                                 tg_report_list=telegram_report_items):
-                            actions_this_run["deleted"] += 1
-                            actions_this_run["retired"] += 1
-                            # 如果因荣退被删除，且仍在监控中（理论上不应该，因为状态良好时会先移除），也移除
-                            if torrent.hash in monitoring_data:
-                                del monitoring_data[torrent.hash]
-                                actions_this_run["monitored_removed"] += 1
-                            # torrent_handled_this_cycle = True # 标记已处理，避免后续逻辑 (虽然荣退是最后一步)
-
-        elif category_type == "unclassified":
-            logger.debug(f"ℹ️ 任务 '{torrent.name}' ({torrent.hash}) 未分类。跳过详细处理逻辑。")
-            if torrent.hash in monitoring_data: # 未分类任务也不应该在监控中
-                logger.info(f"ℹ️ 未分类任务 '{torrent.name}' ({torrent.hash}) 存在于监控数据中，将被移除。")
-                del monitoring_data[torrent.hash]
-                actions_this_run["monitored_removed"] += 1
-
-    # 清理监控数据中已不存在于 qBittorrent 的任务条目
-    hashes_to_remove_from_monitor = set(monitoring_data.keys()) - current_qbit_hashes
-    if hashes_to_remove_from_monitor:
-        for h_to_remove in hashes_to_remove_from_monitor:
-            entry_name = monitoring_data.pop(h_to_remove, {}).get('name', '未知任务(已消失)')
-            logger.info(f"🧹 清理过时监控条目: '{entry_name}' ({h_to_remove}) (任务不再存在于 qBittorrent)。")
-            actions_this_run["monitored_removed"] += 1
-
-    save_monitoring_data(CONFIG["MONITOR_FILE_PATH"], monitoring_data)
-
-    logger.info("📊 --- 本轮运行摘要 ---")
-    logger.info(f"成功删除任务: {actions_this_run['deleted']} 个 (其中自动荣退: {actions_this_run['retired']} 个)")
-    logger.info(
-        f"监控状态 - 新增: {actions_this_run['monitored_new']}, 更新检查: {actions_this_run['monitored_updated']}, 移除: {actions_this_run['monitored_removed']}")
+    snapshot = build_cleanup_snapshot(torrents, activity_history, current_time_seconds)
+    if CONFIG["SHARE_LIMITS_ENABLED"]:
+        push_share_limits(qb, snapshot, actions_this_run)
+    torrents_to_resume = evaluate_torrents(snapshot, monitoring_data, deletion_queue, current_time_seconds,
+                                           actions_this_run)
+    resume_share_limited_torrents(qb, torrents_to_resume, actions_this_run)
+    if CONFIG["TRACKER_CHECK_ENABLED"]:
+        run_tracker_health_checks(qb, torrents, monitoring_data, deletion_queue, current_time_seconds,
+                                  actions_this_run)
+
+    finish_cleanup_pass(qb, snapshot, current_qbit_hashes, monitoring_data, deletion_queue, current_time_seconds,
+                        actions_this_run, telegram_report_items)
+    activity_history.retain(current_qbit_hashes)
+    activity_history.save(CONFIG["ACTIVITY_HISTORY_FILE_PATH"])
+    log_run_summary(actions_this_run)
 
     send_telegram_notification(CONFIG, telegram_report_items, actions_this_run)
 
@@ -514,6 +1208,139 @@ def main():
     logger.info(f"🎉 ===== 脚本执行完毕，耗时 {time.perf_counter() - script_start_time:.2f} 秒。 =====")
 
 
+def apply_maindata_delta(torrent_table: dict, maindata, qb_client: Client) -> set:
+    """
+    将 sync_maindata 返回的 (增量) 数据合并进本地任务表，返回新增任务以及状态、速度、连接数、标签、分类或进度
+    发生变化、需要重新评估的任务哈希。增量中只包含变化的字段，因此字段出现即视为变化。
+    """
+    changed_hashes = set()
+    if maindata.get("full_update"):
+        torrent_table.clear()
+    for torrent_hash, delta in (maindata.get("torrents") or {}).items():
+        torrent = torrent_table.get(torrent_hash)
+        if torrent is None:
+            torrent_table[torrent_hash] = TorrentDictionary(data={**delta, "hash": torrent_hash}, client=qb_client)
+            changed_hashes.add(torrent_hash)
+            continue
+        if any(field in delta for field in DAEMON_REEVALUATE_FIELDS):
+            changed_hashes.add(torrent_hash)
+        torrent.update(delta)
+    for torrent_hash in maindata.get("torrents_removed") or []:
+        torrent_table.pop(torrent_hash, None)
+        changed_hashes.discard(torrent_hash)
+    return changed_hashes
+
+
+def run_daemon():
+    """
+    守护模式：常驻运行，用 sync_maindata 的 rid 增量维护本地任务表，每个周期只重新评估发生变化的任务，
+    以及监控计时到期、新任务保护期结束等时间触发的任务。每隔 DAEMON_FULL_EVAL_MINUTES 做一次全量评估
+    (覆盖分享率、做种时间等缓慢变化的条件) 并执行磁盘驱逐；Telegram 报告按 DAEMON_REPORT_INTERVAL_MINUTES 汇总发送。
+    """
+    setup_logging()
+    logger.info(f"🏁 ===== qBittorrent 智能清理守护进程 (v{datetime.now().strftime('%Y%m%d.%H%M')}) 启动 =====")
+    if CONFIG["DRY_RUN"]:
+        logger.warning("🏜️ 演习模式 (DRY_RUN) 已激活。脚本将不会对 qBittorrent 进行任何实际更改。")
+
+    monitoring_data = load_monitoring_data(CONFIG["MONITOR_FILE_PATH"])
+    deletion_queue = new_deletion_queue() if CONFIG["DRY_RUN"] else load_deletion_queue(CONFIG["DELETE_QUEUE_FILE_PATH"])
+    activity_history = ActivityHistory.load(CONFIG["ACTIVITY_HISTORY_FILE_PATH"], CONFIG["ACTIVITY_HISTORY_SAMPLES"],
+                                            CONFIG["ACTIVITY_EWMA_TAU_MINUTES"] * 60)
+    qb = connect_qbittorrent(CONFIG)
+    if not qb:
+        logger.critical("🚫 无法连接到 qBittorrent。守护进程终止。")
+        return
+
+    torrent_table = {}
+    server_state = {}
+    rid = 0
+    trigger_heap = []
+    scheduled_triggers = {}
+    last_full_eval_time = 0.0
+    last_report_time = time.time()
+    actions_this_period = new_run_actions()
+    telegram_report_items = []
+
+    try:
+        while True:
+            tick_start_time = time.perf_counter()
+            try:
+                maindata = qb.sync_maindata(rid=rid)
+            except Exception as e:
+                logger.error(f"💥 获取 sync_maindata 失败: {e}。下个周期将重新全量同步。")
+                rid = 0
+                time.sleep(CONFIG["DAEMON_INTERVAL_SECONDS"])
+                continue
+
+            rid = maindata.get("rid", 0)
+            if maindata.get("full_update"):
+                logger.info(f"🔄 收到全量同步数据 (rid={rid})，共 {len(maindata.get('torrents') or {})} 个任务。")
+                trigger_heap.clear()
+                scheduled_triggers.clear()
+            dirty_hashes = apply_maindata_delta(torrent_table, maindata, qb)
+            server_state.update(maindata.get("server_state") or {})
+
+            current_time_seconds = time.time()
+            while trigger_heap and trigger_heap[0][0] <= current_time_seconds:
+                trigger_time, torrent_hash = heapq.heappop(trigger_heap)
+                if scheduled_triggers.get(torrent_hash) == trigger_time:
+                    del scheduled_triggers[torrent_hash]
+                    dirty_hashes.add(torrent_hash)
+
+            full_eval = current_time_seconds - last_full_eval_time >= CONFIG["DAEMON_FULL_EVAL_MINUTES"] * 60
+            if full_eval:
+                dirty_hashes = set(torrent_table.keys())
+                last_full_eval_time = current_time_seconds
+
+            # 全量评估时快照包含全部任务，分享限制下推和磁盘驱逐只在此时运行
+            dirty_torrents = [torrent_table[h] for h in dirty_hashes if h in torrent_table]
+            snapshot = build_cleanup_snapshot(dirty_torrents, activity_history, current_time_seconds)
+            if full_eval and CONFIG["SHARE_LIMITS_ENABLED"]:
+                push_share_limits(qb, snapshot, actions_this_period)
+            torrents_to_resume = evaluate_torrents(snapshot, monitoring_data, deletion_queue, current_time_seconds,
+                                                   actions_this_period)
+            resume_share_limited_torrents(qb, torrents_to_resume, actions_this_period)
+            if CONFIG["TRACKER_CHECK_ENABLED"]:
+                run_tracker_health_checks(qb, dirty_torrents, monitoring_data, deletion_queue, current_time_seconds,
+                                          actions_this_period)
+            for torrent in dirty_torrents:
+                torrent_hash = torrent.hash
+                next_time = get_next_evaluation_time(torrent, monitoring_data, current_time_seconds)
+                if next_time is not None and scheduled_triggers.get(torrent_hash) != next_time:
+                    scheduled_triggers[torrent_hash] = next_time
+                    heapq.heappush(trigger_heap, (next_time, torrent_hash))
+
+            finish_cleanup_pass(qb, snapshot, set(torrent_table.keys()), monitoring_data, deletion_queue,
+                                current_time_seconds, actions_this_period, telegram_report_items,
+                                run_eviction=full_eval,
+                                free_space=server_state.get("free_space_on_disk"))
+            if full_eval:
+                activity_history.retain(set(torrent_table.keys()))
+                activity_history.save(CONFIG["ACTIVITY_HISTORY_FILE_PATH"])
+            tick_elapsed = time.perf_counter() - tick_start_time
+            logger.debug(f"⏱️ 本周期重新评估 {len(dirty_hashes)}/{len(torrent_table)} 个任务 "
+                         f"(全量: {full_eval})，耗时 {tick_elapsed:.3f} 秒。")
+
+            if current_time_seconds - last_report_time >= CONFIG["DAEMON_REPORT_INTERVAL_MINUTES"] * 60:
+                log_run_summary(actions_this_period)
+                send_telegram_notification(CONFIG, telegram_report_items, actions_this_period)
+                actions_this_period = new_run_actions()
+                telegram_report_items = []
+                last_report_time = current_time_seconds
+
+            time.sleep(max(CONFIG["DAEMON_INTERVAL_SECONDS"] - tick_elapsed, 0))
+    except KeyboardInterrupt:
+        logger.info("🛑 收到中断信号，保存状态后退出守护进程。")
+        save_monitoring_data(CONFIG["MONITOR_FILE_PATH"], monitoring_data)
+        if not CONFIG["DRY_RUN"]:
+            save_monitoring_data(CONFIG["DELETE_QUEUE_FILE_PATH"], deletion_queue)
+        activity_history.save(CONFIG["ACTIVITY_HISTORY_FILE_PATH"])
+        log_run_summary(actions_this_period)
+
+
 if __name__ == "__main__":
-    main()
+    if "--daemon" in sys.argv[1:]:
+        run_daemon()
+    else:
+        main()
 
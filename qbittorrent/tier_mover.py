@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+qBittorrent 分层存储迁移
+
+`tasks_cleanup.py` 只保护非刷流任务 (电影、电视剧等分类) 的文件，从不动它们；即使它们放在刷流用的快速磁盘上、
+长期没有任何上传，也一直占用着刷流需要的空间。本脚本把这类“冷”任务用 `torrents_set_location`
+迁移到慢速存储 (TIER_SLOW_PATH)，让快速磁盘 (TIER_FAST_PATH) 只保留仍然活跃的任务。
+
+1.  迁移策略以声明式规则 (TIER_RULES) 描述，与清理规则共用 cleanup_rules.py 的规则引擎和任务分类；
+    默认只迁移已完成、最近 TIER_COLD_LAST_ACTIVITY_DAYS 天没有活动、且近期平均上传低于 TIER_COLD_UPLOAD_RATE_KIB 的非刷流任务。
+2.  近期上传速率取自 `tasks_cleanup.py` 维护的活动历史 (只读)，没有历史的任务退回使用当前上传速度。
+3.  迁移限速：同时进行中的迁移不超过 TIER_MAX_CONCURRENT_MOVES 个；每次运行最多发起 TIER_MAX_MOVES_PER_RUN 个、
+    合计 TIER_MAX_GB_PER_RUN GB 的迁移，最冷的任务优先。可设置 TIER_TRIGGER_FREE_GB，只在快速磁盘剩余空间低于该值时迁移。
+4.  迁移在 qBittorrent 中异步进行，发起的迁移记录在 TIER_MOVES_FILE_PATH 中，之后的运行据此统计已完成迁移的数据量
+    和快速磁盘获得的剩余空间。
+5.  目标路径保留任务在快速磁盘上的相对目录结构，例如 /fast/电影/xxx 迁移到 /slow/电影/xxx。
+    注意 qBittorrent 在手动设置保存位置后会关闭该任务的自动种子管理 (ATM)。
+
+支持 DRY_RUN (演习模式)。适合通过 cron 定时运行，例如每 30 分钟一次。
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+from qbittorrentapi import TorrentStates
+
+from activity_history import ActivityHistory
+from cleanup_rules import TorrentSnapshot, compile_rules, match_rules, TYPE_NON_BRUSHING
+from tasks_cleanup import CONFIG as CLEANUP_CONFIG, connect_qbittorrent, format_size, get_free_disk_space
+
+CONFIG = {
+    **CLEANUP_CONFIG,
+
+    "TIER_FAST_PATH": os.environ.get('TIER_FAST_PATH', os.path.dirname(
+        os.environ.get('QBIT_SAVE_PATH', "/vol1/1000/Media/MTBrush").rstrip('/'))),
+    "TIER_SLOW_PATH": os.environ.get('TIER_SLOW_PATH', ""),
+    "TIER_MOVES_FILE_PATH": Path(os.environ.get('TIER_MOVES_FILE_PATH', "mteam/tier_moves.json")),
+    "TIER_COLD_LAST_ACTIVITY_DAYS": float(os.environ.get('TIER_COLD_LAST_ACTIVITY_DAYS', '7')),
+    "TIER_COLD_UPLOAD_RATE": float(os.environ.get('TIER_COLD_UPLOAD_RATE_KIB', '5')) * 1024,
+    "TIER_RATE_WINDOW_MINUTES": float(os.environ.get('TIER_RATE_WINDOW_MINUTES', '180')),
+    "TIER_TRIGGER_FREE_GB": float(os.environ.get('TIER_TRIGGER_FREE_GB', '0')),
+    "TIER_MAX_CONCURRENT_MOVES": int(os.environ.get('TIER_MAX_CONCURRENT_MOVES', '1')),
+    "TIER_MAX_MOVES_PER_RUN": int(os.environ.get('TIER_MAX_MOVES_PER_RUN', '2')),
+    "TIER_MAX_GB_PER_RUN": float(os.environ.get('TIER_MAX_GB_PER_RUN', '200')),
+    "TIER_SLOW_MIN_FREE_GB": float(os.environ.get('TIER_SLOW_MIN_FREE_GB', '50')),
+}
+
+# 这些状态的任务不发起迁移 (正在迁移、校验或出错的任务由 qBittorrent 或 tasks_cleanup 处理)
+UNMOVABLE_STATES = [TorrentStates.MOVING.value, TorrentStates.CHECKING_UPLOAD.value,
+                    TorrentStates.CHECKING_DOWNLOAD.value, TorrentStates.CHECKING_RESUME_DATA.value,
+                    TorrentStates.ERROR.value, TorrentStates.MISSING_FILES.value]
+
+# 迁移规则，按顺序匹配，命中第一条满足全部条件的规则；未命中任何规则的任务留在原处
+TIER_RULES = [
+    {"name": "只迁移非刷流任务", "action": "stay", "when": [("type", "!=", TYPE_NON_BRUSHING)]},
+    {"name": "尚未下载完成", "action": "stay", "when": [("progress", "<", 1)]},
+    {"name": "正在迁移、校验或出错", "action": "stay", "when": [("state", "in", UNMOVABLE_STATES)]},
+    {"name": "近期仍有上传", "action": "stay", "when": [("upload_rate_window", ">=", "$TIER_COLD_UPLOAD_RATE")]},
+    {"name": "长期不活跃的冷任务", "action": "move",
+     "when": [("last_activity_days", ">=", "$TIER_COLD_LAST_ACTIVITY_DAYS")]},
+]
+
+logger = logging.getLogger("qb_tier_mover")
+
+COMPILED_TIER_RULES = compile_rules(TIER_RULES, CONFIG)
+
+
+def setup_logging():
+    log_level_val = getattr(logging, CONFIG["LOG_LEVEL"], logging.INFO)
+    logging.basicConfig(
+        level=log_level_val,
+        format='%(asctime)s - %(levelname)s - %(name)s - [%(funcName)s] - %(message)s',
+        handlers=[logging.StreamHandler()]
+    )
+    logging.getLogger('qbittorrentapi').setLevel(logging.INFO if log_level_val <= logging.INFO else log_level_val)
+
+
+def is_under(path: str, root: str) -> bool:
+    path, root = os.path.normpath(path), os.path.normpath(root)
+    return path == root or path.startswith(root + os.sep)
+
+
+def load_move_state(filepath: Path) -> dict:
+    if filepath.exists():
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            state.setdefault("moves", {})
+            return state
+        except (json.JSONDecodeError, IOError) as e:
+            logger.warning(f"⚠️ 无法加载或解析迁移记录文件 {filepath}: {e}。将以空记录开始。")
+    return {"moves": {}, "last_free_space": None}
+
+
+def save_move_state(filepath: Path, state: dict):
+    try:
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, ensure_ascii=False)
+        logger.debug(f"💾 迁移记录已保存至 {filepath}")
+    except IOError as e:
+        logger.error(f"💥 保存迁移记录至 {filepath} 失败: {e}")
+
+
+def check_pending_moves(torrents_by_hash: dict, move_state: dict) -> tuple[list, int]:
+    """检查之前发起的迁移，返回 (本轮确认完成的迁移记录, 仍在进行中的迁移数)。"""
+    completed, in_progress = [], 0
+    for torrent_hash, move in list(move_state["moves"].items()):
+        torrent = torrents_by_hash.get(torrent_hash)
+        if torrent is None:
+            logger.info(f"❔ 迁移中的任务 '{move['name']}' 已不在 qBittorrent 中，移除迁移记录。")
+            del move_state["moves"][torrent_hash]
+        elif torrent.state == TorrentStates.MOVING.value:
+            in_progress += 1
+        elif torrent.state in (TorrentStates.ERROR.value, TorrentStates.MISSING_FILES.value):
+            logger.error(f"💥 任务 '{move['name']}' 迁移到 {move['to']} 后处于状态 '{torrent.state}'，请手动检查。")
+            del move_state["moves"][torrent_hash]
+        elif is_under(torrent.save_path, move["to"]):
+            logger.info(f"✅ 任务 '{move['name']}' 已迁移到 {move['to']} ({format_size(move['size'])})。")
+            completed.append(move)
+            del move_state["moves"][torrent_hash]
+        else:
+            logger.warning(f"⚠️ 任务 '{move['name']}' 的保存位置仍为 {torrent.save_path}，迁移可能失败，将在之后重新评估。")
+            del move_state["moves"][torrent_hash]
+    return completed, in_progress
+
+
+def add_upload_rate_column(snapshot: TorrentSnapshot, activity_history: ActivityHistory):
+    """按活动历史添加 upload_rate_window 列 (近 TIER_RATE_WINDOW_MINUTES 分钟平均上传)，没有历史时使用当前上传速度。"""
+    rows, known = activity_history.lookup_rows(snapshot.hashes)
+    window_rate = np.full(snapshot.size, np.nan)
+    if known.any():
+        window_rate[known] = activity_history.rolling_rate(rows[known], "uploaded",
+                                                           CONFIG["TIER_RATE_WINDOW_MINUTES"] * 60)
+    snapshot.add_column("upload_rate_window",
+                        np.where(np.isnan(window_rate), snapshot.numeric["upspeed"], window_rate))
+
+
+def select_cold_torrents(torrents, activity_history: ActivityHistory, current_time_seconds: float) -> list:
+    """返回位于快速磁盘上、命中迁移规则的任务，按最后活动时间从早到晚排序 (最冷的在前)。"""
+    on_fast_tier = [t for t in torrents if is_under(t.save_path, CONFIG["TIER_FAST_PATH"])
+                    and not is_under(t.save_path, CONFIG["TIER_SLOW_PATH"])]
+    if not on_fast_tier:
+        return []
+    snapshot = TorrentSnapshot(on_fast_tier, current_time_seconds, CONFIG)
+    add_upload_rate_column(snapshot, activity_history)
+    matched_rules = match_rules(COMPILED_TIER_RULES, snapshot)
+    move_rule_indexes = [i for i, rule in enumerate(TIER_RULES) if rule["action"] == "move"]
+    candidates = [snapshot.torrents[i] for i in np.flatnonzero(np.isin(matched_rules, move_rule_indexes))]
+    return sorted(candidates, key=lambda t: t.last_activity)
+
+
+def get_target_location(torrent) -> str:
+    relative_path = os.path.relpath(os.path.normpath(torrent.save_path), os.path.normpath(CONFIG["TIER_FAST_PATH"]))
+    return os.path.normpath(os.path.join(CONFIG["TIER_SLOW_PATH"], relative_path))
+
+
+def plan_moves(candidates: list, in_progress: int, fast_free_space: int | None) -> list:
+    """按并发数、单次数量/数据量预算以及慢速磁盘剩余空间，从候选任务中选出本轮要发起的迁移。"""
+    trigger_bytes = CONFIG["TIER_TRIGGER_FREE_GB"] * 1024 ** 3
+    if trigger_bytes > 0 and fast_free_space is not None and fast_free_space >= trigger_bytes:
+        logger.info(f"✅ 快速磁盘剩余 {format_size(fast_free_space)}，未低于 {CONFIG['TIER_TRIGGER_FREE_GB']} GB，本轮不迁移。")
+        return []
+    slots = min(CONFIG["TIER_MAX_CONCURRENT_MOVES"] - in_progress, CONFIG["TIER_MAX_MOVES_PER_RUN"])
+    if slots <= 0:
+        logger.info(f"⏳ 有 {in_progress} 个迁移仍在进行中，本轮不发起新的迁移。")
+        return []
+
+    byte_budget = CONFIG["TIER_MAX_GB_PER_RUN"] * 1024 ** 3
+    slow_free_space = None
+    if os.path.isdir(CONFIG["TIER_SLOW_PATH"]):
+        slow_free_space = shutil.disk_usage(CONFIG["TIER_SLOW_PATH"]).free - CONFIG["TIER_SLOW_MIN_FREE_GB"] * 1024 ** 3
+    planned, planned_bytes = [], 0
+    for torrent in candidates:
+        if len(planned) >= slots:
+            break
+        if planned and planned_bytes + torrent.size > byte_budget:
+            continue
+        if slow_free_space is not None and planned_bytes + torrent.size > slow_free_space:
+            logger.warning(f"⚠️ 慢速磁盘剩余空间不足，无法迁移 '{torrent.name}' ({format_size(torrent.size)})。")
+            continue
+        planned.append(torrent)
+        planned_bytes += torrent.size
+    return planned
+
+
+def start_moves(qb_client, planned: list, move_state: dict, current_time_seconds: float, dry_run: bool) -> int:
+    """按目标路径分组，批量调用 torrents_set_location 发起迁移，返回成功发起的任务数。"""
+    by_location = {}
+    for torrent in planned:
+        by_location.setdefault(get_target_location(torrent), []).append(torrent)
+
+    started = 0
+    for location, group in by_location.items():
+        names = ", ".join(f"'{t.name}'" for t in group)
+        group_size = sum(t.size for t in group)
+        if dry_run:
+            logger.info(f"🧪 [演习] 将迁移 {len(group)} 个任务 ({format_size(group_size)}) 到 {location}: {names}")
+            started += len(group)
+            continue
+        try:
+            qb_client.torrents_set_location(location=location, torrent_hashes=[t.hash for t in group])
+        except Exception as e:
+            logger.error(f"💥 迁移任务到 {location} 失败: {e}")
+            continue
+        logger.info(f"🚚 已开始迁移 {len(group)} 个任务 ({format_size(group_size)}) 到 {location}: {names}")
+        for torrent in group:
+            move_state["moves"][torrent.hash] = {
+                "name": torrent.name,
+                "size": torrent.size,
+                "from": torrent.save_path,
+                "to": location,
+                "started_at": current_time_seconds,
+            }
+        started += len(group)
+    return started
+
+
+def main():
+    setup_logging()
+    logger.info("🚀 开始执行分层存储迁移...")
+    if not CONFIG["TIER_SLOW_PATH"]:
+        logger.error("💥 未设置 TIER_SLOW_PATH (慢速存储路径)，无法迁移。")
+        return
+    if is_under(CONFIG["TIER_SLOW_PATH"], CONFIG["TIER_FAST_PATH"]):
+        logger.error(f"💥 TIER_SLOW_PATH ({CONFIG['TIER_SLOW_PATH']}) 不能位于 TIER_FAST_PATH "
+                     f"({CONFIG['TIER_FAST_PATH']}) 之内。")
+        return
+    if CONFIG["DRY_RUN"]:
+        logger.info("🧪 DRY RUN 模式已激活。不会实际迁移任何任务。")
+
+    qb = connect_qbittorrent(CONFIG)
+    if not qb:
+        return
+    current_time_seconds = time.time()
+    move_state = load_move_state(CONFIG["TIER_MOVES_FILE_PATH"])
+    try:
+        torrents = qb.torrents_info()
+    except Exception as e:
+        logger.error(f"💥 获取种子列表失败: {e}")
+        return
+
+    completed, in_progress = check_pending_moves({t.hash: t for t in torrents}, move_state)
+    free_space = get_free_disk_space(qb)
+    activity_history = ActivityHistory.load(CONFIG["ACTIVITY_HISTORY_FILE_PATH"], CONFIG["ACTIVITY_HISTORY_SAMPLES"],
+                                            CONFIG["ACTIVITY_EWMA_TAU_MINUTES"] * 60)
+    candidates = select_cold_torrents(torrents, activity_history, current_time_seconds)
+    logger.info(f"🧊 快速磁盘 {CONFIG['TIER_FAST_PATH']} 上有 {len(candidates)} 个冷任务 "
+                f"(共 {format_size(sum(t.size for t in candidates))}) 可迁移到 {CONFIG['TIER_SLOW_PATH']}。")
+    planned = plan_moves(candidates, in_progress, free_space)
+    started = start_moves(qb, planned, move_state, current_time_seconds, CONFIG["DRY_RUN"])
+
+    migrated_bytes = sum(move["size"] for move in completed)
+    last_free_space = move_state.get("last_free_space")
+    free_space_text = format_size(free_space) if free_space is not None else "未知"
+    if free_space is not None and last_free_space is not None:
+        free_space_text += f" (较上次运行 {'+' if free_space >= last_free_space else ''}" \
+                           f"{format_size(free_space - last_free_space)})"
+    move_state["last_free_space"] = free_space
+    if not CONFIG["DRY_RUN"]:
+        save_move_state(CONFIG["TIER_MOVES_FILE_PATH"], move_state)
+
+    logger.info(
+        f"📊 本轮统计: 完成迁移 {len(completed)} 个任务，迁移数据 {format_size(migrated_bytes)} "
+        f"(快速磁盘获得的空间)；{'[演习] ' if CONFIG['DRY_RUN'] else ''}新发起迁移 {started} 个 "
+        f"({format_size(sum(t.size for t in planned))})；进行中 {len(move_state['moves'])} 个；"
+        f"快速磁盘当前剩余 {free_space_text}。")
+
+
+if __name__ == "__main__":
+    main()
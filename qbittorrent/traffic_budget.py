@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+月度流量预算
+
+宽带按月限制总流量时，用持久化的流量账本 (JSON) 累计本计费周期内的上传/下载字节数，
+并把剩余预算按剩余时间分摊为当前允许的速率，供 `speed_controller.py` 限制上传/下载目标。
+
+1.  账本按 `transfer_info` 中的会话计数器 (up_info_data / dl_info_data) 的增量累计；
+    计数器变小说明 qBittorrent 重启过，此时把新的计数值整体计入。上次的计数器保存在账本中，控制器重启也不会漏记或重复计入。
+2.  计费周期从每月 TRAFFIC_BILLING_DAY 日 0 点开始 (当月没有该日时取月末)，进入新周期时把上一周期的用量记入 history。
+3.  剩余预算 (扣除 TRAFFIC_RESERVE_RATIO 的保留量) 按“加权剩余时间”分摊：TRAFFIC_PREFERRED_HOURS 内的每秒权重为
+    TRAFFIC_PREFERRED_WEIGHT，其余为 1。当前允许的速率 = 剩余预算 × 当前权重 / 剩余加权秒数，
+    因此偏好时段 (如夜间) 分到更多流量，且周期内用得多，后面的允许速率就自动降低。
+4.  按当前平滑速率预测流量上限会在何时用尽，写入账本并记录日志。
+"""
+
+import calendar
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+logger = logging.getLogger("qb_speed_controller")
+
+# 计入流量上限的方向 (TRAFFIC_COUNT_DIRECTIONS): both 为上传 + 下载，upload / download 为单向
+COUNT_DIRECTION_CHOICES = ("both", "upload", "download")
+# 分摊上传/下载份额时单个方向的最小占比，避免某一方向暂时空闲后被压到几乎为 0
+MIN_DIRECTION_SHARE = 0.1
+
+
+def parse_hours(spec: str) -> set:
+    """解析 "0-9,22-24" 形式的小时范围 (左闭右开) 为小时集合。"""
+    hours = set()
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        start, _, end = part.partition('-')
+        start = int(start)
+        end = int(end) if end else start + 1
+        hours.update(h % 24 for h in range(start, end if end > start else end + 24))
+    return hours
+
+
+def billing_period(now: datetime, billing_day: int, timezone) -> tuple[datetime, datetime]:
+    """返回 now 所在计费周期的起止时间 (timezone 为 pytz 时区)，billing_day 超出当月天数时取月末。"""
+    def period_start(year: int, month: int) -> datetime:
+        return timezone.localize(datetime(year, month, min(billing_day, calendar.monthrange(year, month)[1])))
+
+    start = period_start(now.year, now.month)
+    if now < start:
+        year, month = (now.year, now.month - 1) if now.month > 1 else (now.year - 1, 12)
+        start = period_start(year, month)
+    year, month = (start.year, start.month + 1) if start.month < 12 else (start.year + 1, 1)
+    return start, period_start(year, month)
+
+
+def weighted_seconds(start: datetime, end: datetime, preferred_hours: set, preferred_weight: float) -> float:
+    """start 到 end 之间按小时加权的秒数。"""
+    total = 0.0
+    cursor = start
+    while cursor < end:
+        hour_end = min(cursor.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1), end)
+        total += (hour_end - cursor).total_seconds() * (preferred_weight if cursor.hour in preferred_hours else 1.0)
+        cursor = hour_end
+    return total
+
+
+class TrafficBudget:
+    """流量账本与按剩余预算计算的允许速率。"""
+
+    def __init__(self, config_dict: dict):
+        if config_dict["TRAFFIC_COUNT_DIRECTIONS"] not in COUNT_DIRECTION_CHOICES:
+            raise ValueError(f"TRAFFIC_COUNT_DIRECTIONS 必须为 {'/'.join(COUNT_DIRECTION_CHOICES)} 之一")
+        self.config = config_dict
+        self.filepath = config_dict["TRAFFIC_LEDGER_FILE_PATH"]
+        self.timezone = config_dict["SPEED_TIMEZONE"]
+        self.cap = config_dict["TRAFFIC_MONTHLY_CAP_GB"] * 1024 ** 3
+        self.preferred_hours = parse_hours(config_dict["TRAFFIC_PREFERRED_HOURS"])
+        self.preferred_weight = config_dict["TRAFFIC_PREFERRED_WEIGHT"]
+        self.ledger = self._load()
+        self.last_save_time = None
+        self.forecast_logged_at = None
+
+    def _load(self) -> dict:
+        ledger = {"period_start": None, "uploaded": 0, "downloaded": 0, "last_counters": None, "history": {}}
+        if not self.filepath.exists():
+            return ledger
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                ledger.update(json.load(f))
+        except (json.JSONDecodeError, IOError) as e:
+            logger.warning(f"⚠️ 无法加载流量账本 {self.filepath}: {e}。将从零开始计数。")
+        return ledger
+
+    def save(self):
+        try:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.filepath.with_name(self.filepath.name + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.ledger, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.filepath)
+        except OSError as e:
+            logger.error(f"💥 保存流量账本至 {self.filepath} 失败: {e}")
+
+    def _roll_period(self, now: datetime) -> tuple[datetime, datetime]:
+        start, end = billing_period(now, self.config["TRAFFIC_BILLING_DAY"], self.timezone)
+        period_key = start.isoformat()
+        if self.ledger["period_start"] != period_key:
+            if self.ledger["period_start"]:
+                self.ledger["history"][self.ledger["period_start"]] = {
+                    "uploaded": self.ledger["uploaded"], "downloaded": self.ledger["downloaded"]}
+                logger.info(f"📅 进入新的计费周期 ({start:%Y-%m-%d})，上一周期用量: 上传 "
+                            f"{self.ledger['uploaded'] / 1024 ** 3:.1f} GiB, 下载 {self.ledger['downloaded'] / 1024 ** 3:.1f} GiB")
+            self.ledger.update(period_start=period_key, uploaded=0, downloaded=0)
+        return start, end
+
+    def record(self, transfer, current_time_seconds: float):
+        """按 transfer_info 的会话计数器增量累计流量，每 TRAFFIC_LEDGER_SAVE_SECONDS 秒保存一次账本。"""
+        self._roll_period(datetime.fromtimestamp(current_time_seconds, self.timezone))
+        counters = {"uploaded": int(transfer.get("up_info_data") or 0),
+                    "downloaded": int(transfer.get("dl_info_data") or 0)}
+        last = self.ledger["last_counters"]
+        if last is not None:
+            for field, value in counters.items():
+                # 计数器变小说明 qBittorrent 重启过，新会话的计数全部计入
+                self.ledger[field] += value - last[field] if value >= last[field] else value
+        self.ledger["last_counters"] = counters
+        if self.last_save_time is None or \
+                current_time_seconds - self.last_save_time >= self.config["TRAFFIC_LEDGER_SAVE_SECONDS"]:
+            self.last_save_time = current_time_seconds
+            self.save()
+
+    def used(self) -> int:
+        direction = self.config["TRAFFIC_COUNT_DIRECTIONS"]
+        if direction == "upload":
+            return self.ledger["uploaded"]
+        if direction == "download":
+            return self.ledger["downloaded"]
+        return self.ledger["uploaded"] + self.ledger["downloaded"]
+
+    def allowed_rate(self, current_time_seconds: float) -> float:
+        """当前允许的计费方向总速率 (字节/秒)。"""
+        now = datetime.fromtimestamp(current_time_seconds, self.timezone)
+        _, end = self._roll_period(now)
+        remaining = max(self.cap * (1 - self.config["TRAFFIC_RESERVE_RATIO"]) - self.used(), 0)
+        remaining_weighted = weighted_seconds(now, end, self.preferred_hours, self.preferred_weight)
+        if remaining_weighted <= 0:
+            return 0.0
+        weight = self.preferred_weight if now.hour in self.preferred_hours else 1.0
+        return remaining * weight / remaining_weighted
+
+    def forecast(self, current_time_seconds: float, current_rate: float) -> datetime | None:
+        """按 current_rate (计费方向的总速率) 预测本周期内流量上限用尽的时间，周期内不会用尽时返回 None。"""
+        now = datetime.fromtimestamp(current_time_seconds, self.timezone)
+        _, end = self._roll_period(now)
+        remaining = self.cap - self.used()
+        if remaining <= 0:
+            return now
+        if current_rate <= 0:
+            return None
+        hit_at = now + timedelta(seconds=remaining / current_rate)
+        return hit_at if hit_at < end else None
+
+    def limit_target(self, target: dict, smoothed: dict, current_time_seconds: float) -> dict:
+        """
+        用当前允许的速率限制时段表给出的目标。同时计入上传和下载时，按两者的平滑速率分配允许速率。
+        smoothed 为 {偏好设置中的限速字段: 平滑后的实际速率}。
+        """
+        allowed_kib = self.allowed_rate(current_time_seconds) / 1024
+        direction = self.config["TRAFFIC_COUNT_DIRECTIONS"]
+        up_rate, dl_rate = smoothed.get("up_limit", 0), smoothed.get("dl_limit", 0)
+        if direction == "both":
+            up_share = up_rate / (up_rate + dl_rate) if up_rate + dl_rate > 0 else 0.5
+            up_share = min(max(up_share, MIN_DIRECTION_SHARE), 1 - MIN_DIRECTION_SHARE)
+            caps = {"upload_kib": allowed_kib * up_share, "download_kib": allowed_kib * (1 - up_share)}
+            current_rate = up_rate + dl_rate
+        elif direction == "upload":
+            caps = {"upload_kib": allowed_kib}
+            current_rate = up_rate
+        else:
+            caps = {"download_kib": allowed_kib}
+            current_rate = dl_rate
+
+        limited = dict(target)
+        min_kib = self.config["SPEED_MIN_LIMIT_KIB"]
+        for key, cap_kib in caps.items():
+            cap_kib = max(cap_kib, min_kib)
+            limited[key] = cap_kib if not target.get(key) else min(target[key], cap_kib)
+
+        hit_at = self.forecast(current_time_seconds, current_rate)
+        self.ledger["forecast_cap_hit_at"] = hit_at.isoformat() if hit_at else None
+        self.ledger["allowed_kib"] = round(allowed_kib, 1)
+        if hit_at and (self.forecast_logged_at is None or
+                       current_time_seconds - self.forecast_logged_at >= self.config["SPEED_STATUS_LOG_MINUTES"] * 60):
+            self.forecast_logged_at = current_time_seconds
+            logger.warning(f"📊 按当前速率 {current_rate / 1024 ** 2:.2f} MiB/s，本周期流量上限将在 "
+                           f"{hit_at:%Y-%m-%d %H:%M} 用尽；当前允许速率 {allowed_kib / 1024:.2f} MiB/s。")
+        return limited
+
+    def report(self, current_time_seconds: float) -> str:
+        now = datetime.fromtimestamp(current_time_seconds, self.timezone)
+        start, end = self._roll_period(now)
+        used = self.used()
+        lines = [
+            f"计费周期: {start:%Y-%m-%d} ~ {end:%Y-%m-%d} (计入方向: {self.config['TRAFFIC_COUNT_DIRECTIONS']})",
+            f"已用: {used / 1024 ** 3:.1f} GiB / {self.cap / 1024 ** 3:.1f} GiB "
+            f"(上传 {self.ledger['uploaded'] / 1024 ** 3:.1f} GiB, 下载 {self.ledger['downloaded'] / 1024 ** 3:.1f} GiB)",
+            f"当前允许速率: {self.allowed_rate(current_time_seconds) / 1024 ** 2:.2f} MiB/s",
+            f"预计用尽时间: {self.ledger.get('forecast_cap_hit_at') or '本周期内不会用尽'}",
+        ]
+        for period, usage in sorted(self.ledger["history"].items())[-6:]:
+            lines.append(f"  {period[:10]}: 上传 {usage['uploaded'] / 1024 ** 3:.1f} GiB, "
+                         f"下载 {usage['downloaded'] / 1024 ** 3:.1f} GiB")
+        return "\n".join(lines)
@@ -2,29 +2,40 @@
 # -*- coding: utf-8 -*-
 # 文件: mteam_tg_tools_enhanced_optimized.py
 # 描述: M-Team助手，用于搜索种子、添加到qBittorrent及管理任务 (交互优化版)。
-# 安装三方依赖： pip install pytz requests python-telegram-bot qbittorrent-api
+# 安装三方依赖： pip install pytz requests python-telegram-bot qbittorrent-api (Webhook 模式需安装 "python-telegram-bot[webhooks]")
 
 import asyncio
+import functools
 import html
+import json
 import logging
 import math
 import os
+import queue
 import re
+import secrets
 import sys
+import threading
+import time
 import warnings
-from typing import Optional, List, Tuple, Dict, Any, Union, Literal
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional, List, Set, Tuple, Dict, Any, Union, Literal, Callable, Awaitable
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 
 import pytz
 import requests
 import telegram
 import telegram.warnings
-from qbittorrentapi import Client, APIError, TorrentInfoList
+from qbittorrentapi import Client, APIError, APIConnectionError, Forbidden403Error, TorrentInfoList
 from telegram import Update, BotCommand, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, \
     ReplyKeyboardRemove
 from telegram.constants import ParseMode
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     filters,
@@ -92,6 +103,22 @@ SEARCH_PAGE_PREFIX = "searchpage_"
 SEARCH_SELECT_PREFIX = "searchsel_"
 SEARCH_CANCEL_PREFIX = "searchcancel_"
 QBTASKS_PAGE_PREFIX = "qbtasks_page_"
+# 机器人只处理消息和按钮回调，只订阅这两类更新
+BOT_ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+DELETE_OPTION_BUTTONS = [
+    [InlineKeyboardButton("🗑️ 删除任务和文件", callback_data=f"{DEL_OPT_PREFIX}delete_files")],
+    [InlineKeyboardButton("➖ 仅删除任务 (保留文件)", callback_data=f"{DEL_OPT_PREFIX}delete_task_only")],
+    [InlineKeyboardButton("↩️ 取消操作", callback_data=f"{DEL_OPT_PREFIX}cancel_delete")]
+]
+MTEAM_ID_TOKEN_PATTERN = re.compile(r'^(?:\S*/detail/)?(\d+)/?$')
+QBTASKS_STATUS_FILTERS = {
+    "all", "downloading", "seeding", "completed", "stopped", "paused", "running", "resumed", "active", "inactive",
+    "stalled", "stalled_uploading", "stalled_downloading", "checking", "moving", "errored",
+}
+QBTASKS_STATUS_ALIASES = {
+    "下载中": "downloading", "做种": "seeding", "已完成": "completed", "暂停": "stopped", "运行": "running",
+    "活动": "active", "空闲": "inactive", "停滞": "stalled", "校验": "checking", "移动": "moving", "错误": "errored",
+}
 
 
 class Config:
@@ -101,6 +128,31 @@ class Config:
         self.QBIT_PORT: int = int(os.environ.get("QBIT_PORT", "8080"))
         self.QBIT_USERNAME: str = os.environ.get("QBIT_USERNAME", "admin")
         self.QBIT_PASSWORD: str = os.environ.get("QBIT_PASSWORD", "adminadmin")
+        self.QBIT_POOL_SIZE: int = max(1, int(os.environ.get("QBIT_POOL_SIZE", "2")))
+        self.QBIT_POOL_HEALTHCHECK_SECONDS: float = float(os.environ.get("QBIT_POOL_HEALTHCHECK_SECONDS", "300"))
+        self.QBIT_POOL_ACQUIRE_TIMEOUT: float = float(os.environ.get("QBIT_POOL_ACQUIRE_TIMEOUT", "30"))
+        self.MT_INDEX_FILE_PATH: str = os.environ.get("MT_INDEX_FILE_PATH", "telegram/mteam_hash_index.json")
+        self.BRUSH_DATA_FILE_PATH: str = os.environ.get("DATA_FILE_PATH", "mteam/brush_data.json")
+        self.QBIT_EXECUTOR_WORKERS: int = max(1, int(os.environ.get("QBIT_EXECUTOR_WORKERS", "4")))
+        self.MT_EXECUTOR_WORKERS: int = max(1, int(os.environ.get("MT_EXECUTOR_WORKERS", "4")))
+        self.QBTASKS_COUNT_TTL_SECONDS: float = float(os.environ.get("QBTASKS_COUNT_TTL_SECONDS", "60"))
+        self.MT_SEARCH_CACHE_SIZE: int = max(1, int(os.environ.get("MT_SEARCH_CACHE_SIZE", "128")))
+        self.MT_SEARCH_CACHE_TTL_SECONDS: float = float(os.environ.get("MT_SEARCH_CACHE_TTL_SECONDS", "120"))
+        self.MT_DETAIL_CACHE_TTL_SECONDS: float = float(os.environ.get("MT_DETAIL_CACHE_TTL_SECONDS", "300"))
+        self.MT_SEARCH_PREFETCH: bool = os.environ.get("MT_SEARCH_PREFETCH", "True").lower() == 'true'
+        self.BULK_CONCURRENCY: int = max(1, int(os.environ.get("BULK_CONCURRENCY", "4")))
+        self.BULK_MAX_IDS: int = max(1, int(os.environ.get("BULK_MAX_IDS", "100")))
+        self.BULK_PROGRESS_INTERVAL_SECONDS: float = float(os.environ.get("BULK_PROGRESS_INTERVAL_SECONDS", "2"))
+        # 设置 TG_WEBHOOK_URL (反向代理对外的地址) 时使用 Webhook 模式，本地 HTTP 服务监听 TG_WEBHOOK_LISTEN:TG_WEBHOOK_PORT
+        self.TG_WEBHOOK_URL: Optional[str] = os.environ.get("TG_WEBHOOK_URL", "").rstrip("/") or None
+        self.TG_WEBHOOK_LISTEN: str = os.environ.get("TG_WEBHOOK_LISTEN", "127.0.0.1")
+        self.TG_WEBHOOK_PORT: int = int(os.environ.get("TG_WEBHOOK_PORT", "8443"))
+        self.TG_WEBHOOK_PATH: str = os.environ.get("TG_WEBHOOK_PATH", "mteam-bot").strip("/")
+        # 未设置时每次启动随机生成，Telegram 推送时会在请求头中带上，用于拒绝伪造的请求
+        self.TG_WEBHOOK_SECRET_TOKEN: str = os.environ.get("TG_WEBHOOK_SECRET_TOKEN") or secrets.token_urlsafe(32)
+        self.TG_CONCURRENT_UPDATES: int = max(1, int(os.environ.get("TG_CONCURRENT_UPDATES", "16")))
+        self.TG_SLOW_UPDATE_SECONDS: float = float(os.environ.get("TG_SLOW_UPDATE_SECONDS", "3"))
+        self.TG_LATENCY_REPORT_EVERY: int = max(1, int(os.environ.get("TG_LATENCY_REPORT_EVERY", "100")))
         self.QBIT_DEFAULT_CATEGORY_FOR_MT: str = os.environ.get("QBIT_DEFAULT_CATEGORY_FOR_MT", "M-Team-DL")
         tags_str: str = os.environ.get("QBIT_DEFAULT_TAGS_FOR_MT", "TG机器人")
         self.QBIT_DEFAULT_TAGS_FOR_MT: List[str] = [tag.strip() for tag in tags_str.split(',') if tag.strip()]
@@ -137,14 +189,29 @@ class Config:
             sys.exit(f"致命错误: {error_msg}")
 
 
+async def run_blocking(executor: ThreadPoolExecutor, func, *args, **kwargs):
+    """在指定的线程池中执行阻塞调用，避免卡住机器人的事件循环。"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
 class MTeamManager:
     def __init__(self, config: Config):
         self.config = config
+        # M-Team 与 qBittorrent 各用一个有界线程池，任一方响应缓慢时不会占满另一方的线程
+        self.executor = ThreadPoolExecutor(max_workers=config.MT_EXECUTOR_WORKERS, thread_name_prefix="mteam-io")
         self.session = requests.Session()
         if self.config.MT_APIKEY:
             self.session.headers.update({"x-api-key": self.config.MT_APIKEY})
         else:
             logger.error("🚫 M-Team API 密钥未在配置中提供。M-Team相关功能将无法使用。")
+        self.search_cache = AsyncLookupCache("M-Team 搜索", self.executor, config.MT_SEARCH_CACHE_SIZE,
+                                             config.MT_SEARCH_CACHE_TTL_SECONDS)
+        # 选中搜索结果后预热种子详情和下载链接，用户选择分类时即可就绪
+        self.detail_cache = AsyncLookupCache("M-Team 种子详情", self.executor, config.MT_SEARCH_CACHE_SIZE,
+                                             config.MT_DETAIL_CACHE_TTL_SECONDS)
+        self.download_url_cache = AsyncLookupCache("M-Team 下载链接", self.executor, config.MT_SEARCH_CACHE_SIZE,
+                                                   config.MT_DETAIL_CACHE_TTL_SECONDS)
         logger.info("🔑 M-Team API 会话已配置。")
 
     def get_torrent_details(self, torrent_id: str) -> Optional[Dict[str, Any]]:
@@ -261,6 +328,29 @@ class MTeamManager:
             logger.error(f"🚫 处理 M-Team API 搜索 '{keyword}' 响应时发生未知错误: {e}", exc_info=True)
         return None
 
+    async def search(self, keyword: str, search_mode: str = "normal", page_number: int = 1,
+                     page_size: int = 5) -> Optional[Dict[str, Any]]:
+        key = (keyword.strip().casefold(), search_mode, page_number, page_size)
+        return await self.search_cache.get(key, self.search_torrents_by_keyword, keyword=keyword.strip(),
+                                           search_mode=search_mode, page_number=page_number, page_size=page_size)
+
+    def prefetch_search(self, keyword: str, search_mode: str = "normal", page_number: int = 1,
+                        page_size: int = 5) -> None:
+        key = (keyword.strip().casefold(), search_mode, page_number, page_size)
+        self.search_cache.prefetch(key, self.search_torrents_by_keyword, keyword=keyword.strip(),
+                                   search_mode=search_mode, page_number=page_number, page_size=page_size)
+
+    async def get_torrent_details_cached(self, torrent_id: str) -> Optional[Dict[str, Any]]:
+        return await self.detail_cache.get(torrent_id, self.get_torrent_details, torrent_id)
+
+    async def get_torrent_download_url_cached(self, torrent_id: str) -> Optional[str]:
+        return await self.download_url_cache.get(torrent_id, self.get_torrent_download_url, torrent_id)
+
+    def warm_torrent(self, torrent_id: str) -> None:
+        """在后台预取种子详情和下载链接。"""
+        self.detail_cache.prefetch(torrent_id, self.get_torrent_details, torrent_id)
+        self.download_url_cache.prefetch(torrent_id, self.get_torrent_download_url, torrent_id)
+
 
 def generate_qb_torrent_name_for_mt(mteam_id: str, api_details: Dict[str, Any], qb_category_name: str) -> str:
     title_source = api_details.get("smallDescr") or api_details.get("name", "未知M-Team标题")
@@ -288,40 +378,321 @@ def generate_qb_torrent_name_for_mt(mteam_id: str, api_details: Dict[str, Any],
     return final_name or f"[{mteam_id}][M-Team_Torrent]"
 
 
-class QBittorrentManager:
-    def __init__(self, config: Config, mteam_manager: MTeamManager):
+class AsyncLookupCache:
+    """
+    M-Team 查询结果缓存 (搜索、种子详情、下载链接)：最多 max_size 项 (LRU)，有效期 ttl_seconds 秒，请求失败 (返回空) 时不缓存。
+    相同的查询正在进行时，后来的请求 (包括其他聊天) 直接等待同一个请求的结果。
+    只在事件循环中使用，实际请求在 M-Team 线程池中执行。
+    """
+
+    def __init__(self, name: str, executor: ThreadPoolExecutor, max_size: int, ttl_seconds: float):
+        self.name = name
+        self.executor = executor
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[Any, Tuple[Any, float]]" = OrderedDict()
+        self.in_flight: Dict[Any, asyncio.Task] = {}
+        self.background_tasks: set = set()
+
+    def _get_cached(self, key) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] >= self.ttl_seconds:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def _store(self, key, task: asyncio.Task) -> None:
+        self.in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None or not task.result():
+            return
+        self.entries[key] = (task.result(), time.monotonic())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def _request(self, key, func, *args, **kwargs) -> asyncio.Task:
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(run_blocking(self.executor, func, *args, **kwargs))
+            task.add_done_callback(functools.partial(self._store, key))
+            self.in_flight[key] = task
+        return task
+
+    async def get(self, key, func, *args, **kwargs) -> Optional[Any]:
+        cached = self._get_cached(key)
+        if cached is not None:
+            logger.info(f"⚡ {self.name} {key} 命中缓存。")
+            return cached
+        # shield: 某个聊天的处理被取消时，不影响等待同一请求的其他聊天
+        return await asyncio.shield(self._request(key, func, *args, **kwargs))
+
+    def prefetch(self, key, func, *args, **kwargs) -> None:
+        """在后台预取 (已缓存或正在请求时跳过)。"""
+        if self._get_cached(key) is not None or key in self.in_flight:
+            return
+        logger.debug(f"🐛 后台预取 {self.name} {key}。")
+        task = self._request(key, func, *args, **kwargs)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    def discard(self, key) -> None:
+        self.entries.pop(key, None)
+
+
+class QBittorrentClientPool:
+    """
+    长连接的 qBittorrent 客户端池 (线程安全)：每个客户端只登录一次，底层 requests 会话保持 HTTP keep-alive。
+    会话过期返回 403 时，qbittorrentapi 会自动重新登录并重试一次；客户端空闲超过 QBIT_POOL_HEALTHCHECK_SECONDS 秒时，
+    取出前先做一次轻量健康检查，403 则重新登录，连接错误则丢弃并新建客户端。
+    使用中出现连接错误 (调用方通过 report_error 报告，或异常传出 connection()) 的客户端不再放回池中。
+    """
+
+    def __init__(self, config: Config):
         self.config = config
-        self.client: Optional[Client] = None
-        self.mteam_manager = mteam_manager
+        self.idle: "queue.LifoQueue[Tuple[Client, float]]" = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.created = 0
+        self.broken: Set[int] = set()
 
-    def connect_qbit(self) -> bool:
-        if self.client and self.client.is_logged_in: return True
+    def _new_client(self) -> Optional[Client]:
         logger.info(f"🔗 [qBittorrent] 尝试连接到: {self.config.QBIT_HOST}:{self.config.QBIT_PORT}")
         try:
-            self.client = Client(host=self.config.QBIT_HOST, port=self.config.QBIT_PORT,
-                                 username=self.config.QBIT_USERNAME, password=self.config.QBIT_PASSWORD,
-                                 REQUESTS_ARGS={"timeout": (10, 30)})
-            self.client.auth_log_in()
+            client = Client(host=self.config.QBIT_HOST, port=self.config.QBIT_PORT,
+                            username=self.config.QBIT_USERNAME, password=self.config.QBIT_PASSWORD,
+                            REQUESTS_ARGS={"timeout": (10, 30)})
+            client.auth_log_in()
             logger.info(
-                f"✅ [qBittorrent] 连接成功 (qBittorrent v{self.client.app.version}, API v{self.client.app.web_api_version})")
-            return True
+                f"✅ [qBittorrent] 连接成功 (qBittorrent v{client.app.version}, API v{client.app.web_api_version})")
+            return client
         except APIError as e:
             logger.error(f"🚫 [qBittorrent] API登录失败: {e}")
         except requests.exceptions.RequestException as e:
             logger.error(f"🚫 [qBittorrent] 连接请求失败: {e}")
         except Exception as e:
             logger.error(f"🚫 [qBittorrent] 连接时发生未知错误: {e}", exc_info=True)
-        self.client = None
-        return False
+        return None
 
-    def disconnect_qbit(self) -> None:
-        if self.client and self.client.is_logged_in:
+    def _is_healthy(self, client: Client) -> bool:
+        try:
+            client.app_version()
+            return True
+        except Forbidden403Error:
             try:
-                self.client.auth_log_out()
-                logger.info("🚪 [qBittorrent] 已断开连接。")
+                client.auth_log_in()
+                logger.info("🔑 [qBittorrent] 会话已过期，已重新登录。")
+                return True
             except Exception as e:
-                logger.warning(f"⚠️ [qBittorrent] 断开连接时发生错误: {e}")
-        self.client = None
+                logger.warning(f"⚠️ [qBittorrent] 重新登录失败: {e}")
+        except Exception as e:
+            logger.warning(f"⚠️ [qBittorrent] 健康检查失败，将重建连接: {e}")
+        return False
+
+    def _discard(self, client: Client) -> None:
+        with self.lock:
+            self.created -= 1
+        try:
+            client.auth_log_out()
+        except Exception:
+            pass
+
+    def _acquire(self) -> Optional[Client]:
+        while True:
+            try:
+                client, last_used = self.idle.get_nowait()
+            except queue.Empty:
+                with self.lock:
+                    can_create = self.created < self.config.QBIT_POOL_SIZE
+                    if can_create:
+                        self.created += 1
+                if can_create:
+                    client = self._new_client()
+                    if client is None:
+                        with self.lock:
+                            self.created -= 1
+                    return client
+                try:
+                    client, last_used = self.idle.get(timeout=self.config.QBIT_POOL_ACQUIRE_TIMEOUT)
+                except queue.Empty:
+                    logger.error("🚫 [qBittorrent] 等待空闲连接超时。")
+                    return None
+            if time.monotonic() - last_used < self.config.QBIT_POOL_HEALTHCHECK_SECONDS or self._is_healthy(client):
+                return client
+            self._discard(client)
+
+    def report_error(self, client: Client, error: Exception) -> None:
+        """调用方在 connection() 内自行处理异常时调用：连接错误的客户端在归还时丢弃，不再复用。"""
+        if isinstance(error, APIConnectionError):
+            with self.lock:
+                self.broken.add(id(client))
+
+    @contextmanager
+    def connection(self):
+        """取出一个已登录的客户端，用完放回池中；无法连接时得到 None。连接错误时丢弃该客户端。"""
+        client = self._acquire()
+        if client is None:
+            yield None
+            return
+        try:
+            yield client
+        except APIConnectionError as e:
+            self.report_error(client, e)
+            raise
+        finally:
+            with self.lock:
+                broken = id(client) in self.broken
+                self.broken.discard(id(client))
+            if broken:
+                logger.warning("⚠️ [qBittorrent] 连接出错，丢弃该客户端。")
+                self._discard(client)
+            else:
+                self.idle.put((client, time.monotonic()))
+
+    def close(self) -> None:
+        while True:
+            try:
+                client, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(client)
+        logger.info("🚪 [qBittorrent] 已关闭连接池。")
+
+
+class MTeamHashIndex:
+    """
+    M-Team ID ↔ 种子 HASH 索引 (线程安全)，持久化为 JSON 文件，查找为 O(1)，与 qBittorrent 中的任务名称无关。
+    1.  添加种子时 (add_mteam_torrent) 记录 “qB 任务名 → M-Team ID” 的待绑定项；刷流脚本的数据文件中
+        renamed_name_in_qb 字段同样作为待绑定项。任务出现在 qBittorrent 中后即按 HASH 绑定，之后任务改名也不受影响。
+    2.  通过 sync_maindata 的 rid 增量同步保持最新：新任务按待绑定项或名称前缀 [ID] 绑定，被删除的任务从索引中移除。
+    """
+
+    PENDING_EXPIRE_SECONDS = 7 * 24 * 3600
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.filepath = config.MT_INDEX_FILE_PATH
+        self.lock = threading.Lock()
+        # rid 与 qBittorrent 的登录会话绑定，连接池中的每个客户端各自记录
+        self.rids: "weakref.WeakKeyDictionary[Client, int]" = weakref.WeakKeyDictionary()
+        self.hash_to_id: Dict[str, str] = {}
+        self.pending: Dict[str, Tuple[str, float]] = {}
+        self.brush_names: Dict[str, str] = {}
+        self.brush_mtime: Optional[float] = None
+        self._load()
+        self.id_to_hash: Dict[str, str] = {mteam_id: h for h, mteam_id in self.hash_to_id.items()}
+
+    def _load(self) -> None:
+        if not os.path.exists(self.filepath):
+            return
+        try:
+            with open(self.filepath, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.hash_to_id = {str(h): str(mteam_id) for h, mteam_id in data.get("hashes", {}).items()}
+            self.pending = {str(name): (str(entry[0]), float(entry[1])) for name, entry in data.get("pending", {}).items()}
+            logger.info(f"📇 已加载 M-Team ID 索引: {len(self.hash_to_id)} 个任务, {len(self.pending)} 个待绑定。")
+        except (json.JSONDecodeError, IOError, AttributeError, IndexError, TypeError, ValueError) as e:
+            logger.warning(f"⚠️ 无法加载 M-Team ID 索引 {self.filepath}: {e}。将重新建立索引。")
+
+    def _save(self) -> None:
+        try:
+            dir_name = os.path.dirname(self.filepath)
+            if dir_name:
+                os.makedirs(dir_name, exist_ok=True)
+            tmp_path = self.filepath + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"hashes": self.hash_to_id, "pending": self.pending}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.filepath)
+        except OSError as e:
+            logger.error(f"💥 保存 M-Team ID 索引至 {self.filepath} 失败: {e}")
+
+    def _reload_brush_names(self) -> None:
+        try:
+            mtime = os.path.getmtime(self.config.BRUSH_DATA_FILE_PATH)
+        except OSError:
+            return
+        if mtime == self.brush_mtime:
+            return
+        self.brush_mtime = mtime
+        try:
+            with open(self.config.BRUSH_DATA_FILE_PATH, "r", encoding="utf-8") as f:
+                records = json.load(f)
+            self.brush_names = {r["renamed_name_in_qb"]: str(r["id"]) for r in records
+                                if isinstance(r, dict) and r.get("renamed_name_in_qb") and r.get("id")}
+        except (json.JSONDecodeError, IOError, TypeError) as e:
+            logger.warning(f"⚠️ 无法读取刷流数据文件 {self.config.BRUSH_DATA_FILE_PATH}: {e}")
+
+    def _bind(self, torrent_hash: str, mteam_id: str) -> None:
+        old_hash = self.id_to_hash.get(mteam_id)
+        if old_hash and old_hash != torrent_hash:
+            self.hash_to_id.pop(old_hash, None)
+        self.hash_to_id[torrent_hash] = mteam_id
+        self.id_to_hash[mteam_id] = torrent_hash
+
+    def _unbind(self, torrent_hash: str) -> None:
+        mteam_id = self.hash_to_id.pop(torrent_hash, None)
+        if mteam_id and self.id_to_hash.get(mteam_id) == torrent_hash:
+            del self.id_to_hash[mteam_id]
+
+    def _id_for_new_torrent(self, name: str) -> Optional[str]:
+        if name in self.pending:
+            return self.pending.pop(name)[0]
+        return self.brush_names.get(name) or QBittorrentManager.extract_id_from_name(name)
+
+    def expect(self, qb_name: str, mteam_id: str) -> None:
+        """记录刚添加的种子，任务出现在 qBittorrent 中后按 HASH 绑定。"""
+        with self.lock:
+            self.pending[qb_name] = (mteam_id, time.time())
+            self._save()
+
+    def refresh(self, client: Client) -> None:
+        """用 sync_maindata 增量数据更新索引。"""
+        with self.lock:
+            maindata = client.sync_maindata(rid=self.rids.get(client, 0))
+            self.rids[client] = maindata.get("rid", 0)
+            torrents = maindata.get("torrents") or {}
+            changed = False
+            if maindata.get("full_update"):
+                for torrent_hash in set(self.hash_to_id) - set(torrents):
+                    self._unbind(torrent_hash)
+                    changed = True
+            for torrent_hash in maindata.get("torrents_removed") or []:
+                if torrent_hash in self.hash_to_id:
+                    self._unbind(torrent_hash)
+                    changed = True
+
+            new_torrents = {h: t["name"] for h, t in torrents.items() if "name" in t and h not in self.hash_to_id}
+            if new_torrents:
+                self._reload_brush_names()
+                for torrent_hash, name in new_torrents.items():
+                    mteam_id = self._id_for_new_torrent(name)
+                    if mteam_id:
+                        self._bind(torrent_hash, mteam_id)
+                        changed = True
+
+            expire_before = time.time() - self.PENDING_EXPIRE_SECONDS
+            for name in [n for n, (_, added_at) in self.pending.items() if added_at < expire_before]:
+                del self.pending[name]
+                changed = True
+            if changed:
+                self._save()
+
+    def lookup(self, mteam_id: str) -> Optional[str]:
+        with self.lock:
+            return self.id_to_hash.get(mteam_id)
+
+
+class QBittorrentManager:
+    def __init__(self, config: Config, mteam_manager: MTeamManager):
+        self.config = config
+        self.pool = QBittorrentClientPool(config)
+        self.index = MTeamHashIndex(config)
+        # 任务列表总数缓存 {(状态, 分类): (总数, 时间)}，翻页时只需按 offset/limit 取当前页
+        self.task_count_cache: Dict[Tuple[Optional[str], Optional[str]], Tuple[int, float]] = {}
+        self.task_count_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=config.QBIT_EXECUTOR_WORKERS, thread_name_prefix="qbit-io")
+        self.mteam_manager = mteam_manager
 
     @staticmethod
     def format_bytes(b: Union[int, str]) -> str:
@@ -354,153 +725,239 @@ class QBittorrentManager:
             return "✅ Done"
         return state_map.get(state_str, f"🚀 {state_str[:10]}")
 
-    async def get_all_torrents_info(self, page: int = 1, items_per_page: int = 10) -> Tuple[
-        bool, Union[Dict[str, Any], str]]:
-        if not self.connect_qbit(): return False, "🚫 无法连接到 qBittorrent 服务器。请检查配置和服务器状态。"
-        try:
-            torrents_list: Optional[TorrentInfoList] = self.client.torrents_info(status_filter='all')
-            if torrents_list is None: torrents_list = TorrentInfoList([], self.client)
-
-            sorted_torrents = sorted(torrents_list, key=lambda t: t.added_on, reverse=True)
-
-            total_torrents = len(sorted_torrents)
-            total_pages = math.ceil(total_torrents / items_per_page) if total_torrents > 0 else 0
-            current_page = max(1, min(page, total_pages or 1))
-
-            start_index = (current_page - 1) * items_per_page
-            end_index = start_index + items_per_page
-            torrents_for_page = sorted_torrents[start_index:end_index]
-
-            parts = []
-            for t in torrents_for_page:
-                original_name = t.name
-                state_emoji = self._get_torrent_state_emoji(t.state, t.progress)
-
-                parsed_id: Optional[str] = None
-                parsed_category_from_name: Optional[str] = None
-                parsed_title_text: str = original_name
-
-                match = re.match(r'^\[(\d+)](?:\[([^]]*)])?(.*)$', original_name)
-                if match:
-                    parsed_id = match.group(1)
-                    parsed_category_from_name = match.group(2) if match.group(2) else None
-                    title_candidate = match.group(3).strip()
-                    if title_candidate:
-                        parsed_title_text = title_candidate
-                    elif parsed_category_from_name:
-                        parsed_title_text = f"<i>(ID: {parsed_id}, 分类: {parsed_category_from_name} - 无主标题)</i>"
-                    else:
-                        parsed_title_text = f"<i>(ID: {parsed_id} - 无主标题)</i>"
-
-                title_display = html.escape(parsed_title_text[:60]) + ('...' if len(parsed_title_text) > 60 else '')
-                if not parsed_title_text.strip() or parsed_title_text.startswith(
-                        "<i>("):
-                    if not match:
-                        title_display = html.escape(original_name[:60]) + ('...' if len(original_name) > 60 else '')
-
-                info_lines = [f"{state_emoji} <b>{title_display}</b>"]
-                if parsed_id:
-                    info_lines.append(f"└─◉ 🆔 MT ID: <code>{html.escape(parsed_id)}</code>")
-                info_lines.append(f"└─◉ 💾 下载状态: {self.format_bytes(t.size)} | 📈 {t.progress * 100:.1f}%")
-                info_lines.append(
-                    f"└─◉ 🚀 当前速度: ↓{self.format_bytes(t.dlspeed)}/s ↑{self.format_bytes(t.upspeed)}/s")
-                info_lines.append(f"└─◉ 🏷️ 当前分类: <code>{html.escape(t.category) if t.category else '无'}</code>")
-
-                parts.append("\n".join(info_lines))
-
-            return True, {"message_parts": parts, "total_torrents": total_torrents, "current_page": current_page,
-                          "total_pages": total_pages}
-        except Exception as e:
-            logger.error(f"🚫 [qBittorrent"
-                         f"] 获取任务列表时发生错误: {e}", exc_info=True)
-            return False, "❌ 获取 qBittorrent 任务列表时发生内部错误。"
-        finally:
-            self.disconnect_qbit()
+    def invalidate_task_count(self) -> None:
+        with self.task_count_lock:
+            self.task_count_cache.clear()
+
+    def _count_torrents(self, client: Client, status_filter: Optional[str], category: Optional[str]) -> int:
+        """符合筛选条件的任务总数，缓存 QBTASKS_COUNT_TTL_SECONDS 秒；不筛选时使用 torrents/count 接口。"""
+        key = (status_filter, category)
+        with self.task_count_lock:
+            cached = self.task_count_cache.get(key)
+        if cached and time.monotonic() - cached[1] < self.config.QBTASKS_COUNT_TTL_SECONDS:
+            return cached[0]
+        count: Optional[int] = None
+        if status_filter in (None, "all") and category is None:
+            try:
+                count = int(client.torrents_count())
+            except Exception as e:
+                logger.debug(f"🐛 [qBittorrent] torrents_count 不可用 ({e})，改为统计任务列表。")
+        if count is None:
+            count = len(client.torrents_info(status_filter=status_filter, category=category) or [])
+        with self.task_count_lock:
+            self.task_count_cache[key] = (count, time.monotonic())
+        return count
+
+    def _get_all_torrents_info_sync(self, page: int = 1, items_per_page: int = 10,
+                                    status_filter: Optional[str] = None,
+                                    category: Optional[str] = None) -> Tuple[bool, Union[Dict[str, Any], str]]:
+        with self.pool.connection() as client:
+            if client is None: return False, "🚫 无法连接到 qBittorrent 服务器。请检查配置和服务器状态。"
+            try:
+                total_torrents = self._count_torrents(client, status_filter, category)
+                total_pages = math.ceil(total_torrents / items_per_page) if total_torrents > 0 else 0
+                current_page = max(1, min(page, total_pages or 1))
+
+                # 排序和分页由 qBittorrent 完成，每次只传输当前页的任务
+                torrents_for_page: Optional[TorrentInfoList] = client.torrents_info(
+                    status_filter=status_filter, category=category, sort="added_on", reverse=True,
+                    limit=items_per_page, offset=(current_page - 1) * items_per_page) if total_torrents else None
+                torrents_for_page = torrents_for_page or []
+
+                parts = []
+                for t in torrents_for_page:
+                    original_name = t.name
+                    state_emoji = self._get_torrent_state_emoji(t.state, t.progress)
+
+                    parsed_id: Optional[str] = None
+                    parsed_category_from_name: Optional[str] = None
+                    parsed_title_text: str = original_name
+
+                    match = re.match(r'^\[(\d+)](?:\[([^]]*)])?(.*)$', original_name)
+                    if match:
+                        parsed_id = match.group(1)
+                        parsed_category_from_name = match.group(2) if match.group(2) else None
+                        title_candidate = match.group(3).strip()
+                        if title_candidate:
+                            parsed_title_text = title_candidate
+                        elif parsed_category_from_name:
+                            parsed_title_text = f"<i>(ID: {parsed_id}, 分类: {parsed_category_from_name} - 无主标题)</i>"
+                        else:
+                            parsed_title_text = f"<i>(ID: {parsed_id} - 无主标题)</i>"
+
+                    title_display = html.escape(parsed_title_text[:60]) + ('...' if len(parsed_title_text) > 60 else '')
+                    if not parsed_title_text.strip() or parsed_title_text.startswith(
+                            "<i>("):
+                        if not match:
+                            title_display = html.escape(original_name[:60]) + ('...' if len(original_name) > 60 else '')
+
+                    info_lines = [f"{state_emoji} <b>{title_display}</b>"]
+                    if parsed_id:
+                        info_lines.append(f"└─◉ 🆔 MT ID: <code>{html.escape(parsed_id)}</code>")
+                    info_lines.append(f"└─◉ 💾 下载状态: {self.format_bytes(t.size)} | 📈 {t.progress * 100:.1f}%")
+                    info_lines.append(
+                        f"└─◉ 🚀 当前速度: ↓{self.format_bytes(t.dlspeed)}/s ↑{self.format_bytes(t.upspeed)}/s")
+                    info_lines.append(f"└─◉ 🏷️ 当前分类: <code>{html.escape(t.category) if t.category else '无'}</code>")
+
+                    parts.append("\n".join(info_lines))
+
+                return True, {"message_parts": parts, "total_torrents": total_torrents, "current_page": current_page,
+                              "total_pages": total_pages}
+            except Exception as e:
+                self.pool.report_error(client, e)
+                logger.error(f"🚫 [qBittorrent"
+                             f"] 获取任务列表时发生错误: {e}", exc_info=True)
+                return False, "❌ 获取 qBittorrent 任务列表时发生内部错误。"
+
+    async def get_all_torrents_info(self, page: int = 1, items_per_page: int = 10,
+                                    status_filter: Optional[str] = None,
+                                    category: Optional[str] = None) -> Tuple[bool, Union[Dict[str, Any], str]]:
+        return await run_blocking(self.executor, self._get_all_torrents_info_sync, page, items_per_page,
+                                  status_filter, category)
 
     @staticmethod
     def extract_id_from_name(torrent_name: str) -> Optional[str]:
         match = re.match(r'^\[(\d+)]', torrent_name)
         return match.group(1) if match else None
 
+    def _find_torrent_by_mteam_id(self, client: Client, mteam_id: str) -> Optional[Any]:
+        self.index.refresh(client)
+        torrent_hash = self.index.lookup(mteam_id)
+        torrents = client.torrents_info(torrent_hashes=torrent_hash) if torrent_hash else None
+        if torrents:
+            logger.info(f"💡 [qBittorrent] 找到 M-Team ID {mteam_id} 对应的种子 HASH: {torrent_hash}")
+            return torrents[0]
+        logger.info(f"💡 [qBittorrent] 未找到 M-Team ID {mteam_id} 对应的种子。")
+        return None
+
+    def _find_torrent_hash_by_mteam_id_sync(self, mteam_id: str) -> Optional[str]:
+        with self.pool.connection() as client:
+            if client is None: return None
+            try:
+                self.index.refresh(client)
+                torrent_hash = self.index.lookup(mteam_id)
+                logger.info(f"💡 [qBittorrent] M-Team ID {mteam_id} 对应的种子 HASH: {torrent_hash or '未找到'}")
+                return torrent_hash
+            except Exception as e:
+                self.pool.report_error(client, e)
+                logger.error(f"🚫 [qBittorrent] 按 M-Team ID ({mteam_id}) 查找种子时出错: {e}")
+        return None
+
     async def find_torrent_hash_by_mteam_id(self, mteam_id: str) -> Optional[str]:
-        if not self.connect_qbit(): return None
-        try:
-            for torrent in (self.client.torrents_info() or []):
-                if self.extract_id_from_name(torrent.name) == mteam_id:
-                    logger.info(f"💡 [qBittorrent] 找到 M-Team ID {mteam_id} 对应的种子 HASH: {torrent.hash}")
-                    return torrent.hash
-            logger.info(f"💡 [qBittorrent] 未找到 M-Team ID {mteam_id} 对应的种子。")
-        except Exception as e:
-            logger.error(f"🚫 [qBittorrent] 按 M-Team ID ({mteam_id}) 查找种子时出错: {e}")
-        finally:
-            self.disconnect_qbit()
+        return await run_blocking(self.executor, self._find_torrent_hash_by_mteam_id_sync, mteam_id)
+
+    def _find_torrent_hashes_by_mteam_ids_sync(self, mteam_ids: List[str]) -> Dict[str, Optional[str]]:
+        with self.pool.connection() as client:
+            if client is None: return {}
+            try:
+                self.index.refresh(client)
+            except Exception as e:
+                self.pool.report_error(client, e)
+                logger.error(f"🚫 [qBittorrent] 批量查找种子时刷新索引出错: {e}")
+                return {}
+        return {mteam_id: self.index.lookup(mteam_id) for mteam_id in mteam_ids}
+
+    async def find_torrent_hashes_by_mteam_ids(self, mteam_ids: List[str]) -> Dict[str, Optional[str]]:
+        """批量查找时只刷新一次索引。"""
+        return await run_blocking(self.executor, self._find_torrent_hashes_by_mteam_ids_sync, mteam_ids)
+
+    def _get_torrent_name_and_category_sync(self, torrent_hash: str) -> Optional[Tuple[str, str]]:
+        with self.pool.connection() as client:
+            if client is None: return None
+            try:
+                info_list = client.torrents_info(torrent_hashes=torrent_hash)
+                if info_list:
+                    return info_list[0].name, info_list[0].category
+            except Exception as e:
+                self.pool.report_error(client, e)
+                logger.error(f"🚫 [qBittorrent] 获取种子 {torrent_hash} 详情时出错: {e}")
         return None
 
-    async def get_all_categories(self) -> Tuple[bool, str]:
-        if not self.connect_qbit(): return False, "🚫 无法连接到 qBittorrent 服务器。"
-        try:
-            categories_dict = self.client.torrent_categories.categories or {}
-            categories = sorted(list(categories_dict.keys()))
+    async def get_torrent_name_and_category(self, torrent_hash: str) -> Optional[Tuple[str, str]]:
+        return await run_blocking(self.executor, self._get_torrent_name_and_category_sync, torrent_hash)
 
-            if not categories:
-                msg = "🗂️ <b>分类列表:</b>\n\n  👉 当前没有任何分类。"
-            else:
-                cat_lines = [
-                    f"  📁 <code>{html.escape(name)}</code>  -  [<code>{html.escape(categories_dict[name].get("savePath", "未知路径"))}</code>]\n"
-                    for name in categories]
-                msg = "🗂️ <b>分类列表:</b>\n\n" + "".join(cat_lines)
-            return True, msg
-        except Exception as e:
-            logger.error(f"🚫 [qBittorrent] 获取分类列表出错: {e}", exc_info=True)
-            return False, "❌ 获取 qBittorrent 分类列表时发生内部错误。"
-        finally:
-            self.disconnect_qbit()
+    def _get_all_categories_sync(self) -> Tuple[bool, str]:
+        with self.pool.connection() as client:
+            if client is None: return False, "🚫 无法连接到 qBittorrent 服务器。"
+            try:
+                categories_dict = client.torrent_categories.categories or {}
+                categories = sorted(list(categories_dict.keys()))
+
+                if not categories:
+                    msg = "🗂️ <b>分类列表:</b>\n\n  👉 当前没有任何分类。"
+                else:
+                    cat_lines = [
+                        f"  📁 <code>{html.escape(name)}</code>  -  [<code>{html.escape(categories_dict[name].get("savePath", "未知路径"))}</code>]\n"
+                        for name in categories]
+                    msg = "🗂️ <b>分类列表:</b>\n\n" + "".join(cat_lines)
+                return True, msg
+            except Exception as e:
+                self.pool.report_error(client, e)
+                logger.error(f"🚫 [qBittorrent] 获取分类列表出错: {e}", exc_info=True)
+                return False, "❌ 获取 qBittorrent 分类列表时发生内部错误。"
 
-    async def get_qb_category_names_list(self) -> Tuple[bool, Union[List[str], str]]:
-        if not self.connect_qbit(): return False, "🚫 无法连接到 qBittorrent 服务器。"
-        try:
-            categories = sorted(list((self.client.torrent_categories.categories or {}).keys()))
-            return True, categories
-        except Exception as e:
-            logger.error(f"🚫 [qBittorrent] 获取分类名称列表出错: {e}", exc_info=True)
-            return False, "❌ 获取 qBittorrent 分类名称列表时发生内部错误。"
-        finally:
-            self.disconnect_qbit()
+    async def get_all_categories(self) -> Tuple[bool, str]:
+        return await run_blocking(self.executor, self._get_all_categories_sync)
 
-    async def set_torrent_category_by_hash(self, torrent_hash: str, new_category: str) -> Tuple[bool, str]:
-        if not self.connect_qbit(): return False, "🚫 无法连接到 qBittorrent 服务器。"
-        cleaned_new_category = new_category.strip()
-        try:
-            torrents = self.client.torrents_info(torrent_hashes=torrent_hash)
-            if not torrents: return False, f"🤷 未在 qBittorrent 中找到 HASH 前缀为 {torrent_hash[:8]}.. 的种子。"
+    def _get_qb_category_names_list_sync(self) -> Tuple[bool, Union[List[str], str]]:
+        with self.pool.connection() as client:
+            if client is None: return False, "🚫 无法连接到 qBittorrent 服务器。"
+            try:
+                categories = sorted(list((client.torrent_categories.categories or {}).keys()))
+                return True, categories
+            except Exception as e:
+                self.pool.report_error(client, e)
+                logger.error(f"🚫 [qBittorrent] 获取分类名称列表出错: {e}", exc_info=True)
+                return False, "❌ 获取 qBittorrent 分类名称列表时发生内部错误。"
 
-            current_torrent = torrents[0]
-            name_esc = html.escape(current_torrent.name[:60]) + ('...' if len(current_torrent.name) > 60 else '')
-            old_cat_esc = html.escape(current_torrent.category) if current_torrent.category else "<i>(无分类)</i>"
-            new_cat_esc = html.escape(cleaned_new_category) if cleaned_new_category else "<i>(移除分类)</i>"
+    async def get_qb_category_names_list(self) -> Tuple[bool, Union[List[str], str]]:
+        return await run_blocking(self.executor, self._get_qb_category_names_list_sync)
 
-            if current_torrent.category == cleaned_new_category:
-                return True, f"💡 分类未更改: 《{name_esc}》已在分类 {new_cat_esc} 中。"
+    def _set_torrent_category_by_hash_sync(self, torrent_hash: str, new_category: str) -> Tuple[bool, str]:
+        with self.pool.connection() as client:
+            if client is None: return False, "🚫 无法连接到 qBittorrent 服务器。"
+            cleaned_new_category = new_category.strip()
+            try:
+                torrents = client.torrents_info(torrent_hashes=torrent_hash)
+                if not torrents: return False, f"🤷 未在 qBittorrent 中找到 HASH 前缀为 {torrent_hash[:8]}.. 的种子。"
+
+                current_torrent = torrents[0]
+                name_esc = html.escape(current_torrent.name[:60]) + ('...' if len(current_torrent.name) > 60 else '')
+                old_cat_esc = html.escape(current_torrent.category) if current_torrent.category else "<i>(无分类)</i>"
+                new_cat_esc = html.escape(cleaned_new_category) if cleaned_new_category else "<i>(移除分类)</i>"
+
+                if current_torrent.category == cleaned_new_category:
+                    return True, f"💡 分类未更改: 《{name_esc}》已在分类 {new_cat_esc} 中。"
+
+                client.torrents_set_category(torrent_hashes=torrent_hash, category=cleaned_new_category)
+                action_text = "移除分类成功" if not cleaned_new_category else "分类更新成功"
+                return True, f"✅ {action_text}: 《{name_esc}》\n  旧分类: {old_cat_esc}\n  新分类: {new_cat_esc}"
+            except APIError as e:
+                self.pool.report_error(client, e)
+                if "incorrect category name" in str(e).lower() or "不正确的分类名" in str(e):
+                    return False, f"🚫 qBittorrent API错误: 分类 “{html.escape(cleaned_new_category)}” 无效或不存在。请先在qB中创建该分类。"
+                logger.error(f"🚫 [qBittorrent] 设置分类API错误 (HASH: {torrent_hash}): {e}")
+                return False, f"🚫 qBittorrent API错误: {html.escape(str(e))}"
+            except Exception as e:
+                self.pool.report_error(client, e)
+                logger.error(f"🚫 [qBittorrent] 设置分类时发生内部错误 (HASH: {torrent_hash}): {e}", exc_info=True)
+                return False, "❌ 设置分类时发生内部错误。"
 
-            self.client.torrents_set_category(torrent_hashes=torrent_hash, category=cleaned_new_category)
-            action_text = "移除分类成功" if not cleaned_new_category else "分类更新成功"
-            return True, f"✅ {action_text}: 《{name_esc}》\n  旧分类: {old_cat_esc}\n  新分类: {new_cat_esc}"
-        except APIError as e:
-            if "incorrect category name" in str(e).lower() or "不正确的分类名" in str(e):
-                return False, f"🚫 qBittorrent API错误: 分类 “{html.escape(cleaned_new_category)}” 无效或不存在。请先在qB中创建该分类。"
-            logger.error(f"🚫 [qBittorrent] 设置分类API错误 (HASH: {torrent_hash}): {e}")
-            return False, f"🚫 qBittorrent API错误: {html.escape(str(e))}"
-        except Exception as e:
-            logger.error(f"🚫 [qBittorrent] 设置分类时发生内部错误 (HASH: {torrent_hash}): {e}", exc_info=True)
-            return False, "❌ 设置分类时发生内部错误。"
-        finally:
-            self.disconnect_qbit()
+    async def set_torrent_category_by_hash(self, torrent_hash: str, new_category: str) -> Tuple[bool, str]:
+        return await run_blocking(self.executor, self._set_torrent_category_by_hash_sync, torrent_hash, new_category)
 
     async def add_mteam_torrent(self, mteam_id_str: str, user_specified_qb_category: Optional[str]) -> Tuple[bool, str]:
         logger.info(
             f"💡 [MT->qBittorrent] 准备添加 M-Team 种子 {mteam_id_str} (指定分类: {user_specified_qb_category})")
-
-        api_details = await asyncio.to_thread(self.mteam_manager.get_torrent_details, mteam_id_str)
+        started = time.perf_counter()
+
+        # 种子详情、下载链接 (选中搜索结果时已在后台预热) 和 qB 重复检查互不依赖，并发执行
+        api_details, download_url, existing_torrent = await asyncio.gather(
+            self.mteam_manager.get_torrent_details_cached(mteam_id_str),
+            self.mteam_manager.get_torrent_download_url_cached(mteam_id_str),
+            run_blocking(self.executor, self._find_existing_torrent_sync, mteam_id_str))
+        logger.info(f"⏱️ [MT->qBittorrent] M-Team ID {mteam_id_str} 的详情、下载链接和重复检查耗时 "
+                    f"{time.perf_counter() - started:.2f} 秒")
         if not api_details:
             return False, f"🤷 无法获取 M-Team ID <code>{html.escape(mteam_id_str)}</code> 的详细信息。请检查ID是否正确或 M-Team API 是否工作正常。"
 
@@ -510,86 +967,106 @@ class QBittorrentManager:
 
         actual_category = (user_specified_qb_category if user_specified_qb_category is not None
                            else self.config.QBIT_DEFAULT_CATEGORY_FOR_MT).strip()
-        actual_cat_esc = html.escape(actual_category) if actual_category else "<i>(无分类)</i>"
 
         qb_name = generate_qb_torrent_name_for_mt(mteam_id_str, api_details, actual_category)
-        qb_name_esc = html.escape(qb_name)
 
-        download_url = await asyncio.to_thread(self.mteam_manager.get_torrent_download_url, mteam_id_str)
+        if existing_torrent:
+            existing_torrent_name, existing_torrent_cat = existing_torrent
+            return True, (f"💡 <b>种子已存在于 qBittorrent 中</b>\n"
+                          f"  标题: {title_short_esc} (<a href=\"{mt_detail_url}\">M-Team详情</a>)\n"
+                          f"  M-Team ID: <code>{mteam_id_str}</code>\n"
+                          f"  任务名称: {html.escape(existing_torrent_name)}\n"
+                          f"  任务分类: {html.escape(existing_torrent_cat or '(无分类)')}")
+
         if not download_url:
             return False, f"🤷 无法为 M-Team ID <code>{html.escape(mteam_id_str)}</code> 生成下载链接。可能是M-Team API问题或种子已失效。"
 
-        if not self.connect_qbit(): return False, "🚫 无法连接到 qBittorrent 服务器。"
-        try:
-            existing_hash = await self.find_torrent_hash_by_mteam_id(mteam_id_str)
-            if existing_hash:
-                if not self.connect_qbit(): return False, "🚫 无法重新连接到 qBittorrent 服务器以检查现有任务。"
-                existing_torrents = self.client.torrents_info(torrent_hashes=existing_hash)
-                if existing_torrents:
-                    existing_torrent_name = html.escape(existing_torrents[0].name)
-                    existing_torrent_cat = html.escape(existing_torrents[0].category or '(无分类)')
-                    return True, (f"💡 <b>种子已存在于 qBittorrent 中</b>\n"
-                                  f"  标题: {title_short_esc} (<a href=\"{mt_detail_url}\">M-Team详情</a>)\n"
-                                  f"  M-Team ID: <code>{mteam_id_str}</code>\n"
-                                  f"  任务名称: {existing_torrent_name}\n"
-                                  f"  任务分类: {existing_torrent_cat}")
-
-            if not self.connect_qbit(): return False, "🚫 无法重新连接到 qBittorrent 服务器以添加任务。"
-
-            res = self.client.torrents_add(
-                urls=download_url,
-                category=actual_category,
-                rename=qb_name,
-                tags=self.config.QBIT_DEFAULT_TAGS_FOR_MT,
-                paused=False,
-                sequential=True,
-                first_last_piece_prio=True
-            )
+        result = await run_blocking(self.executor, self._add_torrent_to_qb_sync, mteam_id_str, download_url,
+                                    actual_category, qb_name, title_short_esc, mt_detail_url)
+        # 下载链接已交给 qBittorrent，不再复用
+        self.mteam_manager.download_url_cache.discard(mteam_id_str)
+        logger.info(f"⏱️ [MT->qBittorrent] 添加 M-Team 种子 {mteam_id_str} 共耗时 {time.perf_counter() - started:.2f} 秒")
+        return result
 
-            msg_base = (f"  标题: {title_short_esc} (<a href=\"{mt_detail_url}\">M-Team详情</a>)\n"
-                        f"  M-Team ID: <code>{mteam_id_str}</code>\n"
-                        f"  qB任务名: {qb_name_esc}\n"
-                        f"  qB分类: {actual_cat_esc}")
-
-            if str(res).lower().strip() == "ok." or res is True:
-                return True, f"✅ <b>成功添加种子到 qB</b>\n{msg_base}"
+    def _find_existing_torrent_sync(self, mteam_id: str) -> Optional[Tuple[str, str]]:
+        with self.pool.connection() as client:
+            if client is None: return None
+            try:
+                torrent = self._find_torrent_by_mteam_id(client, mteam_id)
+                return (torrent.name, torrent.category) if torrent else None
+            except Exception as e:
+                self.pool.report_error(client, e)
+                logger.error(f"🚫 [qBittorrent] 按 M-Team ID ({mteam_id}) 检查重复种子时出错: {e}")
+        return None
 
-            logger.warning(f"qBittorrent 添加种子 {mteam_id_str} 响应非预期: {res}")
-            return False, f"⚠️ 添加种子到 qBittorrent 时，服务器响应为 “{html.escape(str(res))}” 而非 “Ok.”。\n{msg_base}\n请检查 qBittorrent 客户端确认任务状态。"
-        except APIError as e:
-            if any(p in str(e).lower() for p in
-                   ["already in the download list", "种子已存在", "torrent is already in the download session"]):
-                return True, (f"💡 <b>种子已在 qBittorrent 下载会话中 (API报告重复)</b>\n"
-                              f"  标题: {title_short_esc} (<a href=\"{mt_detail_url}\">M-Team详情</a>)\n"
-                              f"  M-Team ID: <code>{mteam_id_str}</code>")
-            logger.error(f"🚫 [qBittorrent] 添加种子 {mteam_id_str} 时发生 API 错误: {e}")
-            return False, f"🚫 qBittorrent API 错误: {html.escape(str(e))}"
-        except Exception as e:
-            logger.error(f"🚫 [qBittorrent] 添加种子 {mteam_id_str} 时发生内部错误: {e}", exc_info=True)
-            return False, "❌ 添加种子到 qBittorrent 时发生内部错误。"
-        finally:
-            self.disconnect_qbit()
+    def _add_torrent_to_qb_sync(self, mteam_id_str: str, download_url: str, actual_category: str, qb_name: str,
+                                title_short_esc: str, mt_detail_url: str) -> Tuple[bool, str]:
+        actual_cat_esc = html.escape(actual_category) if actual_category else "<i>(无分类)</i>"
+        qb_name_esc = html.escape(qb_name)
+        with self.pool.connection() as client:
+            if client is None: return False, "🚫 无法连接到 qBittorrent 服务器。"
+            try:
+                res = client.torrents_add(
+                    urls=download_url,
+                    category=actual_category,
+                    rename=qb_name,
+                    tags=self.config.QBIT_DEFAULT_TAGS_FOR_MT,
+                    paused=False,
+                    sequential=True,
+                    first_last_piece_prio=True
+                )
 
-    async def delete_torrent_by_hash(self, torrent_hash: str, delete_files: bool) -> Tuple[bool, str]:
-        if not self.connect_qbit(): return False, "🚫 无法连接到 qBittorrent 服务器。"
-        try:
-            torrents = self.client.torrents_info(torrent_hashes=torrent_hash)
-            if not torrents: return False, f"🤷 未在 qBittorrent 中找到 HASH 前缀为 {torrent_hash[:8]}.. 的种子。"
+                msg_base = (f"  标题: {title_short_esc} (<a href=\"{mt_detail_url}\">M-Team详情</a>)\n"
+                            f"  M-Team ID: <code>{mteam_id_str}</code>\n"
+                            f"  qB任务名: {qb_name_esc}\n"
+                            f"  qB分类: {actual_cat_esc}")
+
+                if str(res).lower().strip() == "ok." or res is True:
+                    self.index.expect(qb_name, mteam_id_str)
+                    self.invalidate_task_count()
+                    return True, f"✅ <b>成功添加种子到 qB</b>\n{msg_base}"
+
+                logger.warning(f"qBittorrent 添加种子 {mteam_id_str} 响应非预期: {res}")
+                return False, f"⚠️ 添加种子到 qBittorrent 时，服务器响应为 “{html.escape(str(res))}” 而非 “Ok.”。\n{msg_base}\n请检查 qBittorrent 客户端确认任务状态。"
+            except APIError as e:
+                self.pool.report_error(client, e)
+                if any(p in str(e).lower() for p in
+                       ["already in the download list", "种子已存在", "torrent is already in the download session"]):
+                    return True, (f"💡 <b>种子已在 qBittorrent 下载会话中 (API报告重复)</b>\n"
+                                  f"  标题: {title_short_esc} (<a href=\"{mt_detail_url}\">M-Team详情</a>)\n"
+                                  f"  M-Team ID: <code>{mteam_id_str}</code>")
+                logger.error(f"🚫 [qBittorrent] 添加种子 {mteam_id_str} 时发生 API 错误: {e}")
+                return False, f"🚫 qBittorrent API 错误: {html.escape(str(e))}"
+            except Exception as e:
+                self.pool.report_error(client, e)
+                logger.error(f"🚫 [qBittorrent] 添加种子 {mteam_id_str} 时发生内部错误: {e}", exc_info=True)
+                return False, "❌ 添加种子到 qBittorrent 时发生内部错误。"
 
-            name = torrents[0].name
-            name_esc = html.escape(name[:60]) + ('...' if len(name) > 60 else '')
+    def _delete_torrent_by_hash_sync(self, torrent_hash: str, delete_files: bool) -> Tuple[bool, str]:
+        with self.pool.connection() as client:
+            if client is None: return False, "🚫 无法连接到 qBittorrent 服务器。"
+            try:
+                torrents = client.torrents_info(torrent_hashes=torrent_hash)
+                if not torrents: return False, f"🤷 未在 qBittorrent 中找到 HASH 前缀为 {torrent_hash[:8]}.. 的种子。"
+
+                name = torrents[0].name
+                name_esc = html.escape(name[:60]) + ('...' if len(name) > 60 else '')
+
+                client.torrents_delete(torrent_hashes=torrent_hash, delete_files=delete_files)
+                self.invalidate_task_count()
+                action_desc = "并删除了相关文件" if delete_files else "(任务已移除，文件未删除)"
+                return True, f"🗑️ 种子 《{name_esc}》 已从 qBittorrent 删除 {action_desc}。"
+            except APIError as e:
+                self.pool.report_error(client, e)
+                logger.error(f"🚫 [qBittorrent] 删除种子 HASH {torrent_hash} 时发生 API 错误: {e}")
+                return False, f"🚫 qBittorrent API 错误: {html.escape(str(e))}"
+            except Exception as e:
+                self.pool.report_error(client, e)
+                logger.error(f"🚫 [qBittorrent] 删除种子 HASH {torrent_hash} 时发生内部错误: {e}", exc_info=True)
+                return False, f"❌ 删除种子时发生内部错误: {html.escape(str(e))}"
 
-            self.client.torrents_delete(torrent_hashes=torrent_hash, delete_files=delete_files)
-            action_desc = "并删除了相关文件" if delete_files else "(任务已移除，文件未删除)"
-            return True, f"🗑️ 种子 《{name_esc}》 已从 qBittorrent 删除 {action_desc}。"
-        except APIError as e:
-            logger.error(f"🚫 [qBittorrent] 删除种子 HASH {torrent_hash} 时发生 API 错误: {e}")
-            return False, f"🚫 qBittorrent API 错误: {html.escape(str(e))}"
-        except Exception as e:
-            logger.error(f"🚫 [qBittorrent] 删除种子 HASH {torrent_hash} 时发生内部错误: {e}", exc_info=True)
-            return False, f"❌ 删除种子时发生内部错误: {html.escape(str(e))}"
-        finally:
-            self.disconnect_qbit()
+    async def delete_torrent_by_hash(self, torrent_hash: str, delete_files: bool) -> Tuple[bool, str]:
+        return await run_blocking(self.executor, self._delete_torrent_by_hash_sync, torrent_hash, delete_files)
 
 
 async def get_main_keyboard() -> ReplyKeyboardMarkup:
@@ -638,11 +1115,14 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         f"  <code>{CANCEL_OPT}</code>: 取消当前操。\n\n"
         "<b>快捷命令:</b>\n"
         "  <code>/start</code> - 显示主菜单，开始交互。\n"
-        "  <code>/add &lt;M-Team ID&gt;</code> - 直接添加指定 M-Team ID 的种子到 qBittorrent。例如: <code>/add 12345</code>\n"
+        "  <code>/add &lt;M-Team ID&gt; [...]</code> - 直接添加指定 M-Team ID 的种子到 qBittorrent，可一次添加多个。"
+        "例如: <code>/add 12345</code>、<code>/add 12345 12346</code>\n"
+        "  💡 添加、修改分类、删除任务时都可以一次输入多个 M-Team ID (用空格、逗号或换行分隔)，将并发处理并显示进度。\n"
         "  <code>/cancel</code> - (在操作过程中) 取消当前操作。\n"
         "  <code>/help</code> - 显示此帮助信息。\n"
         "  <code>/listcats</code> - 显示 qBittorrent 中的所有分类及其保存路径。\n"
-        "  <code>/qbtasks [页码]</code> - 分页显示 qBittorrent 中的任务列表。例如: <code>/qbtasks 2</code>。\n"
+        "  <code>/qbtasks [页码] [状态] [分类]</code> - 分页显示 qBittorrent 中的任务列表，可按状态 (如 downloading、seeding、"
+        "错误) 和分类筛选，分类写 <code>无</code> 表示未分类。例如: <code>/qbtasks 2 seeding 电影</code>。\n"
     )
     await update.message.reply_html(help_text, reply_markup=await get_main_keyboard())
 
@@ -684,9 +1164,22 @@ async def qbtasks_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
 
     page = 1
-    if context.args and context.args[0].isdigit():
-        page = int(context.args[0])
-        if page < 1: page = 1
+    status_filter: Optional[str] = None
+    category_parts: List[str] = []
+    for arg in context.args or []:
+        if arg.isdigit():
+            page = max(1, int(arg))
+        elif arg.lower() in QBTASKS_STATUS_FILTERS:
+            status_filter = arg.lower()
+        elif arg in QBTASKS_STATUS_ALIASES:
+            status_filter = QBTASKS_STATUS_ALIASES[arg]
+        else:
+            category_parts.append(arg)
+    category = " ".join(category_parts) if category_parts else None
+    if category == "无":
+        category = ""
+    # 翻页按钮的回调数据只携带页码，筛选条件按聊天保存
+    context.chat_data["qbtasks_filter"] = (status_filter, category)
 
     await _display_torrent_page(update, context, page, initial_command_message=update.message)
 
@@ -726,7 +1219,9 @@ async def _display_torrent_page(
         if isinstance(update_obj, telegram.CallbackQuery): await update_obj.answer("抱歉，您无权操作。", show_alert=True)
         return
 
-    success, data = await qb_manager.get_all_torrents_info(page=page_num)
+    status_filter, category = context.chat_data.get("qbtasks_filter", (None, None))
+    success, data = await qb_manager.get_all_torrents_info(page=page_num, status_filter=status_filter,
+                                                           category=category)
 
     text_content: str
     reply_markup_content: Optional[InlineKeyboardMarkup] = None
@@ -734,11 +1229,18 @@ async def _display_torrent_page(
     if success and isinstance(data, dict):
         header = (
             f"📋 <b>任务列表</b> (共 {data.get('total_torrents', 0)} 个) - [ 第 <b>{data.get('current_page', 1)} / {data.get('total_pages', 0)}</b> 页 ]")
+        filter_parts = []
+        if status_filter and status_filter != "all":
+            filter_parts.append(f"状态 <code>{html.escape(status_filter)}</code>")
+        if category is not None:
+            filter_parts.append(f"分类 <code>{html.escape(category) if category else '无'}</code>")
+        if filter_parts:
+            header += "\n🔎 筛选: " + ", ".join(filter_parts)
 
         if data.get('message_parts'):
             text_content = header + "\n\n" + "\n\n".join(data['message_parts'])
         elif data.get('total_torrents', 0) == 0:
-            text_content = header + "\n\n💡 qBittorrent 中当前没有任何任务。"
+            text_content = header + ("\n\n💡 没有符合筛选条件的任务。" if filter_parts else "\n\n💡 qBittorrent 中当前没有任何任务。")
         else:
             text_content = header + "\n\n💡 当前页没有任务显示。"
 
@@ -852,17 +1354,166 @@ async def _get_category_selection_buttons(context: ContextTypes.DEFAULT_TYPE, pr
     return InlineKeyboardMarkup(buttons)
 
 
+def parse_mteam_ids(text: str) -> Tuple[List[str], List[str]]:
+    """从以空格、逗号或换行分隔的文本中解析 M-Team ID (也接受种子详情页链接)，返回 (去重后的 ID 列表, 无效项)。"""
+    mteam_ids: List[str] = []
+    invalid: List[str] = []
+    for token in re.split(r'[\s,，;；]+', text.strip()):
+        if not token:
+            continue
+        match = MTEAM_ID_TOKEN_PATTERN.match(token)
+        if match:
+            mteam_ids.append(match.group(1))
+        else:
+            invalid.append(token)
+    return list(dict.fromkeys(mteam_ids)), invalid
+
+
+def _validate_mteam_ids(mteam_ids: List[str], invalid: List[str], config: Config) -> Optional[str]:
+    """返回输入有误时的提示文本，输入有效时返回 None。"""
+    if invalid:
+        return (f"⚠️ 以下内容不是有效的 M-Team ID: {html.escape(', '.join(invalid[:10]))}"
+                f"{' ...' if len(invalid) > 10 else ''}\nM-Team ID 应该是纯数字，多个 ID 用空格、逗号或换行分隔。")
+    if not mteam_ids:
+        return "⚠️ 请至少输入一个 M-Team ID。"
+    if len(mteam_ids) > config.BULK_MAX_IDS:
+        return f"⚠️ 一次最多处理 {config.BULK_MAX_IDS} 个 M-Team ID，当前为 {len(mteam_ids)} 个。"
+    return None
+
+
+def _summarize_result(message: str, max_length: int = 60) -> str:
+    """把单个操作的结果消息压缩为一行纯文本 (已转义)，用于批量结果列表。"""
+    first_line = html.unescape(re.sub(r'<[^>]+>', '', message.strip().split("\n", 1)[0])).strip()
+    # 去掉开头的状态图标，结果列表中已有 ✅/❌
+    first_line = re.sub(r'^[^\w《“(]+', '', first_line)
+    return html.escape(first_line[:max_length] + ('...' if len(first_line) > max_length else ''))
+
+
+async def run_bulk_operation(message: telegram.Message, title: str, mteam_ids: List[str],
+                             operation: Callable[[str], Awaitable[Tuple[bool, str]]], config: Config) -> None:
+    """
+    以最多 BULK_CONCURRENCY 个并发执行 operation，在同一条消息中显示进度 (最多每 BULK_PROGRESS_INTERVAL_SECONDS 秒更新一次)，
+    结束后把该消息替换为每个 ID 的结果列表。
+    """
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(config.BULK_CONCURRENCY)
+    results: Dict[str, Tuple[bool, str]] = {}
+
+    async def run_one(mteam_id: str) -> None:
+        async with semaphore:
+            try:
+                results[mteam_id] = await operation(mteam_id)
+            except Exception as e:
+                logger.error(f"🚫 批量操作处理 M-Team ID {mteam_id} 时发生错误: {e}", exc_info=True)
+                results[mteam_id] = (False, "❌ 内部错误")
+
+    def progress_text() -> str:
+        succeeded = sum(1 for ok, _ in results.values() if ok)
+        return (f"🔄 <b>{title}</b>\n进度: {len(results)} / {len(mteam_ids)} "
+                f"(✅ {succeeded}  ❌ {len(results) - succeeded})")
+
+    async def report_progress() -> None:
+        last_text = None
+        while True:
+            text = progress_text()
+            if text != last_text:
+                try:
+                    await message.edit_text(text, parse_mode=ParseMode.HTML)
+                    last_text = text
+                except telegram.error.RetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except telegram.error.TelegramError as e:
+                    logger.debug(f"🐛 更新批量操作进度消息失败: {e}")
+            await asyncio.sleep(config.BULK_PROGRESS_INTERVAL_SECONDS)
+
+    logger.info(f"📦 开始{title}: {len(mteam_ids)} 个 M-Team ID (并发 {config.BULK_CONCURRENCY})")
+    reporter = asyncio.create_task(report_progress())
+    try:
+        await asyncio.gather(*(run_one(mteam_id) for mteam_id in mteam_ids))
+    finally:
+        reporter.cancel()
+
+    elapsed = time.perf_counter() - started
+    succeeded = sum(1 for ok, _ in results.values() if ok)
+    logger.info(f"📦 {title}完成: 成功 {succeeded} / {len(mteam_ids)}，耗时 {elapsed:.1f} 秒")
+    lines = [f"📦 <b>{title}完成</b>: ✅ {succeeded}  ❌ {len(mteam_ids) - succeeded} "
+             f"(共 {len(mteam_ids)} 个, 耗时 {elapsed:.1f} 秒)", ""]
+    for mteam_id in mteam_ids:
+        ok, result_message = results[mteam_id]
+        lines.append(f"{'✅' if ok else '❌'} <code>{mteam_id}</code> {_summarize_result(result_message)}")
+
+    # Telegram 单条消息最多 4096 个字符，结果过多时分成多条发送
+    chunks: List[str] = []
+    current = ""
+    for line in lines:
+        if current and len(current) + len(line) + 1 > 4000:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    chunks.append(current)
+    try:
+        await message.edit_text(chunks[0], parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+    except telegram.error.TelegramError as e:
+        logger.warning(f"编辑批量操作结果消息失败 ({e})，发送新消息。")
+        await message.chat.send_message(chunks[0], parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+    for chunk in chunks[1:]:
+        await message.chat.send_message(chunk, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+
+
+async def bulk_set_category(message: telegram.Message, context: ContextTypes.DEFAULT_TYPE, mteam_ids: List[str],
+                            new_category: str) -> None:
+    qb_manager: QBittorrentManager = context.bot_data['qb_manager']
+    hashes = await qb_manager.find_torrent_hashes_by_mteam_ids(mteam_ids)
+
+    async def set_category(mteam_id: str) -> Tuple[bool, str]:
+        if not hashes.get(mteam_id):
+            return False, "🤷 未在 qBittorrent 中找到对应的任务"
+        return await qb_manager.set_torrent_category_by_hash(hashes[mteam_id], new_category)
+
+    title = f"批量修改分类为 “{html.escape(new_category)}”" if new_category else "批量移除分类"
+    await run_bulk_operation(message, title, mteam_ids, set_category, context.bot_data['config'])
+
+
+async def bulk_delete(message: telegram.Message, context: ContextTypes.DEFAULT_TYPE, mteam_ids: List[str],
+                      delete_files: bool) -> None:
+    qb_manager: QBittorrentManager = context.bot_data['qb_manager']
+    hashes = await qb_manager.find_torrent_hashes_by_mteam_ids(mteam_ids)
+
+    async def delete(mteam_id: str) -> Tuple[bool, str]:
+        if not hashes.get(mteam_id):
+            return False, "🤷 未在 qBittorrent 中找到对应的任务"
+        return await qb_manager.delete_torrent_by_hash(hashes[mteam_id], delete_files)
+
+    title = "批量删除任务和文件" if delete_files else "批量删除任务 (保留文件)"
+    await run_bulk_operation(message, title, mteam_ids, delete, context.bot_data['config'])
+
+
 async def received_add_mt_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if not update.message or not update.message.text: return ASK_ADD_MT_ID
 
-    mt_id = update.message.text.strip()
-    if not mt_id.isdigit():
+    mt_ids, invalid = parse_mteam_ids(update.message.text)
+    error_text = _validate_mteam_ids(mt_ids, invalid, context.bot_data['config'])
+    if error_text:
         await update.message.reply_text(
-            "⚠️ M-Team ID 应该是纯数字，请检查后重新输入，或使用 /cancel 取消。",
+            f"{error_text}\n请检查后重新输入，或使用 /cancel 取消。",
             reply_markup=ReplyKeyboardRemove()
         )
         return ASK_ADD_MT_ID
 
+    if len(mt_ids) > 1:
+        context.user_data['add_mt_ids'] = mt_ids
+        logger.info(f"用户 {update.effective_user.id} 输入了 {len(mt_ids)} 个M-Team ID 用于批量添加。")
+        reply_markup = await _get_category_selection_buttons(context, ADD_CAT_PREFIX)
+        await update.message.reply_html(
+            f"已收到 {len(mt_ids)} 个 M-Team ID: <code>{html.escape(' '.join(mt_ids[:20]))}</code>"
+            f"{' ...' if len(mt_ids) > 20 else ''}\n"
+            f"请选择要将它们添加到的 qBittorrent 分类:",
+            reply_markup=reply_markup
+        )
+        return SELECTING_ADD_CATEGORY
+
+    mt_id = mt_ids[0]
     context.user_data['add_mt_id'] = mt_id
     logger.info(f"用户 {update.effective_user.id} 输入了M-Team ID: {mt_id} 用于添加。")
 
@@ -881,6 +1532,7 @@ async def handle_add_category_selection(update: Update, context: ContextTypes.DE
     await query.answer()
 
     chosen_option_full = query.data
+    tapped_at = time.perf_counter()
     logger.info(f"用户 {query.from_user.id} 为添加任务选择了分类选项: {chosen_option_full}")
 
     if chosen_option_full == f"{ADD_CAT_PREFIX}_cancel_":
@@ -892,8 +1544,9 @@ async def handle_add_category_selection(update: Update, context: ContextTypes.DE
 
     chosen_option = chosen_option_full[len(ADD_CAT_PREFIX):]
 
+    mt_ids = context.user_data.pop('add_mt_ids', None)
     mt_id = context.user_data.pop('add_mt_id', None)
-    if not mt_id:
+    if not mt_id and not mt_ids:
         logger.error("内部错误：handle_add_category_selection 中 M-Team ID 丢失。")
         await query.edit_message_text("❌ 内部错误：M-Team ID 信息丢失，无法继续操作。", reply_markup=None)
         return await cancel_conversation(update, context)
@@ -907,6 +1560,13 @@ async def handle_add_category_selection(update: Update, context: ContextTypes.DE
     else:
         selected_category = chosen_option
 
+    qb_manager: QBittorrentManager = context.bot_data['qb_manager']
+    if mt_ids:
+        category_display = html.escape(selected_category) if selected_category else "无分类"
+        await run_bulk_operation(query.message, f"批量添加到分类 “{category_display}”", mt_ids,
+                                 lambda i: qb_manager.add_mteam_torrent(i, selected_category), config)
+        return CHOOSING_ACTION
+
     processing_text = (f"🔄 正在处理 M-Team ID <code>{html.escape(mt_id)}</code>...\n"
                        f"目标分类: {html.escape(selected_category) if selected_category else '<i>无分类</i>'}\n"
                        f"请稍候...")
@@ -915,7 +1575,6 @@ async def handle_add_category_selection(update: Update, context: ContextTypes.DE
     except telegram.error.BadRequest:
         pass
 
-    qb_manager: QBittorrentManager = context.bot_data['qb_manager']
     success, message = await qb_manager.add_mteam_torrent(mt_id, selected_category)
 
     try:
@@ -930,6 +1589,8 @@ async def handle_add_category_selection(update: Update, context: ContextTypes.DE
             reply_markup=await get_main_keyboard(),
             disable_web_page_preview=True
         )
+    logger.info(f"⏱️ M-Team ID {mt_id} 从选择分类到显示添加结果 ({'成功' if success else '失败'}) "
+                f"耗时 {time.perf_counter() - tapped_at:.2f} 秒")
 
     context.user_data.pop('search_keywords', None)
     context.user_data.pop('last_search_results', None)
@@ -937,19 +1598,44 @@ async def handle_add_category_selection(update: Update, context: ContextTypes.DE
     return CHOOSING_ACTION
 
 
+async def _get_setcat_category_buttons(qb_manager: "QBittorrentManager") -> InlineKeyboardMarkup:
+    buttons_list: List[List[InlineKeyboardButton]] = []
+    status, categories_or_error = await qb_manager.get_qb_category_names_list()
+    if status and isinstance(categories_or_error, list):
+        for cat_name in categories_or_error[:15]:
+            buttons_list.append(
+                [InlineKeyboardButton(f"📁 {html.escape(cat_name)}", callback_data=f"{MOD_CAT_PREFIX}{cat_name}")])
+
+    buttons_list.append([InlineKeyboardButton("🚫 移除当前分类", callback_data=f"{MOD_CAT_PREFIX}_remove_")])
+    buttons_list.append([InlineKeyboardButton("↩️ 取消操作", callback_data=f"{MOD_CAT_PREFIX}_cancel_")])
+    return InlineKeyboardMarkup(buttons_list)
+
+
 async def received_setcat_mt_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if not update.message or not update.message.text: return ASK_SETCAT_MT_ID
 
-    mt_id = update.message.text.strip()
-    if not mt_id.isdigit():
+    mt_ids, invalid = parse_mteam_ids(update.message.text)
+    error_text = _validate_mteam_ids(mt_ids, invalid, context.bot_data['config'])
+    if error_text:
         await update.message.reply_text(
-            "⚠️ M-Team ID 应该是纯数字，请检查后重新输入，或使用 /cancel 取消。",
+            f"{error_text}\n请检查后重新输入，或使用 /cancel 取消。",
             reply_markup=await get_main_keyboard()
         )
         return ASK_SETCAT_MT_ID
 
-    logger.info(f"用户 {update.effective_user.id} 输入了M-Team ID: {mt_id} 用于修改分类。")
     qb_manager: QBittorrentManager = context.bot_data['qb_manager']
+    if len(mt_ids) > 1:
+        context.user_data['setcat_mt_ids'] = mt_ids
+        logger.info(f"用户 {update.effective_user.id} 输入了 {len(mt_ids)} 个M-Team ID 用于批量修改分类。")
+        await update.message.reply_html(
+            f"已收到 {len(mt_ids)} 个 M-Team ID: <code>{html.escape(' '.join(mt_ids[:20]))}</code>"
+            f"{' ...' if len(mt_ids) > 20 else ''}\n\n<b>请选择新的分类:</b>",
+            reply_markup=await _get_setcat_category_buttons(qb_manager)
+        )
+        return SELECTING_SETCAT_CATEGORY
+
+    mt_id = mt_ids[0]
+    logger.info(f"用户 {update.effective_user.id} 输入了M-Team ID: {mt_id} 用于修改分类。")
 
     processing_msg = await update.message.reply_text(
         f"🔄 正在 qBittorrent 中查找 M-Team ID <code>{html.escape(mt_id)}</code> 对应的任务...")
@@ -969,36 +1655,18 @@ async def received_setcat_mt_id(update: Update, context: ContextTypes.DEFAULT_TY
 
     torrent_name_display = "未知任务"
     current_category_display = "<i>未知</i>"
-    if qb_manager.connect_qbit():
-        try:
-            info_list = qb_manager.client.torrents_info(torrent_hashes=torrent_hash)
-            if info_list:
-                torrent_info = info_list[0]
-                torrent_name_display = html.escape(
-                    torrent_info.name[:60] + ('...' if len(torrent_info.name) > 60 else ''))
-                current_category_display = html.escape(
-                    torrent_info.category) if torrent_info.category else "<i>(无分类)</i>"
-        except Exception as e:
-            logger.error(f"获取种子 {torrent_hash} 详情时出错: {e}")
-        finally:
-            qb_manager.disconnect_qbit()
-
-    buttons_list: List[List[InlineKeyboardButton]] = []
-    status, categories_or_error = await qb_manager.get_qb_category_names_list()
-    if status and isinstance(categories_or_error, list):
-        for cat_name in categories_or_error[:15]:
-            buttons_list.append(
-                [InlineKeyboardButton(f"📁 {html.escape(cat_name)}", callback_data=f"{MOD_CAT_PREFIX}{cat_name}")])
-
-    buttons_list.append([InlineKeyboardButton("🚫 移除当前分类", callback_data=f"{MOD_CAT_PREFIX}_remove_")])
-    buttons_list.append([InlineKeyboardButton("↩️ 取消操作", callback_data=f"{MOD_CAT_PREFIX}_cancel_")])
+    name_and_category = await qb_manager.get_torrent_name_and_category(torrent_hash)
+    if name_and_category:
+        torrent_name, torrent_category = name_and_category
+        torrent_name_display = html.escape(torrent_name[:60] + ('...' if len(torrent_name) > 60 else ''))
+        current_category_display = html.escape(torrent_category) if torrent_category else "<i>(无分类)</i>"
 
     await processing_msg.edit_text(
         f"找到任务: 《<b>{torrent_name_display}</b>》\n"
         f"M-Team ID: <code>{html.escape(mt_id)}</code> (HASH: <code>{torrent_hash[:8]}..</code>)\n"
         f"当前分类: {current_category_display}\n\n"
         f"<b>请选择新的分类:</b>",
-        reply_markup=InlineKeyboardMarkup(buttons_list),
+        reply_markup=await _get_setcat_category_buttons(qb_manager),
         parse_mode=ParseMode.HTML
     )
     return SELECTING_SETCAT_CATEGORY
@@ -1022,6 +1690,11 @@ async def handle_setcat_category_selection(update: Update, context: ContextTypes
     chosen_option = chosen_option_full[len(MOD_CAT_PREFIX):]
 
     user_data = context.user_data
+    mt_ids = user_data.pop('setcat_mt_ids', None)
+    if mt_ids:
+        await bulk_set_category(query.message, context, mt_ids, "" if chosen_option == "_remove_" else chosen_option)
+        return CHOOSING_ACTION
+
     torrent_hash = user_data.pop('setcat_torrent_hash', None)
     mt_id_display = user_data.pop('setcat_mteam_id_display', '未知ID')
 
@@ -1060,14 +1733,26 @@ async def handle_setcat_category_selection(update: Update, context: ContextTypes
 async def received_del_mt_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if not update.message or not update.message.text: return ASK_DEL_MT_ID
 
-    mt_id = update.message.text.strip()
-    if not mt_id.isdigit():
+    mt_ids, invalid = parse_mteam_ids(update.message.text)
+    error_text = _validate_mteam_ids(mt_ids, invalid, context.bot_data['config'])
+    if error_text:
         await update.message.reply_text(
-            "⚠️ M-Team ID 应该是纯数字，请检查后重新输入，或使用 /cancel 取消。",
+            f"{error_text}\n请检查后重新输入，或使用 /cancel 取消。",
             reply_markup=await get_main_keyboard()
         )
         return ASK_DEL_MT_ID
 
+    if len(mt_ids) > 1:
+        context.user_data['del_mt_ids'] = mt_ids
+        logger.info(f"用户 {update.effective_user.id} 输入了 {len(mt_ids)} 个M-Team ID 用于批量删除任务。")
+        await update.message.reply_html(
+            f"确认批量删除 {len(mt_ids)} 个 M-Team ID 对应的任务: <code>{html.escape(' '.join(mt_ids[:20]))}</code>"
+            f"{' ...' if len(mt_ids) > 20 else ''}\n\n<b>请选择删除选项 (此操作不可逆):</b>",
+            reply_markup=InlineKeyboardMarkup(DELETE_OPTION_BUTTONS)
+        )
+        return CONFIRM_DEL_OPTIONS
+
+    mt_id = mt_ids[0]
     logger.info(f"用户 {update.effective_user.id} 输入了M-Team ID: {mt_id} 用于删除任务。")
     qb_manager: QBittorrentManager = context.bot_data['qb_manager']
 
@@ -1085,28 +1770,19 @@ async def received_del_mt_id(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return CHOOSING_ACTION
 
     torrent_name_display = "未知任务"
-    if qb_manager.connect_qbit():
-        try:
-            info_list = qb_manager.client.torrents_info(torrent_hashes=torrent_hash)
-            if info_list:
-                torrent_name_display = html.escape(
-                    info_list[0].name[:60] + ('...' if len(info_list[0].name) > 60 else ''))
-        finally:
-            qb_manager.disconnect_qbit()
+    name_and_category = await qb_manager.get_torrent_name_and_category(torrent_hash)
+    if name_and_category:
+        torrent_name = name_and_category[0]
+        torrent_name_display = html.escape(torrent_name[:60] + ('...' if len(torrent_name) > 60 else ''))
 
     context.user_data['del_torrent_hash'] = torrent_hash
     context.user_data['del_torrent_name_display'] = torrent_name_display
 
-    buttons = [
-        [InlineKeyboardButton("🗑️ 删除任务和文件", callback_data=f"{DEL_OPT_PREFIX}delete_files")],
-        [InlineKeyboardButton("➖ 仅删除任务 (保留文件)", callback_data=f"{DEL_OPT_PREFIX}delete_task_only")],
-        [InlineKeyboardButton("↩️ 取消操作", callback_data=f"{DEL_OPT_PREFIX}cancel_delete")]
-    ]
     await processing_msg.edit_text(
         f"确认删除任务: 《<b>{torrent_name_display}</b>》\n"
         f"M-Team ID: <code>{html.escape(mt_id)}</code> (HASH: <code>{torrent_hash[:8]}..</code>)\n\n"
         f"<b>请选择删除选项 (此操作不可逆):</b>",
-        reply_markup=InlineKeyboardMarkup(buttons),
+        reply_markup=InlineKeyboardMarkup(DELETE_OPTION_BUTTONS),
         parse_mode=ParseMode.HTML
     )
     return CONFIRM_DEL_OPTIONS
@@ -1127,10 +1803,16 @@ async def received_del_option(update: Update, context: ContextTypes.DEFAULT_TYPE
             pass
         context.user_data.pop('del_torrent_hash', None)
         context.user_data.pop('del_torrent_name_display', None)
+        context.user_data.pop('del_mt_ids', None)
         return await cancel_conversation(update, context)
 
     option_part = chosen_option_full[len(DEL_OPT_PREFIX):]
 
+    mt_ids = context.user_data.pop('del_mt_ids', None)
+    if mt_ids and option_part in ("delete_files", "delete_task_only"):
+        await bulk_delete(query.message, context, mt_ids, option_part == "delete_files")
+        return CHOOSING_ACTION
+
     torrent_hash = context.user_data.pop('del_torrent_hash', None)
     torrent_name_display = context.user_data.pop('del_torrent_name_display', '该任务')
 
@@ -1237,11 +1919,8 @@ async def display_search_results_page(
             f"🔍 正在为 “{html.escape(keywords)}” 搜索 M-Team 种子 (第 {page_num + 1} 页)..."
         )
 
-    results_data = await asyncio.to_thread(
-        mteam_manager.search_torrents_by_keyword,
-        keyword=keywords,
-        page_number=page_num + 1
-    )
+    search_mode = context.user_data.get('search_mode', "normal")
+    results_data = await mteam_manager.search(keywords, search_mode=search_mode, page_number=page_num + 1)
 
     if processing_msg_obj:
         try:
@@ -1298,6 +1977,8 @@ async def display_search_results_page(
         pagination_buttons_row.append(
             InlineKeyboardButton("➡️ 下一页", callback_data=f"{SEARCH_PAGE_PREFIX}{page_num + 1}")
         )
+        if config.MT_SEARCH_PREFETCH:
+            mteam_manager.prefetch_search(keywords, search_mode=search_mode, page_number=page_num + 2)
     if pagination_buttons_row:
         keyboard_rows.append(pagination_buttons_row)
 
@@ -1376,6 +2057,8 @@ async def handle_search_result_selection(update: Update, context: ContextTypes.D
         return SHOWING_SEARCH_RESULTS
 
     context.user_data['add_mt_id'] = mt_id
+    mteam_manager: MTeamManager = context.bot_data['mteam_manager']
+    mteam_manager.warm_torrent(mt_id)
 
     selected_torrent_name = f"M-Team ID {html.escape(mt_id)}"
     last_search_results = context.user_data.get('last_search_results', {}).get('torrents', [])
@@ -1447,8 +2130,8 @@ async def cancel_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     logger.info(f"用户 {user.id if user else 'Unknown'} (Chat {chat_id}) 通过 {action_source} 取消/结束了当前操作。")
 
-    keys_to_clear = ['add_mt_id', 'setcat_torrent_hash', 'setcat_mteam_id_display',
-                     'del_torrent_hash', 'del_torrent_name_display',
+    keys_to_clear = ['add_mt_id', 'add_mt_ids', 'setcat_torrent_hash', 'setcat_mteam_id_display', 'setcat_mt_ids',
+                     'del_torrent_hash', 'del_torrent_name_display', 'del_mt_ids',
                      'search_keywords', 'last_search_results']
     for key in keys_to_clear:
         context.user_data.pop(key, None)
@@ -1484,8 +2167,8 @@ async def cancel_operation(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
     logger.info(f"用户 {user.id if user else 'Unknown'} (Chat {chat_id}) 通过 {action_source} 取消/结束了当前操作。")
 
-    keys_to_clear = ['add_mt_id', 'setcat_torrent_hash', 'setcat_mteam_id_display',
-                     'del_torrent_hash', 'del_torrent_name_display',
+    keys_to_clear = ['add_mt_id', 'add_mt_ids', 'setcat_torrent_hash', 'setcat_mteam_id_display', 'setcat_mt_ids',
+                     'del_torrent_hash', 'del_torrent_name_display', 'del_mt_ids',
                      'search_keywords', 'last_search_results']
     for key in keys_to_clear:
         context.user_data.pop(key, None)
@@ -1546,14 +2229,27 @@ async def direct_add_torrent_command(update: Update, context: ContextTypes.DEFAU
         return
 
     if not context.args or len(context.args) == 0:
-        await update.message.reply_html("请提供 M-Team 种子 ID。\n用法示例: <code>/add 966696</code>")
+        await update.message.reply_html("请提供 M-Team 种子 ID。\n用法示例: <code>/add 966696</code>，"
+                                        "批量添加: <code>/add 966696 966697 966698</code>")
         return
 
-    mt_id = context.args[0].strip()
-    if not mt_id.isdigit():
-        await update.message.reply_html(f"⚠️ M-Team ID “{html.escape(mt_id)}” 无效，ID应为纯数字。")
+    mt_ids, invalid = parse_mteam_ids(" ".join(context.args))
+    error_text = _validate_mteam_ids(mt_ids, invalid, config)
+    if error_text:
+        await update.message.reply_html(error_text)
         return
 
+    if len(mt_ids) > 1:
+        logger.info(f"🚀 用户 {user.id if user else 'Unknown'} 通过 /add 命令批量添加 {len(mt_ids)} 个 M-Team ID")
+        progress_msg = await update.message.reply_html(f"🔄 正在批量添加 {len(mt_ids)} 个 M-Team ID...")
+        category = config.QBIT_DEFAULT_CATEGORY_FOR_MT
+        await run_bulk_operation(progress_msg, f"批量添加到分类 “{html.escape(category)}”", mt_ids,
+                                 lambda i: qb_manager.add_mteam_torrent(i, category), config)
+        await update.message.reply_text("请选择下一步操作：", reply_markup=await get_main_keyboard())
+        return
+
+    mt_id = mt_ids[0]
+
     logger.info(f"🚀 用户 {user.id if user else 'Unknown'} 通过 /add 命令直接添加 M-Team ID: {mt_id}")
 
     processing_msg = await update.message.reply_html(
@@ -1580,6 +2276,63 @@ async def direct_add_torrent_command(update: Update, context: ContextTypes.DEFAU
     await update.message.reply_text("请选择下一步操作：", reply_markup=await get_main_keyboard())
 
 
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    并发处理不同聊天的更新，同一聊天内的更新仍按到达顺序逐个处理，保证会话状态不会错乱。
+    同时记录每个更新的处理耗时：超过 TG_SLOW_UPDATE_SECONDS 秒时告警，每 TG_LATENCY_REPORT_EVERY 个更新输出一次 P50/P95/最大耗时。
+    """
+
+    def __init__(self, config: Config):
+        super().__init__(max_concurrent_updates=config.TG_CONCURRENT_UPDATES)
+        self.config = config
+        self.chat_locks: Dict[int, asyncio.Lock] = {}
+        self.chat_pending: Dict[int, int] = {}
+        self.latencies: "deque[float]" = deque(maxlen=config.TG_LATENCY_REPORT_EVERY)
+        self.handled = 0
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await self._timed(update, coroutine)
+            return
+        lock = self.chat_locks.setdefault(chat.id, asyncio.Lock())
+        self.chat_pending[chat.id] = self.chat_pending.get(chat.id, 0) + 1
+        try:
+            async with lock:
+                await self._timed(update, coroutine)
+        finally:
+            # 该聊天没有排队中的更新时释放锁，避免聊天数量增长后锁字典无限变大
+            self.chat_pending[chat.id] -= 1
+            if not self.chat_pending[chat.id]:
+                del self.chat_pending[chat.id]
+                del self.chat_locks[chat.id]
+
+    async def _timed(self, update: object, coroutine) -> None:
+        started = time.perf_counter()
+        try:
+            await coroutine
+        finally:
+            elapsed = time.perf_counter() - started
+            self.latencies.append(elapsed)
+            self.handled += 1
+            if elapsed >= self.config.TG_SLOW_UPDATE_SECONDS:
+                chat = update.effective_chat if isinstance(update, Update) else None
+                logger.warning(f"🐢 更新 {getattr(update, 'update_id', '?')} (聊天 {chat.id if chat else '-'}) "
+                               f"处理耗时 {elapsed:.2f} 秒")
+            if self.handled % self.config.TG_LATENCY_REPORT_EVERY == 0:
+                ordered = sorted(self.latencies)
+                p50 = ordered[len(ordered) // 2]
+                p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+                logger.info(f"⏱️ 最近 {len(ordered)} 个更新的处理耗时: P50 {p50 * 1000:.0f} ms, "
+                            f"P95 {p95 * 1000:.0f} ms, 最大 {ordered[-1] * 1000:.0f} ms")
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
 async def post_init_hook(application: Application) -> None:
     commands = [
         BotCommand("start", "🚀 开始"),
@@ -1596,6 +2349,13 @@ async def post_init_hook(application: Application) -> None:
         logger.error(f"设置机器人命令失败: {e}")
 
 
+async def post_shutdown_hook(application: Application) -> None:
+    qb_manager: QBittorrentManager = application.bot_data['qb_manager']
+    qb_manager.pool.close()
+    qb_manager.executor.shutdown(wait=False, cancel_futures=True)
+    qb_manager.mteam_manager.executor.shutdown(wait=False, cancel_futures=True)
+
+
 def main_bot() -> None:
     try:
         config = Config()
@@ -1611,6 +2371,8 @@ def main_bot() -> None:
 
     application_builder = Application.builder().token(config.TG_BOT_TOKEN_MT)
     application_builder.post_init(post_init_hook)
+    application_builder.post_shutdown(post_shutdown_hook)
+    application_builder.concurrent_updates(ChatOrderedUpdateProcessor(config))
     app = application_builder.build()
 
     app.bot_data.update({
@@ -1677,8 +2439,21 @@ def main_bot() -> None:
 
     app.add_handler(MessageHandler(filters.COMMAND, unknown_command))
 
-    logger.info("🤖 Telegram 机器人正在启动轮询...")
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    if config.TG_WEBHOOK_URL:
+        webhook_url = f"{config.TG_WEBHOOK_URL}/{config.TG_WEBHOOK_PATH}"
+        logger.info(f"🤖 Telegram 机器人以 Webhook 模式启动: 本地监听 {config.TG_WEBHOOK_LISTEN}:{config.TG_WEBHOOK_PORT}"
+                    f"/{config.TG_WEBHOOK_PATH}，对外地址 {webhook_url}")
+        app.run_webhook(
+            listen=config.TG_WEBHOOK_LISTEN,
+            port=config.TG_WEBHOOK_PORT,
+            url_path=config.TG_WEBHOOK_PATH,
+            webhook_url=webhook_url,
+            secret_token=config.TG_WEBHOOK_SECRET_TOKEN,
+            allowed_updates=BOT_ALLOWED_UPDATES,
+        )
+    else:
+        logger.info("🤖 Telegram 机器人正在启动轮询...")
+        app.run_polling(allowed_updates=BOT_ALLOWED_UPDATES)
     logger.info("👋 Telegram 机器人已停止。")
 
 